@@ -7,6 +7,11 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.units import inch, cm
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 import os
+import sys
+
+# The timing profile (set ATLAS_PROFILE=<path>) lives in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from run_profile import enable_profile, stage, add_output, write_profile
 
 def parse_score(score_text):
     """Convert score text to numeric value - extract first digit (1-5)"""
@@ -604,7 +609,9 @@ def create_pdf_summary(all_evaluations, output_filename):
             story.append(PageBreak())
     
     # Build PDF
-    doc.build(story)
+    with stage('pdf_build', flowables=len(story)):
+        doc.build(story)
+        add_output(output_filename)
     print(f"Modern PDF created: {output_filename}")
 
 def main():
@@ -617,7 +624,8 @@ def main():
         if os.path.exists(filename):
             print(f"Processing {filename}...")
             try:
-                evaluation = analyze_excel_file(filename)
+                with stage('excel', file=filename):
+                    evaluation = analyze_excel_file(filename)
                 all_evaluations.append(evaluation)
                 print(f"  Found {len(evaluation)} projects in {filename}")
             except Exception as e:
@@ -627,10 +635,14 @@ def main():
     
     if all_evaluations:
         print(f"Creating modern PDF summary for {len(all_evaluations)} evaluation files (6 evaluators)...")
-        create_pdf_summary(all_evaluations, "projectevaluatie_overview.pdf")
+        with stage('pdf'):
+            create_pdf_summary(all_evaluations, "projectevaluatie_overview.pdf")
         print("Modern summary completed!")
     else:
         print("No evaluation files found!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    enable_profile()
+    with stage('run'):
+        main()
+    write_profile() 
\ No newline at end of file
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the thematic map pipeline on synthetic data
+
+Every case generates (once) a data set of N wijken and M indicators with
+synthetic_data.py and runs the atlas of create_thematic_maps.py on it, with an
+empty cache, in this process. The stages are timed with run_profile.py and
+grouped into:
+
+- load: reading the workbook and the GeoPackage, cold (empty cache) and warm
+- join: simplifying the geometry, joining the indicators and the gemeenten
+- classification: the class breaks of all M indicators
+- render: the map template with its label layout, the overview map and
+  drawing every map with its labels
+- encode: writing the PNG files
+
+Only the first --render-maps indicators are drawn, so 500 indicators do not
+take 1000 PNG files; load, join and classification always cover all of them.
+With --repeat every case runs several times and keeps the fastest time of
+every group.
+
+Results are written to benchmarks/results/<commit>_<time>.json with the commit,
+the library versions and the machine. Compare two runs with
+
+    python benchmarks/run_benchmarks.py --compare results/old.json results/new.json
+
+which prints the ratio per case and group and exits with status 1 when a
+group got slower than the threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+# The atlas draws without a display
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(benchmark_dir)
+sys.path.insert(0, root_dir)
+
+import run_profile
+from synthetic_data import generate_dataset
+
+# (wijken, indicators) of the default cases, from the Waterwegregio to a national buurt layer
+DEFAULT_CASES = [(30, 10), (300, 50), (3000, 100), (15000, 500)]
+
+# Small cases for a quick check
+QUICK_CASES = [(30, 10), (300, 10)]
+
+# Benchmark groups and the profile stages they add up (stages nested in these are left out)
+STAGE_GROUPS = {
+    'load': ['excel', 'gpkg'],
+    'join': ['simplify', 'join', 'gemeenten'],
+    'classification': ['classification'],
+    'render': ['template', 'overview', 'draw', 'labels', 'crop'],
+    'encode': ['encode'],
+}
+
+# Generated data sets and results, both ignored by git
+data_root = os.path.join(benchmark_dir, "data")
+results_dir = os.path.join(benchmark_dir, "results")
+
+# Default ratio above which a group counts as slower in --compare
+REGRESSION_THRESHOLD = 1.10
+
+def git_commit():
+    """Short hash of the checked out commit, with '-dirty' for uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+def environment():
+    """Versions and machine of a run, stored with the results"""
+    import geopandas
+    import matplotlib
+    import numpy
+    import pandas
+    import shapely
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'libraries': {module.__name__: module.__version__
+                      for module in [numpy, pandas, shapely, geopandas, matplotlib]},
+    }
+
+def group_times(report):
+    """Wall time per benchmark group from a run_profile report"""
+    return {group: round(sum(report['stages'].get(name, {}).get('wall_time', 0) for name in names), 6)
+            for group, names in STAGE_GROUPS.items()}
+
+def run_case(units, indicators, render_maps, engine, classification, jobs, seed, verbose):
+    """
+    Run the atlas on one synthetic data set with an empty cache
+
+    Returns the result of the case: the group times, the warm load time, the
+    time per stage and the peak memory.
+    """
+    data_dir = os.path.join(data_root, f"u{units}_i{indicators}_s{seed}")
+    started = time.perf_counter()
+    paths = generate_dataset(data_dir, units, indicators, seed)
+    generate_time = time.perf_counter() - started
+
+    # Outputs and cache of the run go to a fresh directory next to the data
+    work_dir = os.path.join(data_dir, "run")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            import create_thematic_maps as atlas_module
+
+            # The atlas reads its inputs and writes its outputs relative to the work directory
+            atlas_module.script_dir = work_dir
+            atlas_module.gpkg_path = paths['gpkg']
+            level_files = dict(atlas_module.LEVEL_FILES['wijk'], excel_file=paths['excel'], end_row=None)
+            atlas_module.LEVEL_FILES = dict(atlas_module.LEVEL_FILES, wijk=level_files)
+
+            run_profile.enable_profile(os.path.join(work_dir, "profile"))
+            atlas = atlas_module.load_atlas_data(level='wijk')
+            if atlas is None:
+                raise RuntimeError(f"Could not load the synthetic data in {data_dir}")
+            atlas['data_columns'] = atlas['data_columns'][:render_maps]
+            atlas_module.render_atlases({atlas['region']['name']: atlas}, jobs=jobs, force=True, engine=engine,
+                                        classification=classification)
+            report = run_profile.build_report()
+
+            # The same load again, now from the Parquet caches
+            run_profile.enable_profile(os.path.join(work_dir, "profile_warm"))
+            atlas_module.load_atlas_data(level='wijk')
+            warm_report = run_profile.build_report()
+    finally:
+        os.chdir(previous_dir)
+        run_profile.enable_profile(None)
+
+    return {
+        'units': units,
+        'indicators': indicators,
+        'render_maps': min(render_maps, indicators),
+        'engine': engine,
+        'classification': classification,
+        'jobs': jobs,
+        'seed': seed,
+        'generate_time': round(generate_time, 6),
+        'groups': group_times(report),
+        'load_warm': group_times(warm_report)['load'],
+        'total': report['wall_time'],
+        'peak_rss': report['peak_rss'],
+        'stages': report['stages'],
+    }
+
+def case_key(case):
+    """Identity of a case, to match it between two result files"""
+    return (case['units'], case['indicators'], case['render_maps'], case['engine'], case['classification'],
+            case['jobs'])
+
+def print_case(case):
+    """One line per case with its group times"""
+    groups = case['groups']
+    peak = f"{case['peak_rss'] / 2**20:.0f}" if case['peak_rss'] is not None else '-'
+    print(f"{case['units']:>7}{case['indicators']:>6}{case['render_maps']:>6}"
+          + ''.join(f"{groups[group]:>15.3f}" for group in STAGE_GROUPS)
+          + f"{case['load_warm']:>11.3f}{case['total']:>9.2f}{peak:>9}")
+
+def print_header():
+    """Header of the case lines"""
+    print(f"{'units':>7}{'ind':>6}{'maps':>6}" + ''.join(f"{group:>15}" for group in STAGE_GROUPS)
+          + f"{'load_warm':>11}{'total':>9}{'peak MB':>9}")
+
+def best_of(runs):
+    """Result of a case repeated several times, with the fastest time of every group"""
+    case = dict(runs[0], repeat=len(runs))
+    case['groups'] = {group: min(run['groups'][group] for run in runs) for group in STAGE_GROUPS}
+    for key in ['load_warm', 'total']:
+        case[key] = min(run[key] for run in runs)
+    return case
+
+def run_benchmarks(cases, render_maps, engine, classification, jobs, seed, verbose, repeat=1):
+    """Run all cases `repeat` times and write the results file, returns its path"""
+    results = {
+        'commit': git_commit(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'cases': [],
+    }
+    print(f"Benchmarks of commit {results['commit']}, times in seconds:")
+    print_header()
+    for units, indicators in cases:
+        case = best_of([run_case(units, indicators, render_maps, engine, classification, jobs, seed, verbose)
+                        for _ in range(repeat)])
+        results['cases'].append(case)
+        print_case(case)
+
+    os.makedirs(results_dir, exist_ok=True)
+    results_path = os.path.join(results_dir, f"{results['commit']}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+        f.write('\n')
+    print(f"Results written to {results_path}")
+    return results_path
+
+def compare_results(old_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the time ratio new/old of every group of the cases in both files
+
+    Returns the list of (case key, group, ratio) that are slower than `threshold`.
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    old_cases = {case_key(case): case for case in old['cases']}
+
+    print(f"Ratio new/old ({new['commit']} / {old['commit']}), above {threshold:.2f} is marked as slower:")
+    print(f"{'units':>7}{'ind':>6}{'maps':>6}" + ''.join(f"{group:>15}" for group in STAGE_GROUPS)
+          + f"{'load_warm':>11}{'total':>9}")
+    regressions = []
+    for case in new['cases']:
+        old_case = old_cases.get(case_key(case))
+        if old_case is None:
+            continue
+        times = [(group, old_case['groups'][group], case['groups'][group]) for group in STAGE_GROUPS]
+        times += [('load_warm', old_case['load_warm'], case['load_warm']), ('total', old_case['total'], case['total'])]
+        cells = []
+        for group, old_time, new_time in times:
+            if old_time <= 0:
+                cells.append('-')
+                continue
+            ratio = new_time / old_time
+            # Differences of a few milliseconds are noise
+            slower = ratio > threshold and new_time - old_time > 0.01
+            if slower:
+                regressions.append((case_key(case), group, ratio))
+            cells.append(f"{ratio:.2f}{'!' if slower else ''}")
+        widths = [15] * len(STAGE_GROUPS) + [11, 9]
+        print(f"{case['units']:>7}{case['indicators']:>6}{case['render_maps']:>6}"
+              + ''.join(f"{cell:>{width}}" for cell, width in zip(cells, widths)))
+
+    if regressions:
+        print(f"{len(regressions)} group(s) slower than {threshold:.2f}x (marked with !)")
+    else:
+        print("No regressions")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the thematic map pipeline on synthetic data.")
+    parser.add_argument('--units', type=int, nargs='+',
+                        help="numbers of wijken; with --indicators every combination is a case")
+    parser.add_argument('--indicators', type=int, nargs='+', help="numbers of indicators")
+    parser.add_argument('--quick', action='store_true', help=f"only the small cases {QUICK_CASES}")
+    parser.add_argument('--render-maps', type=int, default=10,
+                        help="number of indicators drawn per case (default 10)")
+    parser.add_argument('--engine', choices=['vector', 'raster'], default='vector')
+    parser.add_argument('--classification', default='quantile',
+                        help="classification scheme (default quantile, 'continuous' skips it)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="render worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="run every case this many times and keep the fastest time per group")
+    parser.add_argument('--verbose', action='store_true', help="show the output of the atlas")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f"ratio that counts as a regression in --compare (default {REGRESSION_THRESHOLD})")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare_results(*args.compare, threshold=args.threshold) else 0)
+
+    if args.units or args.indicators:
+        cases = [(units, indicators) for units in args.units or [30] for indicators in args.indicators or [10]]
+    else:
+        cases = QUICK_CASES if args.quick else DEFAULT_CASES
+    run_benchmarks(cases, args.render_maps, args.engine, args.classification, args.jobs, args.seed,
+                   args.verbose, args.repeat)
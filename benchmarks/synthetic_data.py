@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Synthetic wijken and indicators for the benchmarks
+
+The real GeoPackage is not in the repository and the workbook only has the 31
+wijken of the Waterwegregio, so the benchmarks run on generated data of any
+size instead:
+
+- a GeoPackage with a 'wijken_v0' layer of N Voronoi cells in RD New
+  (EPSG:28992). The cells form a coverage like the CBS wijken: they do not
+  overlap and neighbours share their edges. Every wijk has a wk_code, wk_naam,
+  gm_code and gm_naam; about ten neighbouring wijken form a gemeente.
+- a workbook in the layout of waterweg_wijken.xlsx (see excel_ingest.py): the
+  variable names in row 1, titles in row 2, sources in row 3, an empty link
+  row, the data from row 5, the code in the 'gwb_code_10' column and M
+  indicators from column G. The indicators mix counts, percentages, signed
+  changes, heavy-tailed values and missing cells.
+
+The data only depends on N, M and the seed, so every commit is measured on the
+same data. Run it directly to write a data set:
+
+    python benchmarks/synthetic_data.py benchmarks/data/test --units 300 --indicators 20
+"""
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+# Name of the generated files, the same as the real inputs
+GPKG_FILE = "WijkBuurtkaart_2025_v0.gpkg"
+EXCEL_FILE = "waterweg_wijken.xlsx"
+
+# Lower left corner of the generated region in RD New, near Rotterdam
+ORIGIN = (75000.0, 425000.0)
+
+# Mean area of a generated wijk in square metres
+UNIT_AREA = 1.5e6
+
+# Mean number of wijken per gemeente
+UNITS_PER_GEMEENTE = 10
+
+# Fraction of indicator cells left empty
+MISSING_FRACTION = 0.05
+
+def generate_units(units, seed=0):
+    """
+    Voronoi cells of `units` random points as a GeoDataFrame in EPSG:28992
+
+    The cells are clipped to a square of units * UNIT_AREA and grouped into
+    gemeenten around random seed points.
+    """
+    rng = np.random.default_rng(seed)
+    side = float(np.sqrt(units * UNIT_AREA))
+    extent = shapely.box(ORIGIN[0], ORIGIN[1], ORIGIN[0] + side, ORIGIN[1] + side)
+    points = shapely.points(rng.uniform(ORIGIN, (ORIGIN[0] + side, ORIGIN[1] + side), size=(units, 2)))
+
+    # One cell per point, in the order of the points
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent,
+                                                       ordered=True))
+    cells = shapely.intersection(cells, extent)
+
+    # Gemeenten: the wijken nearest to the same gemeente seed point
+    gemeente_count = max(1, units // UNITS_PER_GEMEENTE)
+    gemeente_points = points[rng.choice(units, gemeente_count, replace=False)]
+    _, gemeenten = shapely.STRtree(gemeente_points).query_nearest(points, all_matches=False)
+
+    return gpd.GeoDataFrame({
+        'wk_code': [f"WK{number:06d}" for number in range(units)],
+        'wk_naam': [f"Wijk {number}" for number in range(units)],
+        'gm_code': [f"GM{gemeente:04d}" for gemeente in gemeenten],
+        'gm_naam': [f"Gemeente {gemeente}" for gemeente in gemeenten],
+    }, geometry=cells, crs=28992)
+
+def generate_indicators(units, indicators, seed=0):
+    """
+    Indicator values as a (units, indicators) float array, NaN = empty cell
+
+    Returns (values, names, titles, sources).
+    """
+    rng = np.random.default_rng(seed + 1)
+    values = np.empty((units, indicators))
+    names, titles = [], []
+    for column in range(indicators):
+        kind = column % 5
+        if kind == 0:
+            values[:, column] = np.round(rng.lognormal(8, 0.6, units))
+            title = f"Aantal inwoners {column}"
+        elif kind == 1:
+            values[:, column] = np.round(rng.beta(2, 3, units) * 100, 1)
+            title = f"Aandeel {column} (%)"
+        elif kind == 2:
+            values[:, column] = np.round(rng.normal(0, 5, units), 2)
+            title = f"Verandering {column}"
+        elif kind == 3:
+            values[:, column] = np.round(rng.pareto(1.5, units) * 100)
+            title = f"Meldingen {column}"
+        else:
+            values[:, column] = np.round(rng.normal(300, 80, units))
+            title = f"Gemiddelde waarde {column}"
+        names.append(f"{column}-indicator")
+        titles.append(title)
+    values[rng.random(values.shape) < MISSING_FRACTION] = np.nan
+    sources = [f"Synthetisch ({seed})"] * indicators
+    return values, names, titles, sources
+
+def write_workbook(path, units_gdf, values, names, titles, sources):
+    """Write the wijken and their indicators in the layout of waterweg_wijken.xlsx"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['gwb_code_10', 'gwb_code_8', 'wk_naam', 'gm_naam', 'recs', 'gwb_code'] + names)
+    sheet.append(['titel', None, None, None, None, None] + titles)
+    sheet.append(['bron', None, None, None, None, None] + sources)
+    sheet.append(['link'])
+    for row, unit in enumerate(units_gdf.itertuples(index=False)):
+        cells = [None if np.isnan(value) else float(value) for value in values[row]]
+        sheet.append([unit.wk_code, unit.wk_code[2:], unit.wk_naam, unit.gm_naam, 'Wijk', unit.wk_code] + cells)
+
+    tmp_path = f"{path}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+
+def generate_dataset(directory, units, indicators, seed=0):
+    """
+    Write the GeoPackage and the workbook of a data set to `directory`
+
+    Existing files are kept, so a data set is generated once. Returns a
+    dictionary with the 'gpkg' and 'excel' paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {'gpkg': os.path.join(directory, GPKG_FILE), 'excel': os.path.join(directory, EXCEL_FILE)}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    units_gdf = generate_units(units, seed)
+    tmp_path = f"{paths['gpkg']}.tmp.gpkg"
+    units_gdf.to_file(tmp_path, layer='wijken_v0', driver='GPKG')
+    os.replace(tmp_path, paths['gpkg'])
+    write_workbook(paths['excel'], units_gdf, *generate_indicators(units, indicators, seed))
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic GeoPackage and workbook for the benchmarks.")
+    parser.add_argument('directory', help="output directory")
+    parser.add_argument('--units', type=int, default=300, help="number of wijken")
+    parser.add_argument('--indicators', type=int, default=20, help="number of indicators")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator")
+    args = parser.parse_args()
+    paths = generate_dataset(args.directory, args.units, args.indicators, args.seed)
+    print(f"Written {paths['gpkg']} and {paths['excel']}")
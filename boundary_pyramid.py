@@ -0,0 +1,135 @@
+"""
+Boundary pyramid of the map units: units -> gemeenten -> region
+
+The wijken (or buurten) of a region form a coverage: they do not overlap and
+neighbours share their edges vertex for vertex. build_boundary_pyramid()
+dissolves them once, level by level, with a coverage union, which only drops
+the shared edges instead of running a full overlay:
+
+- gemeenten: the union of the units of every gemeente
+- region: the union of the gemeenten
+- inner_edges: the edges between units as linework, every edge once
+- gemeente_edges: the edges between gemeenten as linework
+
+The edges are found by matching the ring segments of neighbouring polygons, so
+they need no line overlay either. Geometries that do not form a valid coverage
+are dissolved with a full union; their edges then only hold the segments that
+neighbours share exactly.
+
+boundary_pyramid() caches the pyramid as GeoParquet in the geometry cache, keyed
+by the geometry and the gemeente of every unit, so the thematic maps and the
+boundary export do no union at all on a warm start. Caching needs pyarrow.
+"""
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from build_manifest import hash_inputs
+from geometry_loader import parquet_available
+
+# Increase when the pyramid itself changes
+PYRAMID_VERSION = 1
+
+def is_valid_coverage(geometries):
+    """Check whether polygons form a coverage that coverage_union_all can dissolve"""
+    return hasattr(shapely, 'coverage_union_all') and bool(shapely.coverage_is_valid(geometries))
+
+def dissolve_coverage(geometries, is_coverage=True):
+    """Union of polygons that form a coverage, without the cost of a full overlay when possible"""
+    if is_coverage and hasattr(shapely, 'coverage_union_all'):
+        return shapely.coverage_union_all(geometries)
+    return shapely.union_all(geometries)
+
+def shared_edges(geometries):
+    """Segments that two polygons of a coverage have in common, merged into lines"""
+    rings = shapely.get_rings(shapely.get_parts(np.asarray(geometries)))
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring_index[1:] == ring_index[:-1]
+    starts, ends = coords[:-1][same_ring], coords[1:][same_ring]
+
+    # The same key for both directions of a segment, without zero-length segments
+    swap = (starts[:, 0] > ends[:, 0]) | ((starts[:, 0] == ends[:, 0]) & (starts[:, 1] > ends[:, 1]))
+    first = np.where(swap[:, None], ends, starts)
+    second = np.where(swap[:, None], starts, ends)
+    segments = np.column_stack([first, second])
+    segments = segments[np.any(first != second, axis=1)]
+
+    unique, counts = np.unique(segments, axis=0, return_counts=True)
+    shared = unique[counts > 1]
+    if len(shared) == 0:
+        return shapely.MultiLineString()
+    return shapely.line_merge(shapely.multilinestrings(shapely.linestrings(shared.reshape(-1, 2, 2))))
+
+def build_boundary_pyramid(geometries, groups=None):
+    """
+    Dissolve a coverage of polygons into gemeenten and the region
+
+    `groups` holds the gemeente key of every polygon (None = one group); keys
+    are compared as strings. Returns a dictionary with 'gemeente_keys' (sorted
+    strings), 'gemeenten' (array of polygons in key order), 'region',
+    'inner_edges' and 'gemeente_edges'.
+    """
+    geometries = np.asarray(geometries)
+    is_coverage = is_valid_coverage(geometries)
+    keys = np.full(len(geometries), '') if groups is None else np.array([str(group) for group in groups])
+    positions = pd.Series(np.arange(len(geometries))).groupby(keys, sort=True).indices
+
+    gemeenten = np.empty(len(positions), dtype=object)
+    gemeenten[:] = [dissolve_coverage(geometries[rows], is_coverage) for rows in positions.values()]
+    return {
+        'gemeente_keys': list(positions),
+        'gemeenten': gemeenten,
+        'region': dissolve_coverage(gemeenten, is_coverage),
+        'inner_edges': shared_edges(geometries),
+        'gemeente_edges': shared_edges(gemeenten),
+    }
+
+def boundary_pyramid(geometries, groups=None, cache_dir=None):
+    """
+    Boundary pyramid of build_boundary_pyramid(), cached as GeoParquet
+
+    With a `cache_dir` the pyramid is read from, or written to, a file keyed by
+    the geometries and their gemeente keys.
+    """
+    geometries = np.asarray(geometries)
+    cache_path = None
+    if cache_dir is not None and parquet_available():
+        cache_key = hash_inputs(PYRAMID_VERSION, b''.join(shapely.to_wkb(geometries)),
+                                None if groups is None else [str(group) for group in groups])
+        cache_path = os.path.join(cache_dir, f"pyramid_{cache_key[:16]}.parquet")
+
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            table = gpd.read_parquet(cache_path)
+            levels = dict(zip(table['level'], table.geometry))
+            gemeente_rows = table[table['level'] == 'gemeente']
+            return {
+                'gemeente_keys': gemeente_rows['key'].tolist(),
+                'gemeenten': gemeente_rows.geometry.to_numpy(),
+                'region': levels['region'],
+                'inner_edges': levels['inner_edges'],
+                'gemeente_edges': levels['gemeente_edges'],
+            }
+        except Exception as e:
+            print(f"Waarschuwing: Kon cache {cache_path} niet lezen: {e}")
+
+    pyramid = build_boundary_pyramid(geometries, groups)
+
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            levels = ['gemeente'] * len(pyramid['gemeenten']) + ['region', 'inner_edges', 'gemeente_edges']
+            keys = pyramid['gemeente_keys'] + [None] * 3
+            table = gpd.GeoDataFrame({'level': levels, 'key': keys},
+                                     geometry=list(pyramid['gemeenten']) + [pyramid['region'], pyramid['inner_edges'],
+                                                                            pyramid['gemeente_edges']])
+            tmp_path = f"{cache_path}.tmp"
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Waarschuwing: Kon cache {cache_path} niet schrijven: {e}")
+
+    return pyramid
@@ -0,0 +1,102 @@
+"""
+Build manifest for incremental atlas builds
+
+The manifest is a JSON file next to the output directories that records, for
+every output file, a hash of the inputs it was made from. Outputs whose input
+hash has not changed since the previous run do not have to be drawn again, and
+outputs that are no longer produced can be cleaned up.
+
+Next to the manifest every run writes a changes file, <manifest>_changes.json,
+with the outputs whose bytes changed and the outputs that were removed in that
+run, so a deploy only has to upload and delete those.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+def hash_inputs(*parts):
+    """Hash strings, bytes and other values into one hex digest"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else repr(part).encode('utf-8')
+        # Prefix every part with its length, so ('ab', 'c') and ('a', 'bc') differ
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """
+    Load the output hashes of the previous run
+
+    Returns a dictionary mapping output paths (relative to the manifest) to input
+    hashes. A missing, unreadable or outdated manifest gives an empty dictionary,
+    so everything is built again.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Waarschuwing: Kon build manifest {manifest_path} niet lezen: {e}")
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return dict(manifest.get('outputs', {}))
+
+def save_manifest(manifest_path, outputs):
+    """Write the output hashes atomically, so an interrupted run leaves the old manifest"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'outputs': dict(sorted(outputs.items())),
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, manifest_path)
+
+def changes_path(manifest_path):
+    """Path of the changes file of a manifest"""
+    return f"{os.path.splitext(manifest_path)[0]}_changes.json"
+
+def save_changes(manifest_path, changed, removed):
+    """Write the outputs changed and removed in this run atomically, next to the manifest"""
+    changes = {
+        'version': MANIFEST_VERSION,
+        'changed': sorted(changed),
+        'removed': sorted(removed),
+    }
+    path = changes_path(manifest_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(changes, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, path)
+    return path
+
+def is_up_to_date(previous_outputs, output_key, input_hash, output_path):
+    """Check whether an output exists and was made from the same inputs"""
+    return previous_outputs.get(output_key) == input_hash and os.path.exists(output_path)
+
+def remove_stale_outputs(base_dir, previous_outputs, current_outputs, keep=()):
+    """
+    Delete outputs of the previous run that are no longer produced
+
+    Only files recorded in the previous manifest are removed; output keys in
+    `keep` (for example maps that failed this run) are left alone. Returns the
+    list of removed output keys.
+    """
+    removed = []
+    for output_key in sorted(set(previous_outputs) - set(current_outputs) - set(keep)):
+        output_path = os.path.join(base_dir, output_key)
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            removed.append(output_key)
+        except OSError as e:
+            print(f"Waarschuwing: Kon verouderd bestand {output_path} niet verwijderen: {e}")
+    return removed
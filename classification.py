@@ -0,0 +1,218 @@
+"""
+Classification of indicator values into colour classes
+
+A continuous colour stretch from the minimum to the maximum lets one outlier
+wijk wash out the whole map. With a classification scheme every wijk gets the
+colour of its class instead:
+
+- quantile: classes with the same number of wijken
+- equal_interval: classes of the same width between the minimum and maximum
+- std_dev: classes of one standard deviation, the middle class centred on the mean
+- head_tail: repeated splits at the mean of the values above the previous
+  mean, for heavy-tailed data
+- jenks: Fisher-Jenks natural breaks, the classes with the smallest sum of
+  squared deviations from their class means
+
+Breaks are returned as class edges [minimum, ..., maximum], so a scheme with k
+classes has k + 1 edges; edges that coincide are merged. A class holds the
+values from its lower edge up to, but not including, its upper edge; the last
+class includes the maximum. class_breaks() computes
+them for all indicators of a table at once and caches them by the hash of the
+data, so the maps and the web exports use the same classes.
+"""
+import json
+import os
+
+import numpy as np
+
+from build_manifest import hash_inputs
+
+# Schemes besides 'continuous', the colour stretch without classes
+SCHEMES = ['quantile', 'equal_interval', 'std_dev', 'head_tail', 'jenks']
+
+# Default number of classes
+CLASS_COUNT = 5
+
+# Increase when the breaks of a scheme change
+CLASSIFICATION_VERSION = 1
+
+# Head/tail breaks stop when the head holds more than this fraction of the values
+HEAD_TAIL_LIMIT = 0.4
+
+def _edges(values, inner):
+    """Class edges from the minimum to the maximum with the inner breaks that lie between them"""
+    vmin, vmax = float(values.min()), float(values.max())
+    inner = [float(value) for value in inner if vmin < value < vmax]
+    return [float(value) for value in np.unique([vmin, *inner, vmax])]
+
+def quantile_breaks(table, k=CLASS_COUNT):
+    """Inner quantile breaks of every column of a 2D array (NaN ignored), shape (k - 1, columns)"""
+    return np.nanquantile(table, np.linspace(0, 1, k + 1)[1:-1], axis=0)
+
+def equal_interval_breaks(table, k=CLASS_COUNT):
+    """Inner breaks of classes of equal width for every column, shape (k - 1, columns)"""
+    vmin, vmax = np.nanmin(table, axis=0), np.nanmax(table, axis=0)
+    steps = np.arange(1, k)[:, None] / k
+    return vmin + steps * (vmax - vmin)
+
+def std_dev_breaks(table, k=CLASS_COUNT):
+    """
+    Inner breaks at whole standard deviations for every column, shape (k - 1, columns)
+
+    With an odd k the middle class runs from half a standard deviation below the
+    mean to half above it; with an even k the mean is a break.
+    """
+    mean, std = np.nanmean(table, axis=0), np.nanstd(table, axis=0)
+    offsets = np.arange(1, k)[:, None] - k / 2
+    return mean + offsets * std
+
+def head_tail_breaks(values, k=CLASS_COUNT, limit=HEAD_TAIL_LIMIT):
+    """Inner head/tail breaks of one array of valid values"""
+    inner = []
+    head = values
+    while len(inner) < k - 1 and len(head) > 1:
+        mean = head.mean()
+        new_head = head[head > mean]
+        if len(new_head) == 0 or len(new_head) / len(head) > limit:
+            break
+        inner.append(mean)
+        head = new_head
+    return inner
+
+def jenks_breaks(values, k=CLASS_COUNT):
+    """
+    Inner Fisher-Jenks breaks of one array of valid values
+
+    The optimal classes are found with dynamic programming over the sorted
+    unique values, weighted by how often they occur. The optimal start of the
+    last class never decreases with the number of values, so every class count
+    is solved by divide and conquer; all positions at one depth of the recursion
+    are evaluated together with numpy. This takes O(k n log n) for n unique
+    values instead of O(k n^2), so tens of thousands of units stay fast.
+    """
+    unique, counts = np.unique(values, return_counts=True)
+    n = len(unique)
+    if n <= k:
+        return list(unique[1:])
+
+    # Prefix sums of the weights, values and squared values for the class costs
+    weight = np.concatenate([[0], np.cumsum(counts)]).astype(float)
+    total = np.concatenate([[0], np.cumsum(unique * counts)])
+    squares = np.concatenate([[0], np.cumsum(unique ** 2 * counts)])
+
+    def cost(start, end):
+        """Sum of squared deviations of the class unique[start:end]"""
+        return (squares[end] - squares[start]) - (total[end] - total[start]) ** 2 / (weight[end] - weight[start])
+
+    # best[i]: smallest cost of the first i unique values in the current number of classes
+    best = np.full(n + 1, np.inf)
+    best[1:] = cost(np.zeros(n, dtype=int), np.arange(1, n + 1))
+    starts = []
+    for classes in range(2, k + 1):
+        new_best = np.full(n + 1, np.inf)
+        start = np.zeros(n + 1, dtype=int)
+        # Segments of end positions [low, high] whose class start lies in [start_low, start_high]
+        low, high = np.array([classes]), np.array([n])
+        start_low, start_high = np.array([classes - 1]), np.array([n - 1])
+        while len(low):
+            middle = (low + high) // 2
+            first = start_low
+            last = np.minimum(start_high, middle - 1)
+            sizes = last - first + 1
+
+            # All candidate starts of all middles at once
+            segment = np.repeat(np.arange(len(middle)), sizes)
+            candidate = first[segment] + np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            candidate_cost = best[candidate] + cost(candidate, middle[segment])
+            order = np.lexsort((candidate_cost, segment))
+            first_of_segment = order[np.r_[0, np.flatnonzero(np.diff(segment[order])) + 1]]
+            optimum = candidate[first_of_segment]
+            new_best[middle] = candidate_cost[first_of_segment]
+            start[middle] = optimum
+
+            # Left halves keep the lower starts, right halves the higher ones
+            left = middle - 1 >= low
+            right = middle + 1 <= high
+            low, high, start_low, start_high = (
+                np.concatenate([low[left], middle[right] + 1]),
+                np.concatenate([middle[left] - 1, high[right]]),
+                np.concatenate([start_low[left], optimum[right]]),
+                np.concatenate([optimum[left], start_high[right]]),
+            )
+        best = new_best
+        starts.append(start)
+
+    # Walk back from the last value to the class starts, the first value of a class is its lower edge
+    inner = []
+    end = n
+    for start in reversed(starts):
+        end = start[end]
+        inner.append(unique[end])
+    return inner[::-1]
+
+def compute_breaks(table, scheme, k=CLASS_COUNT):
+    """
+    Class edges of every column of a 2D float array (NaN = no data)
+
+    Returns a list with the edges per column, None for a column without values.
+    """
+    table = np.asarray(table, dtype=float)
+    valid_columns = ~np.isnan(table).all(axis=0)
+    inner = None
+    if scheme in ('quantile', 'equal_interval', 'std_dev') and valid_columns.any():
+        function = {'quantile': quantile_breaks, 'equal_interval': equal_interval_breaks,
+                    'std_dev': std_dev_breaks}[scheme]
+        inner = np.full((k - 1, table.shape[1]), np.nan)
+        inner[:, valid_columns] = function(table[:, valid_columns], k)
+    elif scheme not in SCHEMES:
+        raise ValueError(f"Onbekende classificatie '{scheme}', kies uit: {', '.join(SCHEMES)}")
+
+    breaks = []
+    for column in range(table.shape[1]):
+        values = table[:, column]
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            breaks.append(None)
+        elif inner is not None:
+            breaks.append(_edges(values, inner[:, column]))
+        elif scheme == 'head_tail':
+            breaks.append(_edges(values, head_tail_breaks(values, k)))
+        else:
+            breaks.append(_edges(values, jenks_breaks(values, k)))
+    return breaks
+
+def class_breaks(indicator_table, scheme, k=CLASS_COUNT, cache_dir=None):
+    """
+    Class edges of every indicator, as a dictionary by column name
+
+    `indicator_table` is the float DataFrame of the indicators. With a
+    `cache_dir` the breaks are cached as JSON, keyed by the hash of the scheme,
+    the number of classes and the data.
+    """
+    columns = [str(column) for column in indicator_table.columns]
+    table = indicator_table.to_numpy(dtype=float)
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_key = hash_inputs(CLASSIFICATION_VERSION, scheme, k, columns, table.tobytes(), table.shape)
+        cache_path = os.path.join(cache_dir, f"breaks_{scheme}_{cache_key[:16]}.json")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Waarschuwing: Kon cache {cache_path} niet lezen: {e}")
+
+    breaks = dict(zip(columns, compute_breaks(table, scheme, k)))
+
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(breaks, f)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Waarschuwing: Kon cache {cache_path} niet schrijven: {e}")
+
+    return breaks
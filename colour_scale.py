@@ -0,0 +1,86 @@
+"""
+Colour scales of the thematic maps
+
+The maps and the web indicator bundle both colour an indicator with the scale
+chosen here, so the web map matches the PNG maps:
+
+- values on both sides of zero get a diverging ramp, centred at zero with the
+  same range on both sides
+- positive values only get a sequential blue ramp from the minimum to the maximum
+- negative values only get a sequential red ramp
+
+With class breaks (classification.py) the ramp is sampled once per class and
+every value gets the colour of its class. On the diverging ramp a class is
+sampled at its midpoint in the zero-centred scale, so negative classes stay
+red and positive classes green; the sequential ramps are spread evenly.
+"""
+import numpy as np
+from matplotlib.colors import BoundaryNorm, LinearSegmentedColormap, ListedColormap, Normalize, TwoSlopeNorm
+
+# Colour stops of the ramps, by colormap name
+COLOUR_RAMPS = {
+    # Diverging colormap for both positive and negative values
+    'custom_diverging': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#ffffbf',
+                         '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850'],
+    # Sequential colormap for positive values only - start with light blue instead of white
+    'custom_sequential': ['#cce7f0', '#a6d8ea', '#7cc7e8', '#52b3d9', '#2e8bc8',
+                          '#1264aa', '#0b4d8c', '#08306b'],
+    # For negative values only
+    'custom_negative': ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a',
+                        '#ef3b2c', '#cb181d', '#a50f15', '#67000d'],
+}
+
+# Number of colours in a ramp
+COLOUR_COUNT = 256
+
+# Opacity of the wijk colours on the maps
+FACE_ALPHA = 0.9
+
+def ramp_name(has_negative, has_positive):
+    """Name of the ramp for the signs of the values"""
+    if has_negative and has_positive:
+        return 'custom_diverging'
+    elif has_positive:
+        return 'custom_sequential'
+    return 'custom_negative'
+
+def get_colormap(name):
+    """Colormap of a ramp in COLOUR_RAMPS"""
+    return LinearSegmentedColormap.from_list(name, COLOUR_RAMPS[name], N=COLOUR_COUNT)
+
+def get_optimized_colormap(has_negative, has_positive):
+    """Create optimized color schemes for different data types"""
+    return get_colormap(ramp_name(has_negative, has_positive))
+
+def get_colour_scale(vmin, vmax, breaks=None):
+    """
+    Colormap and normalization for values from `vmin` to `vmax`
+
+    `breaks` are class edges from the minimum to the maximum; with at least two
+    classes the colours are classed, otherwise they stretch continuously.
+    """
+    # Determine if we have negative values and choose appropriate colormap
+    has_negative = vmin < 0
+    has_positive = vmax > 0
+    cmap = get_optimized_colormap(has_negative, has_positive)
+
+    if has_negative and has_positive:
+        # Create a normalization centered at zero
+        max_abs = max(abs(vmin), abs(vmax))
+        norm = TwoSlopeNorm(vmin=-max_abs, vcenter=0, vmax=max_abs)
+    else:
+        norm = Normalize(vmin=vmin, vmax=vmax)
+
+    if breaks is not None and len(breaks) > 2:
+        classes = len(breaks) - 1
+        if has_negative and has_positive:
+            # One colour per class at its midpoint, on the side of zero the class lies on
+            edges = np.asarray(breaks, dtype=float)
+            positions = np.clip(norm((edges[:-1] + edges[1:]) / 2), 0, 1)
+        else:
+            # One colour per class, spread evenly over the ramp
+            positions = np.linspace(0, 1, classes)
+        class_cmap = ListedColormap(cmap(positions), name=cmap.name)
+        return class_cmap, BoundaryNorm(breaks, classes)
+
+    return cmap, norm
@@ -1,23 +1,79 @@
 import geopandas as gpd
+import matplotlib
+import matplotlib.image
 import matplotlib.pyplot as plt
 import pandas as pd
 import os
 import re
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from matplotlib.colors import Normalize, LinearSegmentedColormap, TwoSlopeNorm
+import shapely
+from matplotlib.colors import BoundaryNorm, to_rgba
+from matplotlib.collections import PatchCollection
+from matplotlib.path import Path
+from matplotlib.transforms import Bbox
 import matplotlib.cm as cm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import matplotlib.ticker as ticker
 import matplotlib.patches as mpatches
-from matplotlib.patches import FancyBboxPatch
+from matplotlib.patches import FancyBboxPatch, PathPatch
 from matplotlib.offsetbox import AnchoredText
 import matplotlib.patheffects as path_effects
 
+from build_manifest import hash_inputs, load_manifest, save_manifest, save_changes, is_up_to_date, remove_stale_outputs
+from geometry_loader import load_areas, cache_dir_name, ADMIN_LEVELS
+from geometry_simplify import simplify_for_resolution
+from excel_ingest import load_wijk_data, get_var_info, DATA_FIRST_ROW, DATA_END_ROW
+from label_layout import compute_label_layout, LABEL_FONTSIZE, LABEL_FONTWEIGHT, LABEL_PAD, THIN_LABEL_COUNT
+from colour_scale import get_optimized_colormap, get_colour_scale, FACE_ALPHA
+from classification import class_breaks, SCHEMES, CLASS_COUNT
+from region_batch import load_region_definitions, build_attribute_index, select_region
+from boundary_pyramid import boundary_pyramid
+from run_profile import stage, add_output, enable_profile, profile_path, drain_events, merge_events, write_profile
+from output_writer import OutputWriter, WRITER_COUNT, write_atomic
+from output_targets import (OUTPUT_TARGETS, DEFAULT_TARGETS, parse_targets, is_vector_target, target_directory,
+                            target_file_name, render_dpi, write_raster_target, write_vector_target, save_figure,
+                            DEFAULT_ENCODING,
+                            IMAGE_ENCODINGS, IMAGE_FORMATS, PNG_COMPRESSION, parse_encoding, encoding_inputs)
+
 # Define the input file names
 gpkg_file = "WijkBuurtkaart_2025_v0.gpkg"
 excel_file = "waterweg_wijken.xlsx"
 output_dir = "figures"
 output_dir_labels = "figures_labels"
+manifest_file = "atlas_manifest.json"
+
+# Output folder of the batch mode, with a subfolder per region
+regions_dir = "regions"
+
+# Region of the single-region atlas
+default_region = {'name': 'waterwegregio', 'title': 'Waterwegregio'}
+
+# GeoPackage attributes used by the maps, besides the code and the name of the area
+gpkg_columns = ['gm_naam', 'gm_code']
+
+# Excel file, last data row (None = last row with a code), output directories and
+# manifest per administrative level; the wijk level keeps the original names
+LEVEL_FILES = {
+    'wijk': {'excel_file': excel_file, 'end_row': DATA_END_ROW,
+             'output_dirs': [output_dir, output_dir_labels], 'manifest_file': manifest_file},
+    'buurt': {'excel_file': "waterweg_buurten.xlsx", 'end_row': None,
+              'output_dirs': ["figures_buurten", "figures_buurten_labels"],
+              'manifest_file': "atlas_manifest_buurten.json"},
+    'gemeente': {'excel_file': "waterweg_gemeenten.xlsx", 'end_row': None,
+                 'output_dirs': ["figures_gemeenten", "figures_gemeenten_labels"],
+                 'manifest_file': "atlas_manifest_gemeenten.json"},
+}
+
+# Version of the map style, part of the build manifest hashes. Increase it after
+# changing how maps are drawn, so the next run draws all maps again.
+RENDERER_VERSION = 2
+
+# Background writer of the maps of this process (see output_writer.py), set while
+# render_atlases() or a render worker runs; None saves every map directly
+_output_writer = None
 
 # Ensure the output directories exist
 for directory in [output_dir, output_dir_labels]:
@@ -28,7 +84,6 @@ for directory in [output_dir, output_dir_labels]:
 # Construct the full path to the input files
 script_dir = os.path.dirname(os.path.abspath(__file__))
 gpkg_path = os.path.join(script_dir, gpkg_file)
-excel_path = os.path.join(script_dir, excel_file)
 
 def add_north_arrow(ax, x=0.95, y=0.95, size=0.03):
     """Add a north arrow to the map"""
@@ -69,94 +124,117 @@ def add_scale_bar(ax, gdf, length_km=1):
            bbox=dict(boxstyle="round,pad=0.2", fc='white', ec='none', alpha=0.8),
            zorder=1001)
 
-def get_optimized_colormap(has_negative, has_positive):
-    """Create optimized color schemes for different data types"""
-    if has_negative and has_positive:
-        # Diverging colormap for both positive and negative values
-        colors = ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#ffffbf',
-                 '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']
-        return LinearSegmentedColormap.from_list('custom_diverging', colors, N=256)
-    elif has_positive:
-        # Sequential colormap for positive values only - start with light blue instead of white
-        colors = ['#cce7f0', '#a6d8ea', '#7cc7e8', '#52b3d9', '#2e8bc8',
-                 '#1264aa', '#0b4d8c', '#08306b']
-        return LinearSegmentedColormap.from_list('custom_sequential', colors, N=256)
+def format_label_value(data_value, title=""):
+    """Format a data value for a map label in Dutch notation"""
+    # Check if this is a percentage field
+    is_percentage = any(indicator in title.lower() for indicator in ['percentage', 'perc.', '%'])
+    
+    # Format the data value appropriately
+    if abs(data_value) >= 1000:
+        # For large numbers, check if it's a whole number
+        if data_value == int(data_value) and not is_percentage:
+            return f'{int(data_value):,}'.replace(',', '.')
+        return f'{data_value:,.1f}'.replace(',', '.').replace('.', ',', 1)
+    elif abs(data_value) >= 1:
+        # For numbers >= 1, check if it's a whole number
+        if data_value == int(data_value) and not is_percentage:
+            return f'{int(data_value)}'
+        return f'{data_value:.1f}'.replace('.', ',')
     else:
-        # For negative values only
-        colors = ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a',
-                 '#ef3b2c', '#cb181d', '#a50f15', '#67000d']
-        return LinearSegmentedColormap.from_list('custom_negative', colors, N=256)
+        # For small numbers, always show decimals but remove trailing zeros
+        if is_percentage:
+            return f'{data_value:.1f}'.replace('.', ',')
+        return f'{data_value:.2f}'.replace('.', ',').rstrip('0').rstrip(',')
 
-def place_labels_optimized(merged_gdf, data_df, ax, wijk_code_gdf_column, show_data_values=False, data_column=None, title=""):
-    """Improved label placement - show all labels"""
-    from shapely.geometry import Point
+def place_labels_optimized(label_layout, ax, outline=True):
+    """
+    Add the wijk labels at the positions of the label layout
+
+    The label texts are the wijk names; returns a dictionary mapping the index of
+    each labelled wijk to its (text artist, wijk name), so the label texts can be
+    changed afterwards. `outline` False leaves out the white text outline, which
+    draws every text as a path and is the bulk of the label drawing time on maps
+    with hundreds of labels.
+    """
+    labels = {}
     
-    for idx, row in merged_gdf.iterrows():
+    for row in label_layout.itertuples():
         try:
-            wijk_code = row[wijk_code_gdf_column]
-            wijk_row = data_df[data_df['gwb_code_10'] == wijk_code]
-            
-            if not wijk_row.empty and 'wk_naam' in data_df.columns and pd.notna(wijk_row['wk_naam'].iloc[0]):
-                wijk_naam = wijk_row['wk_naam'].iloc[0]
-            else:
-                wijk_naam = row['wk_naam'] if 'wk_naam' in row and pd.notna(row['wk_naam']) else f"Wijk {wijk_code}"
-            
-            # Prepare label text
-            label_text = wijk_naam
-            
-            # Add data value if requested
-            if show_data_values and 'data_value' in row and pd.notna(row['data_value']):
-                data_value = row['data_value']
-                
-                # Check if this is a percentage field
-                is_percentage = any(indicator in title.lower() for indicator in ['percentage', 'perc.', '%'])
-                
-                # Format the data value appropriately
-                if abs(data_value) >= 1000:
-                    # For large numbers, check if it's a whole number
-                    if data_value == int(data_value) and not is_percentage:
-                        formatted_value = f'{int(data_value):,}'.replace(',', '.')
-                    else:
-                        formatted_value = f'{data_value:,.1f}'.replace(',', '.').replace('.', ',', 1)
-                elif abs(data_value) >= 1:
-                    # For numbers >= 1, check if it's a whole number
-                    if data_value == int(data_value) and not is_percentage:
-                        formatted_value = f'{int(data_value)}'
-                    else:
-                        formatted_value = f'{data_value:.1f}'.replace('.', ',')
-                else:
-                    # For small numbers, always show decimals but remove trailing zeros
-                    if is_percentage:
-                        formatted_value = f'{data_value:.1f}'.replace('.', ',')
-                    else:
-                        formatted_value = f'{data_value:.2f}'.replace('.', ',').rstrip('0').rstrip(',')
-                
-                label_text = f"{wijk_naam}\n{formatted_value}"
-            
-            # Get centroid
-            centroid = row.geometry.centroid
-            
             # Add label with improved styling - show all labels
-            text = ax.annotate(text=label_text, 
-                             xy=(centroid.x, centroid.y),
+            text = ax.annotate(text=row.name, 
+                             xy=(row.x, row.y),
                              ha='center', va='center', 
-                             fontsize=7, fontweight='600',
+                             fontsize=LABEL_FONTSIZE, fontweight=LABEL_FONTWEIGHT,
                              fontfamily='sans-serif',
                              color='#2c3e50',
-                             bbox=dict(boxstyle="round,pad=0.4", 
+                             bbox=dict(boxstyle=f"round,pad={LABEL_PAD}", 
                                      fc='white', ec='#34495e', 
                                      alpha=0.9, linewidth=0.5),
                              zorder=1000)
             
             # Add text outline for better readability
-            text.set_path_effects([path_effects.withStroke(linewidth=2, foreground='white')])
+            if outline:
+                text.set_path_effects([path_effects.withStroke(linewidth=2, foreground='white')])
+            
+            labels[row.Index] = (text, row.name)
             
         except Exception as e:
-            print(f"Waarschuwing: Kon label voor wijk {wijk_code} niet plaatsen: {e}")
+            print(f"Waarschuwing: Kon label voor wijk {row.name} niet plaatsen: {e}")
+    
+    return labels
 
-def create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script_dir, output_dir):
+def build_indicator_table(data_df, data_columns, waterwegregio_gdf, wijk_code_gdf_column):
+    """
+    Join all indicator columns to the wijken geometry in one vectorized pass
+
+    Every indicator column of `data_df` is coerced to numeric in place (non-numeric
+    cells become NaN). The result is a float DataFrame with one row per wijk, in the
+    order and with the index of `waterwegregio_gdf`, and one column per indicator.
+    Wijken without a matching Excel row get NaN; when a code occurs more than once
+    in the Excel data the first row is used.
+    """
+    columns = [col for col in dict.fromkeys(data_columns) if col in data_df.columns and col != 'gwb_code_10']
+    
+    # Convert all indicator columns to numeric at once, forcing errors to NaN
+    numeric = data_df.loc[:, ~data_df.columns.duplicated()][columns].apply(pd.to_numeric, errors='coerce')
+    data_df[columns] = numeric
+    
+    # Align the rows to the geometry order through the wijk code
+    numeric.index = data_df['gwb_code_10']
+    numeric = numeric[~numeric.index.duplicated(keep='first')]
+    indicator_table = numeric.reindex(waterwegregio_gdf[wijk_code_gdf_column].to_numpy()).astype(float)
+    indicator_table.index = waterwegregio_gdf.index
+    
+    return indicator_table
+
+def dissolve_gemeenten(waterwegregio_gdf, cache_dir=None):
+    """
+    Gemeente areas of the map units, from the boundary pyramid (boundary_pyramid.py)
+
+    The pyramid is dissolved once with a coverage union and cached in
+    `cache_dir`. Returns a GeoSeries indexed by gemeente name, or None without
+    a 'gm_naam' column.
+    """
+    if 'gm_naam' not in waterwegregio_gdf.columns:
+        return None
+    pyramid = boundary_pyramid(waterwegregio_gdf.geometry.to_numpy(), waterwegregio_gdf['gm_naam'],
+                               cache_dir=cache_dir)
+    return gpd.GeoSeries(pyramid['gemeenten'], index=pyramid['gemeente_keys'], crs=waterwegregio_gdf.crs)
+
+def overview_file_name(level='wijk', region=default_region):
+    """File name of the overview map of an administrative level and region"""
+    return f"00_{ADMIN_LEVELS[level]['plural']}_{region['name']}_overzicht.png"
+
+def create_overview_map(waterwegregio_gdf, label_layout, script_dir, output_dirs, gemeente_borders=None, level='wijk',
+                        region=default_region):
     """
     Create an administrative overview map showing wijken colored by gemeente
+
+    The labels are placed with `label_layout`, the layout shared with the
+    thematic maps, and the gemeente borders are `gemeente_borders` (see
+    dissolve_gemeenten()). The map is drawn once and saved in every directory
+    of `output_dirs`. Returns the paths whose contents changed, or None when
+    the map could not be made.
     """
     try:
         # Define 4 colors for municipalities
@@ -173,7 +251,7 @@ def create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script
                 gemeente_color_map[gemeente] = gemeente_colors[i % len(gemeente_colors)]
         else:
             print("Waarschuwing: geen 'gm_naam' kolom gevonden voor gemeente kleuring")
-            return
+            return None
         
         # Create the figure
         plt.style.use('default')
@@ -187,11 +265,12 @@ def create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script
                                 linewidth=0.8, alpha=0.7)
         
         # Plot municipality borders with thick lines
-        waterwegregio_gdf.dissolve(by='gm_naam').plot(ax=ax, facecolor="none", 
-                                                     edgecolor='#2c3e50', linewidth=2.5, alpha=0.8)
+        if gemeente_borders is None:
+            gemeente_borders = dissolve_gemeenten(waterwegregio_gdf)
+        gemeente_borders.plot(ax=ax, facecolor="none", edgecolor='#2c3e50', linewidth=2.5, alpha=0.8)
         
         # Add wijk labels
-        place_labels_optimized(waterwegregio_gdf, data_df, ax, wijk_code_gdf_column, title="")
+        place_labels_optimized(label_layout, ax, outline=len(waterwegregio_gdf) <= THIN_LABEL_COUNT)
         
         # Get the bounds of the area to set map extent
         minx, miny, maxx, maxy = waterwegregio_gdf.total_bounds
@@ -205,7 +284,7 @@ def create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script
         ax.set_ylim(miny - padding_y, maxy + padding_y)
         
         # Set title
-        ax.set_title('Wijken Waterwegregio', fontsize=20, fontweight='700', 
+        ax.set_title(f"{ADMIN_LEVELS[level]['plural'].capitalize()} {region['title']}", fontsize=20, fontweight='700', 
                     pad=25, color='#2c3e50', fontfamily='sans-serif')
         
         # Remove axis
@@ -234,82 +313,105 @@ def create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script
         # Adjust layout
         plt.tight_layout()
         
-        # Save the overview map
-        output_file = "00_wijken_waterwegregio_overzicht.png"
-        output_path = os.path.join(script_dir, output_dir, output_file)
-        plt.savefig(output_path, dpi=300, bbox_inches='tight', 
-                   facecolor='white', edgecolor='none', pad_inches=0.15,
-                   metadata={'Creator': 'Waterwegregio Thematic Maps'})
+        # Save the overview map once and copy it to the other directories, files with the same bytes are kept
+        output_file = overview_file_name(level, region)
+        output_paths = [os.path.join(script_dir, output_dir, output_file) for output_dir in output_dirs]
+        changed = [write_atomic(output_paths[0], save_figure, fig, 'png', 300)]
         plt.close(fig)
+        for output_path in output_paths[1:]:
+            changed.append(write_atomic(output_path, lambda tmp_path: shutil.copyfile(output_paths[0], tmp_path)))
+        
+        for output_path, output_changed in zip(output_paths, changed):
+            add_output(output_path)
+            if output_changed:
+                print(f"Overzichtskaart opgeslagen als: {output_path}")
+            else:
+                print(f"Overzichtskaart ongewijzigd, niet overschreven: {output_path}")
         
-        print(f"Overzichtskaart opgeslagen als: {output_path}")
+        return [output_path for output_path, output_changed in zip(output_paths, changed) if output_changed]
         
     except Exception as e:
         print(f"Fout bij het maken van overzichtskaart: {e}")
         import traceback
         traceback.print_exc()
+        return None
 
-def create_single_thematic_map(merged_gdf, data_df, wijk_code_gdf_column, column, title, source, output_path, show_labels=False):
+def format_colorbar_tick(x, pos):
+    """Format a colorbar tick in Dutch notation"""
+    if abs(x) >= 1000:
+        return f'{int(x):,}'.replace(',', '.')
+    elif abs(x) >= 1:
+        return f'{x:.1f}'.replace('.', ',')
+    else:
+        return f'{x:.2f}'.replace('.', ',')
+
+def polygon_to_path(polygon):
+    """Convert a shapely Polygon to a matplotlib Path, including its holes"""
+    return Path.make_compound_path(
+        Path(np.asarray(polygon.exterior.coords)[:, :2]),
+        *[Path(np.asarray(ring.coords)[:, :2]) for ring in polygon.interiors]
+    )
+
+class ThematicMapTemplate:
     """
-    Create a single thematic map
+    Map figure with all static elements, reused for every thematic map
+
+    The wijk polygons, gemeente borders, labels, map extent, north arrow, scale bar
+    and colorbar axes are created once. render() only swaps the polygon colours,
+    the colour norm of the colorbar, the label texts, the title and the legend,
+    and then saves the figure.
+
+    The labels are placed with `label_layout`; without one the layout is computed
+    for the axes of this figure and kept in `self.label_layout`. `level` is the
+    administrative level of the areas, `gemeente_borders` the dissolved gemeenten
+    (computed when not given). The maps are drawn at `dpi` (see
+    output_targets.render_dpi()) and the raster targets written with
+    `encoding` (see output_targets.parse_encoding()).
     """
-    try:
+    
+    def __init__(self, waterwegregio_gdf, data_df, wijk_code_gdf_column, label_layout=None,
+                 gemeente_borders=None, level='wijk', dpi=300, encoding=None):
+        self.index = waterwegregio_gdf.index
+        
         # Create the figure with better styling
         plt.style.use('default')  # Reset any previous styles
-        fig, ax = plt.subplots(1, 1, figsize=(14, 11), facecolor='white', dpi=150)
+        self.dpi = dpi
+        self.encoding = encoding or DEFAULT_ENCODING
+        self.fig, self.ax = plt.subplots(1, 1, figsize=(14, 11), facecolor='white', dpi=150)
+        ax = self.ax
         
-        # Get valid min and max values for normalization
-        valid_values = merged_gdf['data_value'].dropna()
-        if len(valid_values) == 0:
-            print(f"Kolom '{column}' overgeslagen: geen geldige waarden voor kleurenschaal.")
-            plt.close(fig)
-            return False
-            
-        vmin = valid_values.min()
-        vmax = valid_values.max()
+        # Split multipolygons into parts and remember to which wijk each part belongs
+        parts, self.part_wijk = shapely.get_parts(waterwegregio_gdf.geometry.to_numpy(), return_index=True)
+        self.part_patches = [PathPatch(polygon_to_path(part)) for part in parts]
         
-        # Determine if we have negative values and choose appropriate colormap
-        has_negative = vmin < 0
-        has_positive = vmax > 0
+        # Polygons of all wijken, coloured per map in render()
+        self.data_collection = PatchCollection(self.part_patches, linewidth=0.8)
+        ax.add_collection(self.data_collection, autolim=True)
         
-        # Get optimized colormap
-        cmap = get_optimized_colormap(has_negative, has_positive)
+        # Hatched polygons of the wijken without data, filled per map in render()
+        self.missing_collection = PatchCollection([], facecolor='#ecf0f1', edgecolor='#2c3e50',
+                                                  linewidth=0.8, hatch='///', alpha=0.8)
+        ax.add_collection(self.missing_collection, autolim=False)
         
-        # Create normalization
-        if has_negative and has_positive:
-            # Create a normalization centered at zero
-            max_abs = max(abs(vmin), abs(vmax))
-            norm = TwoSlopeNorm(vmin=-max_abs, vcenter=0, vmax=max_abs)
+        # Same aspect as GeoPandas uses for plotting
+        crs = waterwegregio_gdf.crs
+        if crs is not None and crs.is_geographic:
+            y_coord = np.mean(waterwegregio_gdf.total_bounds[[1, 3]])
+            ax.set_aspect(1 / np.cos(y_coord * np.pi / 180))
         else:
-            norm = Normalize(vmin=vmin, vmax=vmax)
-        
-        # Create two GeoDataFrames - one for data with values and one for missing data
-        gdf_with_values = merged_gdf[merged_gdf['data_value'].notna()].copy()
-        gdf_missing = merged_gdf[merged_gdf['data_value'].isna()].copy()
-        
-        # Plot the data layer with appropriate color gradient
-        if not gdf_with_values.empty:
-            gdf_with_values.plot(ax=ax, column='data_value', cmap=cmap, norm=norm, 
-                               legend=False, edgecolor='#2c3e50', linewidth=0.8, alpha=0.9)
-        
-        # Plot missing data with improved styling
-        if not gdf_missing.empty:
-            gdf_missing.plot(ax=ax, facecolor='#ecf0f1', edgecolor='#2c3e50', 
-                          linewidth=0.8, hatch='///', alpha=0.8)
+            ax.set_aspect('equal')
         
         # Plot municipality borders with improved styling
         try:
-            if 'gm_naam' in merged_gdf.columns:
-                merged_gdf.dissolve(by='gm_naam').plot(ax=ax, facecolor="none", 
-                                                    edgecolor='#2c3e50', linewidth=2.5, alpha=0.8)
+            if gemeente_borders is None:
+                gemeente_borders = dissolve_gemeenten(waterwegregio_gdf)
+            if gemeente_borders is not None:
+                gemeente_borders.plot(ax=ax, facecolor="none", edgecolor='#2c3e50', linewidth=2.5, alpha=0.8)
         except Exception as e:
             print(f"Waarschuwing: Kon gemeentegrenzen niet tekenen: {e}")
         
-        # Add optimized labels
-        place_labels_optimized(merged_gdf, data_df, ax, wijk_code_gdf_column, show_data_values=show_labels, title=title)
-        
         # Get the bounds of the area to set map extent
-        minx, miny, maxx, maxy = merged_gdf.total_bounds
+        minx, miny, maxx, maxy = waterwegregio_gdf.total_bounds
         
         # Add padding (3% instead of 5% for better use of space)
         padding_x = (maxx - minx) * 0.03
@@ -318,7 +420,93 @@ def create_single_thematic_map(merged_gdf, data_df, wijk_code_gdf_column, column
         # Set the map extent
         ax.set_xlim(minx - padding_x, maxx + padding_x)
         ax.set_ylim(miny - padding_y, maxy + padding_y)
+        
+        # Remove axis
+        ax.set_axis_off()
+        
+        # Add improved colorbar, its colour mapping is swapped per map in render()
+        divider = make_axes_locatable(ax)
+        cax = divider.append_axes("right", size="3%", pad=0.6)
+        
+        self.scalar_mappable = plt.cm.ScalarMappable(cmap=get_optimized_colormap(False, True))
+        self.scalar_mappable.set_array([])
+        self.colorbar = self.fig.colorbar(self.scalar_mappable, cax=cax)
+        
+        # Add professional cartographic elements
+        add_north_arrow(ax)
+        add_scale_bar(ax, waterwegregio_gdf)
+        
+        # Set subtle background
+        ax.set_facecolor('#f8f9fa')
+        
+        # Subplot parameters before any layout, tight_layout starts from these for every map
+        subplotpars = self.fig.subplotpars
+        self.subplot_params = {name: getattr(subplotpars, name)
+                               for name in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')}
+        
+        # Compute the label layout for the size the map gets on this figure
+        if label_layout is None:
+            with stage('label_layout', areas=len(waterwegregio_gdf)):
+                label_layout = compute_label_layout(waterwegregio_gdf, data_df, wijk_code_gdf_column,
+                                                    self.data_units_per_point(),
+                                                    name_column=ADMIN_LEVELS[level]['name_column'],
+                                                    fallback_prefix=ADMIN_LEVELS[level]['singular'].capitalize())
+        self.label_layout = label_layout
+        
+        # Add optimized labels, the texts are set per map in render()
+        self.labels = place_labels_optimized(label_layout, ax, outline=len(waterwegregio_gdf) <= THIN_LABEL_COUNT)
+    
+    def data_units_per_point(self):
+        """Map units per typographic point, for a map with a one-line title"""
+        ax = self.ax
+        ax.set_title("Titel", fontsize=20, fontweight='700', pad=25, fontfamily='sans-serif')
+        self.fig.tight_layout()
+        ax.apply_aspect()
+        
+        xmin, xmax = ax.get_xlim()
+        width_points = ax.get_position().width * self.fig.get_figwidth() * 72
+        
+        ax.set_title("")
+        self.fig.subplots_adjust(**self.subplot_params)
+        return (xmax - xmin) / width_points
+    
+    def prepare_map(self, values, column, title, source, breaks=None):
+        """
+        Set the colours, title, colorbar, legend and plain label texts of one map
 
+        With class `breaks` (edges from the minimum to the maximum) the wijken are
+        coloured per class. Returns (value_array, cmap, norm), with the values in
+        geometry order, or None when the indicator has no valid values.
+        """
+        ax = self.ax
+        values = values.reindex(self.index)
+        
+        # Get valid min and max values for normalization
+        valid_values = values.dropna()
+        if len(valid_values) == 0:
+            print(f"Kolom '{column}' overgeslagen: geen geldige waarden voor kleurenschaal.")
+            return None
+            
+        # Diverging colours around zero, otherwise sequential
+        cmap, norm = get_colour_scale(valid_values.min(), valid_values.max(), breaks)
+        
+        # Colour the wijken with data; wijken without data are drawn by the hatched layer
+        value_array = values.to_numpy(dtype=float)
+        has_value = ~np.isnan(value_array)
+        facecolors = np.zeros((len(value_array), 4))
+        facecolors[has_value] = cmap(norm(value_array[has_value]))
+        facecolors[has_value, 3] = FACE_ALPHA
+        edgecolors = np.zeros((len(value_array), 4))
+        edgecolors[has_value] = to_rgba('#2c3e50', alpha=0.9)
+        self.data_collection.set_facecolor(facecolors[self.part_wijk])
+        self.data_collection.set_edgecolor(edgecolors[self.part_wijk])
+        
+        missing_parts = np.flatnonzero(~has_value[self.part_wijk])
+        self.missing_collection.set_paths([self.part_patches[i] for i in missing_parts])
+        
+        # Layout is based on the labels without data values
+        self.set_label_texts(value_array, title, show_values=False)
+        
         # Improved title styling
         title_fontsize = 20
         if title and len(title) > 40:
@@ -328,33 +516,22 @@ def create_single_thematic_map(merged_gdf, data_df, wijk_code_gdf_column, column
         ax.set_title(title, fontsize=title_fontsize, fontweight='700', 
                    pad=25, color='#2c3e50', fontfamily='sans-serif')
         
-        # Remove axis
-        ax.set_axis_off()
-        
-        # Add improved colorbar
-        divider = make_axes_locatable(ax)
-        cax = divider.append_axes("right", size="3%", pad=0.6)
-        
-        sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-        sm.set_array([])
-        cbar = fig.colorbar(sm, cax=cax)
+        # Swap the colour mapping of the colorbar
+        self.scalar_mappable.set_cmap(cmap)
+        self.scalar_mappable.set_norm(norm)
+        self.colorbar.update_normal(self.scalar_mappable)
         
         # Improved colorbar formatting
-        def format_ticks(x, pos):
-            if abs(x) >= 1000:
-                return f'{int(x):,}'.replace(',', '.')
-            elif abs(x) >= 1:
-                return f'{x:.1f}'.replace('.', ',')
-            else:
-                return f'{x:.2f}'.replace('.', ',')
-        
-        cbar.ax.yaxis.set_major_formatter(ticker.FuncFormatter(format_ticks))
-        cbar.ax.yaxis.set_major_locator(ticker.MaxNLocator(6))
-        cbar.ax.tick_params(labelsize=9)
+        self.colorbar.ax.yaxis.set_major_formatter(ticker.FuncFormatter(format_colorbar_tick))
+        if isinstance(norm, BoundaryNorm):
+            self.colorbar.ax.yaxis.set_major_locator(ticker.FixedLocator(norm.boundaries))
+        else:
+            self.colorbar.ax.yaxis.set_major_locator(ticker.MaxNLocator(6))
+        self.colorbar.ax.tick_params(labelsize=9)
         
         # Add improved legend for missing values and source
         legend_elements = []
-        if not gdf_missing.empty:
+        if len(missing_parts) > 0:
             missing_patch = mpatches.Patch(facecolor='#ecf0f1', hatch='///', 
                                           edgecolor='#2c3e50', label='Geen data',
                                           alpha=0.8)
@@ -367,6 +544,10 @@ def create_single_thematic_map(merged_gdf, data_df, wijk_code_gdf_column, column
                                          label=f"Bron: {source}")
             legend_elements.append(source_patch)
         
+        # Replace the legend of the previous map
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+        
         # Create legend if we have elements
         if legend_elements:
             legend = ax.legend(handles=legend_elements, loc='lower right', 
@@ -384,207 +565,1034 @@ def create_single_thematic_map(merged_gdf, data_df, wijk_code_gdf_column, column
                     legend_texts[0].set_style('italic')
                     legend_texts[0].set_color('#7f8c8d')
         
-        # Add professional cartographic elements
-        add_north_arrow(ax)
-        add_scale_bar(ax, merged_gdf)
+        return value_array, cmap, norm
+    
+    def render(self, values, column, title, source, outputs, breaks=None):
+        """
+        Draw one indicator on the template and save it once per output
+
+        `outputs` is a list of (output_path, show_labels, target) tuples, with a
+        target of output_targets.py. The map without labels is drawn once; for
+        every label setting only the labels are drawn on top of it, and the
+        image is saved to all its targets. Returns a list of (output_path,
+        show_labels, success) tuples.
+        """
+        with stage('draw'):
+            prepared = self.prepare_map(values, column, title, source, breaks)
+            if prepared is None:
+                return [(output_path, show_labels, False) for output_path, show_labels, target in outputs]
+            value_array = prepared[0]
+            ax = self.ax
+            
+            # Adjust layout with better spacing
+            self.fig.subplots_adjust(**self.subplot_params)
+            self.fig.tight_layout()
+            
+            # Draw the map without labels once at output resolution and keep it as background
+            layout_dpi = self.fig.dpi
+            self.fig.dpi = self.dpi
+            canvas = self.fig.canvas
+            label_texts = [text for text, wijk_naam in self.labels.values()]
+            for text in label_texts:
+                text.set_visible(False)
+            canvas.draw()
+            background = canvas.copy_from_bbox(self.fig.bbox)
+            for text in label_texts:
+                text.set_visible(True)
         
-        # Set subtle background
-        ax.set_facecolor('#f8f9fa')
+        results = []
+        for show_labels, label_outputs in group_outputs(outputs):
+            try:
+                # Draw only the labels of this output on top of the background
+                with stage('labels', show_labels=show_labels):
+                    self.set_label_texts(value_array, title, show_values=show_labels)
+                    canvas.restore_region(background)
+                    for text in label_texts:
+                        ax.draw_artist(text)
+                image = self.crop_canvas()
+                
+            except Exception as e:
+                print(f"Fout bij het tekenen van de labels: {e}")
+                results += [(output_path, show_labels, False) for output_path, target in label_outputs]
+                continue
+            
+            results += self.save_outputs(label_outputs, show_labels, image)
         
-        # Adjust layout with better spacing
-        plt.tight_layout()
+        self.fig.dpi = layout_dpi
         
-        # Save with higher quality settings
-        plt.savefig(output_path, dpi=300, bbox_inches='tight', 
-                  facecolor='white', edgecolor='none', pad_inches=0.15,
-                  metadata={'Creator': 'Waterwegregio Thematic Maps'})
-        plt.close(fig)
+        return results
+    
+    def set_label_texts(self, value_array, title, show_values):
+        """Set the label texts, optionally with the data values"""
+        for position, idx in enumerate(self.index):
+            if idx not in self.labels:
+                continue
+            text, wijk_naam = self.labels[idx]
+            data_value = value_array[position]
+            if show_values and not np.isnan(data_value):
+                text.set_text(f"{wijk_naam}\n{format_label_value(data_value, title)}")
+            else:
+                text.set_text(wijk_naam)
+    
+    def crop_canvas(self):
+        """
+        The current canvas, cropped like savefig(bbox_inches='tight')
+
+        The canvas is drawn at the output resolution, so the tight bounding box
+        (with 0.15 inch padding) can be cut out of the pixel buffer directly.
+        """
+        canvas = self.fig.canvas
+        with stage('crop'):
+            bbox = self.fig.get_tightbbox(canvas.get_renderer()).padded(0.15)
+            return self.crop_image(np.asarray(canvas.buffer_rgba()), bbox)
+    
+    def crop_image(self, buffer, bbox):
+        """
+        The part of a canvas sized RGBA image inside `bbox` (in inches)
+
+        The cropped image is a copy, so with a background writer it is encoded
+        while the next map is drawn on the canvas.
+        """
+        # Bounding box in pixels, measured from the top left corner of the canvas
+        canvas_height, canvas_width = buffer.shape[:2]
+        width = int(bbox.width * self.dpi)
+        height = int(bbox.height * self.dpi)
+        x0 = int(round(bbox.x0 * self.dpi))
+        y0 = canvas_height - int(round(bbox.y0 * self.dpi)) - height
         
-        return True
+        # Parts of the bounding box outside the canvas stay white
+        image = np.full((height, width, 4), 255, dtype=np.uint8)
+        src_x0, src_y0 = max(x0, 0), max(y0, 0)
+        src_x1, src_y1 = min(x0 + width, canvas_width), min(y0 + height, canvas_height)
+        image[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = buffer[src_y0:src_y1, src_x0:src_x1]
+        return image
+    
+    def save_outputs(self, outputs, show_labels, image):
+        """
+        Save the cropped image of the canvas to (output_path, target) outputs
+
+        Raster targets are downscaled and encoded by the background writer when
+        there is one; vector targets save the figure as it is now, through the
+        writer so unchanged files are recorded too. Returns a list of
+        (output_path, show_labels, success) tuples.
+        """
+        results = []
+        for output_path, target in outputs:
+            try:
+                if is_vector_target(target) and _output_writer is not None:
+                    _output_writer.write(output_path, write_vector_target, self.fig, target)
+                elif is_vector_target(target):
+                    with stage('encode', output=output_path, target=target):
+                        write_atomic(output_path, write_vector_target, self.fig, target)
+                        add_output(output_path)
+                elif _output_writer is not None:
+                    _output_writer.submit(output_path, write_raster_target, image, target, self.dpi, self.encoding)
+                else:
+                    with stage('encode', output=output_path, target=target):
+                        write_atomic(output_path, write_raster_target, image, target, self.dpi, self.encoding)
+                        add_output(output_path)
+                results.append((output_path, show_labels, True))
+            
+            except Exception as e:
+                print(f"Fout bij het opslaan van kaart {output_path}: {e}")
+                results.append((output_path, show_labels, False))
+        return results
+    
+    def close(self):
+        """Close the template figure"""
+        plt.close(self.fig)
+
+def group_outputs(outputs):
+    """(output_path, show_labels, target) outputs grouped by show_labels, as (show_labels, [(output_path, target)])"""
+    groups = {}
+    for output_path, show_labels, target in outputs:
+        groups.setdefault(show_labels, []).append((output_path, target))
+    return list(groups.items())
+
+def composite_over(background, layer):
+    """Composite straight-alpha RGBA pixels over RGB pixels, both uint8 with pixels in the first axis"""
+    alpha = layer[:, 3:4].astype(np.uint16)
+    blended = layer[:, :3] * alpha + background * (255 - alpha) + 127
+    return (blended // 255).astype(np.uint8)
+
+class RasterMapTemplate(ThematicMapTemplate):
+    """
+    Map template that colours a cached wijk raster instead of drawing polygons
+
+    The map layout is fixed for all maps. On creation the wijken are rasterized
+    once into a wijk-ID image at the output resolution, and the background, the
+    hatched missing-data pattern and the decoration (wijk edges, gemeente
+    borders, north arrow, scale bar) are pre-rendered as pixel layers. A map is
+    then a lookup of wijk ID to colour, composited with these layers and with the
+    texts of the map (title, colorbar, legend, labels), which are the only
+    artists drawn per map.
+    """
+    
+    def __init__(self, waterwegregio_gdf, data_df, wijk_code_gdf_column, label_layout=None,
+                 gemeente_borders=None, level='wijk', dpi=300, encoding=None):
+        super().__init__(waterwegregio_gdf, data_df, wijk_code_gdf_column, label_layout=label_layout,
+                         gemeente_borders=gemeente_borders, level=level, dpi=dpi, encoding=encoding)
+        ax = self.ax
+        
+        # Fixed layout with room for a one-line title, the raster layers depend on it
+        ax.set_title("Titel", fontsize=20, fontweight='700', pad=25, fontfamily='sans-serif')
+        self.fig.subplots_adjust(**self.subplot_params)
+        self.fig.tight_layout()
+        ax.set_title("")
+        self.fig.dpi = self.dpi
+        
+        # Artists whose visibility is switched per layer; the legend is added per map
+        self.label_texts = [text for text, wijk_naam in self.labels.values()]
+        self.layer_artists = (list(ax.collections) + list(ax.patches) + list(ax.lines)
+                              + list(ax.texts) + [ax.title, self.colorbar.ax])
+        self.text_artists = [ax.title, self.colorbar.ax]
+        decoration_artists = [artist for artist in self.layer_artists
+                              if artist not in self.text_artists + self.label_texts
+                              and artist is not self.missing_collection]
+        
+        background = self.draw_layer([], background=True)[:, :, :3]
+        self.canvas_shape = background.shape[:2]
+        
+        # Wijk-ID image: every wijk is filled with its number + 1 as colour, without anti-aliasing
+        wijk_numbers = np.arange(1, len(self.index) + 1)[self.part_wijk]
+        id_colors = np.column_stack([wijk_numbers & 255, (wijk_numbers >> 8) & 255,
+                                     (wijk_numbers >> 16) & 255, np.full(len(wijk_numbers), 255)]) / 255
+        self.data_collection.set_facecolor(id_colors)
+        self.data_collection.set_edgecolor('none')
+        self.data_collection.set_antialiased(False)
+        id_image = self.draw_layer([self.data_collection]).astype(np.int32)
+        self.data_collection.set_antialiased(True)
+        
+        wijk_ids = id_image[:, :, 0] | (id_image[:, :, 1] << 8) | (id_image[:, :, 2] << 16)
+        wijk_ids = np.where(id_image[:, :, 3] == 255, wijk_ids - 1, -1).ravel()
+        
+        # Pixels of the wijken, grouped per wijk so a map is filled with one np.repeat
+        wijk_pixels = np.flatnonzero(wijk_ids >= 0)
+        self.wijk_pixels = wijk_pixels[np.argsort(wijk_ids[wijk_pixels], kind='stable')]
+        self.wijk_pixel_counts = np.bincount(wijk_ids[wijk_pixels], minlength=len(self.index))
+        self.wijk_pixel_starts = np.concatenate([[0], np.cumsum(self.wijk_pixel_counts)[:-1]])
+        
+        # Hatched pattern of wijken without data, over the background
+        background = background.reshape(-1, 3)
+        self.missing_collection.set_paths(self.part_patches)
+        hatch_layer = self.draw_layer([self.missing_collection]).reshape(-1, 4)[self.wijk_pixels]
+        self.missing_collection.set_paths([])
+        self.hatch_colors = self.opaque(composite_over(background[self.wijk_pixels], hatch_layer))
+        
+        # Decoration, with the wijk edges of the vector maps
+        self.data_collection.set_facecolor('none')
+        self.data_collection.set_edgecolor(to_rgba('#2c3e50', alpha=0.9))
+        decoration_layer = self.draw_layer(decoration_artists).reshape(-1, 4)
+        
+        # Only wijk pixels under the decoration are blended per map
+        self.edge_pixels = np.flatnonzero((wijk_ids >= 0) & (decoration_layer[:, 3] > 0))
+        edge_alpha = decoration_layer[self.edge_pixels, 3:4].astype(np.uint16)
+        self.edge_inverse_alpha = 255 - edge_alpha
+        self.edge_color = decoration_layer[self.edge_pixels, :3] * edge_alpha
+        
+        # Outside the wijken the map is the same for every indicator
+        static_image = np.empty((len(background), 4), dtype=np.uint8)
+        static_image[:, :3] = composite_over(background, decoration_layer)
+        static_image[:, 3] = 255
+        self.static_image = static_image
+        self.axes_color = np.array(to_rgba('#f8f9fa')[:3]) * 255
+        
+        # Labels with only the wijk names are the same on every map without data labels
+        name_layer = self.draw_layer(self.label_texts).reshape(-1, 4)
+        self.name_pixels = np.flatnonzero(name_layer[:, 3])
+        self.name_colors = name_layer[self.name_pixels]
+        
+        # Extent of everything but the title and the colorbar, which change per map
+        for artist in self.text_artists:
+            artist.set_visible(False)
+        self.static_bbox = self.fig.get_tightbbox(self.fig.canvas.get_renderer())
+        for artist in self.text_artists:
+            artist.set_visible(True)
+    
+    @staticmethod
+    def opaque(colors):
+        """Opaque RGBA pixels of RGB pixels, packed as one uint32 per pixel"""
+        rgba = np.empty((len(colors), 4), dtype=np.uint8)
+        rgba[:, :3] = colors
+        rgba[:, 3] = 255
+        return rgba.view(np.uint32).ravel()
+    
+    def draw_layer(self, artists, background=False):
+        """Draw only `artists` on a transparent canvas, returns a copy of the RGBA buffer"""
+        legend = self.ax.get_legend()
+        layer_artists = self.layer_artists + ([legend] if legend is not None else [])
+        visible = [artist.get_visible() for artist in layer_artists]
+        for artist in layer_artists:
+            artist.set_visible(any(artist is shown for shown in artists))
+        self.fig.patch.set_visible(background)
+        self.ax.patch.set_visible(background)
+        
+        self.fig.canvas.draw()
+        
+        for artist, was_visible in zip(layer_artists, visible):
+            artist.set_visible(was_visible)
+        self.fig.patch.set_visible(True)
+        self.ax.patch.set_visible(True)
+        return np.array(self.fig.canvas.buffer_rgba())
+    
+    def render(self, values, column, title, source, outputs, breaks=None):
+        """
+        Colour the wijk raster for one indicator and save it once per output
+
+        `outputs` is a list of (output_path, show_labels, target) tuples with
+        raster targets. Returns a list of (output_path, show_labels, success)
+        tuples.
+        """
+        with stage('draw'):
+            prepared = self.prepare_map(values, column, title, source, breaks)
+            if prepared is None:
+                return [(output_path, show_labels, False) for output_path, show_labels, target in outputs]
+            value_array, cmap, norm = prepared
+            
+            # Colour per wijk, blended with the axes background like the face alpha of the vector maps
+            has_value = ~np.isnan(value_array)
+            lookup = np.zeros((len(value_array), 3))
+            lookup[has_value] = np.round(cmap(norm(value_array[has_value]))[:, :3] * 255 * FACE_ALPHA
+                                         + self.axes_color * (1 - FACE_ALPHA))
+            
+            map_image = self.static_image.copy()
+            map_pixels = map_image.view(np.uint32).ravel()
+            map_pixels[self.wijk_pixels] = np.repeat(self.opaque(lookup), self.wijk_pixel_counts)
+            for wijk in np.flatnonzero(~has_value):
+                pixels = slice(self.wijk_pixel_starts[wijk], self.wijk_pixel_starts[wijk] + self.wijk_pixel_counts[wijk])
+                map_pixels[self.wijk_pixels[pixels]] = self.hatch_colors[pixels]
+            
+            edges = map_image[self.edge_pixels, :3] * self.edge_inverse_alpha + self.edge_color + 127
+            map_image[self.edge_pixels, :3] = edges // 255
+            
+            # Title, colorbar and legend once, over the map
+            canvas = self.fig.canvas
+            legend = self.ax.get_legend()
+            text_artists = self.text_artists + ([legend] if legend is not None else [])
+            text_layer = self.draw_layer(text_artists).reshape(-1, 4)
+            text_background = canvas.copy_from_bbox(self.fig.bbox)
+            text_pixels = np.flatnonzero(text_layer[:, 3])
+            text_image = map_image.copy()
+            text_image[text_pixels, :3] = composite_over(map_image[text_pixels, :3], text_layer[text_pixels])
+            
+            # Crop like bbox_inches='tight', without measuring the polygons again
+            renderer = canvas.get_renderer()
+            inches = self.fig.dpi_scale_trans.inverted()
+            bbox = Bbox.union([self.static_bbox] + [artist.get_tightbbox(renderer).transformed(inches)
+                                                     for artist in text_artists]).padded(0.15)
+        
+        results = []
+        for show_labels, label_outputs in group_outputs(outputs):
+            try:
+                with stage('labels', show_labels=show_labels):
+                    if show_labels:
+                        # Draw the labels with data values on the text layer, which then goes over the map
+                        image = map_image.copy()
+                        self.set_label_texts(value_array, title, show_values=True)
+                        canvas.restore_region(text_background)
+                        for text in self.label_texts:
+                            self.ax.draw_artist(text)
+                        label_layer = np.asarray(canvas.buffer_rgba()).reshape(-1, 4)
+                        label_pixels = np.flatnonzero(label_layer[:, 3])
+                        label_colors = label_layer[label_pixels]
+                    else:
+                        image = text_image.copy()
+                        label_pixels, label_colors = self.name_pixels, self.name_colors
+                    image[label_pixels, :3] = composite_over(image[label_pixels, :3], label_colors)
+                
+                with stage('crop'):
+                    image = self.crop_image(image.reshape(*self.canvas_shape, 4), bbox)
+                
+            except Exception as e:
+                print(f"Fout bij het tekenen van de labels: {e}")
+                results += [(output_path, show_labels, False) for output_path, target in label_outputs]
+                continue
+            
+            results += self.save_outputs(label_outputs, show_labels, image)
+        
+        return results
+
+def get_map_template(atlas):
+    """
+    Return the map template of the atlas, creating it on first use in this process
+
+    The template draws with the engine in `atlas['engine']` ('vector' or
+    'raster'). The first template computes the label layout and stores it in the
+    atlas, so templates in worker processes and the overview map reuse it.
+    """
+    if 'map_template' not in atlas:
+        template_class = RasterMapTemplate if atlas.get('engine') == 'raster' else ThematicMapTemplate
+        with stage('template', engine=atlas.get('engine', 'vector')):
+            atlas['map_template'] = template_class(
+                atlas['waterwegregio_gdf'], atlas['data_df'], atlas['wijk_code_gdf_column'],
+                label_layout=atlas.get('label_layout'), gemeente_borders=atlas.get('gemeente_borders'),
+                level=atlas.get('level', 'wijk'), dpi=atlas.get('render_dpi', 300), encoding=atlas.get('encoding')
+            )
+        atlas['label_layout'] = atlas['map_template'].label_layout
+    return atlas['map_template']
+
+def create_single_thematic_map(template, values, column, title, source, outputs, breaks=None):
+    """
+    Create a single thematic map, saved once per (output_path, show_labels, target) output
+
+    `values` is one column of the indicator table, aligned to the index of the
+    wijken geometry, and `breaks` its class edges (None = continuous colours).
+    The map is drawn on `template` once for all outputs, so only the colours and
+    texts change between maps; the targets (print, web, thumbnail, preview, svg,
+    pdf, see output_targets.py) are saved from that one drawing. Returns a list
+    of (output_path, show_labels, success) tuples.
+    """
+    try:
+        return template.render(values, column, title, source, outputs, breaks)
         
     except Exception as e:
         print(f"Fout bij het maken van kaart: {e}")
         import traceback
         traceback.print_exc()
-        return False
+        return [(output_path, show_labels, False) for output_path, show_labels, target in outputs]
 
-def create_thematic_maps():
+def load_excel_data(level='wijk', excel_file=None):
     """
-    Creates thematic maps for all variables in the Excel file.
+    Load the workbook of an administrative level
+
+    `excel_file` replaces the workbook of the level in LEVEL_FILES; it is read
+    up to the last row with a code. Returns (data_df, metadata_df), or None
+    when the workbook has no code column.
     """
+    end_row = LEVEL_FILES[level]['end_row'] if excel_file is None else None
+    excel_path = os.path.join(script_dir, excel_file or LEVEL_FILES[level]['excel_file'])
+    
+    # Load the Excel file, or its cached tables when the file did not change
+    print(f"Laden van Excel bestand...")
     try:
-        # Load the Excel file
-        print(f"Laden van Excel bestand...")
-        excel_df = pd.read_excel(excel_path, header=None)
-        print(f"Excel bestand succesvol geladen: {excel_path}")
-        
-        # Extract metadata from specific rows
-        var_names = excel_df.iloc[0, 6:].tolist()  # From column G onwards (index 6)
-        var_titles = excel_df.iloc[1, 6:].tolist()  # Titles from row 2
-        var_sources = excel_df.iloc[2, 6:].tolist()  # Sources from row 3
-        
-        # Create a dictionary mapping variable names to their titles and sources
-        var_info = {}
-        for var_name, title, source in zip(var_names, var_titles, var_sources):
-            if pd.notna(var_name):
-                var_info[var_name] = {'title': title, 'source': source}
-        
-        # Extract only rows 5 through 35 (index 4-34)
-        data_rows = excel_df.iloc[4:35].copy()
-        # Set the header to be the first row of the Excel file (variable names)
-        data_rows.columns = excel_df.iloc[0]
-        # Reset index after slicing
-        data_df = data_rows.reset_index(drop=True)
-        
-        print(f"Data geëxtraheerd van rijen 5 t/m 35 van het Excel bestand.")
-        
-        # Check for gwb_code_10 column
-        if 'gwb_code_10' not in data_df.columns:
-            print(f"Fout: Kolom 'gwb_code_10' niet gevonden in het Excel bestand.")
-            return
+        with stage('excel', level=level):
+            data_df, metadata_df = load_wijk_data(excel_path, cache_dir=os.path.join(script_dir, cache_dir_name),
+                                                  end_row=end_row)
+    except ValueError as e:
+        print(f"Fout: {e}")
+        return None
+    print(f"Excel bestand succesvol geladen: {excel_path}")
+    
+    last_row = end_row if end_row is not None else DATA_FIRST_ROW + len(data_df)
+    print(f"Data geëxtraheerd van rijen {DATA_FIRST_ROW + 1} t/m {last_row} van het Excel bestand.")
+    
+    return data_df, metadata_df
+
+def area_columns(level='wijk'):
+    """GeoPackage attributes loaded for the areas of a level, besides their code"""
+    return list(dict.fromkeys([ADMIN_LEVELS[level]['name_column']] + gpkg_columns))
+
+def load_atlas_data(simplify=True, level='wijk'):
+    """
+    Load the Excel data and the Waterwegregio geometry of an administrative level
+
+    `level` is 'wijk', 'buurt' or 'gemeente' (see ADMIN_LEVELS and LEVEL_FILES).
+    With `simplify` the geometry is simplified to the output resolution of the
+    maps. Returns a dictionary with everything the map builders need, or None
+    when the data could not be loaded or matched.
+    """
+    level_info = ADMIN_LEVELS[level]
+    plural = level_info['plural']
+    
+    loaded = load_excel_data(level)
+    if loaded is None:
+        return None
+    data_df, metadata_df = loaded
+    
+    # Get list of codes from the Excel file
+    wijken_codes = data_df['gwb_code_10'].dropna().tolist()
+    
+    # Load only the specified areas from the layer of the level in the GeoPackage
+    print(f"Laden van {len(wijken_codes)} {plural} uit {gpkg_path}, laag '{level_info['layer']}'...")
+    try:
+        with stage('gpkg', level=level):
+            waterwegregio_gdf, wijk_code_gdf_column = load_areas(
+                gpkg_path, wijken_codes, level=level, columns=area_columns(level),
+                cache_dir=os.path.join(script_dir, cache_dir_name)
+            )
+    except ValueError as e:
+        print(e)
+        return None
+    except Exception as e:
+        print(f"Fout bij het laden van het GeoPackage bestand: {e}")
+        return None
+
+    if waterwegregio_gdf.empty:
+        print(f"Geen data gevonden voor de opgegeven {plural}. Controleer de codes.")
         
-        # Make sure ID column is treated as string
-        data_df['gwb_code_10'] = data_df['gwb_code_10'].astype(str)
-            
-        # Load the GeoPackage file, specifically the wijken layer
-        print(f"Laden van {gpkg_path}, laag 'wijken_v0'...")
-        try:
-            gdf = gpd.read_file(gpkg_path, layer='wijken_v0')
-            print("Wijken laag succesvol geladen.")
-        except Exception as e:
-            print(f"Fout bij het laden van de wijken laag: {e}")
-            # Try to load the GeoPackage without specifying a layer
-            try:
-                print("Proberen om GeoPackage te laden zonder laagnaam...")
-                gdf = gpd.read_file(gpkg_path)
-                print("GeoPackage succesvol geladen zonder laagnaam.")
-            except Exception as e2:
-                print(f"Fout bij het laden van het GeoPackage bestand: {e2}")
-                return
-
-        # Determine the correct column name for wijk code in the GeoPackage
-        if 'wk_code' in gdf.columns:
-            wijk_code_gdf_column = 'wk_code'
-        elif 'wijkcode' in gdf.columns:
-            wijk_code_gdf_column = 'wijkcode'
-        else:
-            print("Geen standaard wijkcode kolom gevonden in GeoPackage. Beschikbare kolommen:")
-            print(gdf.columns.tolist())
-            return
+        # Detailed debug info for troubleshooting
+        print(f"Excel {level}codes: {wijken_codes[:5]}...")  # Print first few codes
+        sample_gdf = gpd.read_file(gpkg_path, layer=level_info['layer'], rows=5)
+        gdf_codes = sample_gdf[wijk_code_gdf_column].astype(str).tolist()
+        print(f"GeoPackage {level}codes (eerste 5): {gdf_codes[:5]}...")
         
-        # Make sure GeoPackage ID column is treated as string for comparison
-        gdf[wijk_code_gdf_column] = gdf[wijk_code_gdf_column].astype(str)
+        return None
 
-        # Get list of wijk codes from the Excel file
-        wijken_codes = data_df['gwb_code_10'].dropna().tolist()
-        
-        # Filter for the specified wijken based on Excel data
-        print(f"Filteren op {len(wijken_codes)} wijken uit Excel data...")
-        waterwegregio_gdf = gdf[gdf[wijk_code_gdf_column].isin(wijken_codes)]
+    print(f"{len(waterwegregio_gdf)} {plural} gevonden voor de Waterwegregio.")
+    
+    return build_atlas(data_df, metadata_df, waterwegregio_gdf, wijk_code_gdf_column, simplify=simplify, level=level)
+
+def build_atlas(data_df, metadata_df, waterwegregio_gdf, wijk_code_gdf_column, simplify=True, level='wijk',
+                region=None):
+    """
+    Prepare the atlas of one region from its loaded data and geometry
 
-        if waterwegregio_gdf.empty:
-            print(f"Geen data gevonden voor de opgegeven wijken. Controleer de codes.")
+    Without a `region` this is the Waterwegregio atlas, written to the output
+    directories of the level; a region of the batch mode (see region_batch.py)
+    gets them in its own folder under `regions_dir`. Returns the atlas
+    dictionary used by the map builders.
+    """
+    if region is None:
+        region = default_region
+        output_dirs = LEVEL_FILES[level]['output_dirs']
+        manifest_path = os.path.join(script_dir, LEVEL_FILES[level]['manifest_file'])
+    else:
+        output_dirs = [f"{regions_dir}/{region['name']}/{directory}" for directory in LEVEL_FILES[level]['output_dirs']]
+        manifest_path = os.path.join(script_dir, regions_dir, region['name'], LEVEL_FILES[level]['manifest_file'])
+    
+    # Drop detail below the output resolution, shared wijk edges stay identical
+    if simplify:
+        with stage('simplify', region=region['name']):
+            waterwegregio_gdf = simplify_for_resolution(waterwegregio_gdf, dpi=300, figsize=(14, 11),
+                                                        cache_dir=os.path.join(script_dir, cache_dir_name))
+    
+    # Create the data columns list using only variables from column G onwards
+    data_columns = metadata_df['name'].tolist()
+    
+    # Join all indicators to the geometry in one pass
+    with stage('join', region=region['name']):
+        indicator_table = build_indicator_table(data_df, data_columns, waterwegregio_gdf, wijk_code_gdf_column)
+    
+    with stage('gemeenten', region=region['name']):
+        gemeente_borders = dissolve_gemeenten(waterwegregio_gdf, cache_dir=os.path.join(script_dir, cache_dir_name))
+    
+    return {
+        'level': level,
+        'region': {'name': region['name'], 'title': region['title']},
+        'output_dirs': output_dirs,
+        'manifest_path': manifest_path,
+        'waterwegregio_gdf': waterwegregio_gdf,
+        'gemeente_borders': gemeente_borders,
+        'data_df': data_df,
+        'wijk_code_gdf_column': wijk_code_gdf_column,
+        'var_info': get_var_info(metadata_df),
+        'data_columns': data_columns,
+        'indicator_table': indicator_table,
+    }
+
+def crs_identifier(crs):
+    """Stable text for a CRS, the same whether it was read from GeoPackage or GeoParquet"""
+    if crs is None:
+        return None
+    epsg = crs.to_epsg()
+    return f"EPSG:{epsg}" if epsg is not None else crs.to_wkt()
+
+def hash_map_geometry(waterwegregio_gdf, data_df, wijk_code_gdf_column, name_column='wk_naam'):
+    """
+    Hash everything that is the same on every map of a run
+
+    This covers the renderer version, the filtered geometry with its codes,
+    names and gemeenten, and the area names from the Excel data.
+    """
+    gdf_columns = [wijk_code_gdf_column] + [col for col in [name_column, 'gm_naam'] if col in waterwegregio_gdf.columns]
+    data_columns = ['gwb_code_10'] + ([name_column] if name_column in data_df.columns else [])
+    return hash_inputs(
+        RENDERER_VERSION,
+        matplotlib.__version__,
+        crs_identifier(waterwegregio_gdf.crs),
+        b''.join(shapely.to_wkb(waterwegregio_gdf.geometry.to_numpy())),
+        waterwegregio_gdf[gdf_columns].to_csv(),
+        data_df[data_columns].to_csv(),
+    )
+
+def create_indicator_maps(atlas, column):
+    """
+    Create the regular and the labelled map for one indicator column
+
+    Returns a list with a result dictionary (output_key, output_path, show_labels,
+    input_hash and status 'rendered', 'unchanged' or 'failed') per map. An empty
+    list means the column was skipped. Maps whose input hash matches the previous
+    run in `atlas['previous_outputs']` are not drawn again.
+    """
+    data_df = atlas['data_df']
+    var_info = atlas['var_info']
+    results = []
+    
+    with stage('indicator', region=atlas['region']['name'], column=column):
+        try:
+            # Skip if column is not in the dataframe
+            if column not in data_df.columns:
+                print(f"Kolom '{column}' niet gevonden in de data.")
+                return results
+            
+            # Check if the column has any valid numeric data after conversion
+            if data_df[column].isna().all():
+                print(f"Kolom '{column}' overgeslagen: bevat geen geldige numerieke data.")
+                return results
+            
+            # Print how many valid values we have
+            valid_count = data_df[column].notna().sum()
+            print(f"Kolom '{column}' heeft {valid_count} geldige numerieke waarden.")
             
-            # Detailed debug info for troubleshooting
-            print(f"Excel wijkcodes: {wijken_codes[:5]}...")  # Print first few codes
-            gdf_codes = gdf[wijk_code_gdf_column].unique().tolist()
-            print(f"GeoPackage wijkcodes (eerste 5): {gdf_codes[:5]}...")
+            # Get variable title and source
+            if column in var_info:
+                title = var_info[column]['title'] if pd.notna(var_info[column]['title']) else column
+                source = var_info[column]['source'] if pd.notna(var_info[column]['source']) else ""
+            else:
+                title = column
+                source = ""
+            
+            # Values of this indicator in geometry order
+            values = atlas['indicator_table'][column]
+            
+            # Check if we have any valid data after merging
+            if values.isna().all():
+                print(f"Kolom '{column}' overgeslagen: geen geldige data na koppeling met geometrie.")
+                return results
             
+            # Class edges of this indicator, None for continuous colours
+            breaks = atlas.get('class_breaks', {}).get(column)
+            
+            # Create output file paths for both versions and every target, with the hash of their inputs
+            values_bytes = values.to_numpy(dtype=float).tobytes()
+            for directory, show_labels in zip(atlas['output_dirs'], [False, True]):
+                for target in atlas['targets']:
+                    output_dir = target_directory(directory, target)
+                    output_file = target_file_name(column, target, atlas['encoding'])
+                    output_key = f"{output_dir}/{output_file}"
+                    output_path = os.path.join(script_dir, output_dir, output_file)
+                    # The print maps keep the hash they had before there were other targets and encodings
+                    target_inputs = [] if target == 'print' else [target, OUTPUT_TARGETS[target], atlas['render_dpi']]
+                    if not is_vector_target(target):
+                        target_inputs += encoding_inputs(atlas['encoding'])
+                    input_hash = hash_inputs(atlas['geometry_hash'], atlas['engine'], column, title, source,
+                                             show_labels, values_bytes, breaks, *target_inputs)
+                    if is_up_to_date(atlas['previous_outputs'], output_key, input_hash, output_path):
+                        status = 'unchanged'
+                    else:
+                        status = 'failed'
+                    results.append({'output_key': output_key, 'output_path': output_path, 'show_labels': show_labels,
+                                    'target': target, 'input_hash': input_hash, 'status': status})
+            
+            # Create the regular map and the map with data values in labels, for all targets, from one drawing
+            outputs = [(result['output_path'], result['show_labels'], result['target'])
+                       for result in results if result['status'] != 'unchanged']
+            if outputs:
+                rendered = create_single_thematic_map(
+                    get_map_template(atlas), values, column, title, source, outputs, breaks
+                )
+                succeeded = {output_path for output_path, show_labels, success in rendered if success}
+                for result in results:
+                    if result['output_path'] in succeeded:
+                        result['status'] = 'rendered'
+            
+        except Exception as e:
+            print(f"Fout bij het maken van kaart voor {column}: {e}")
+            import traceback
+            traceback.print_exc()
+        
+    return results
+
+def mark_writes(results, failed, unchanged):
+    """Set the status of maps whose write failed to 'failed', and of maps with unchanged contents to 'identical'"""
+    for result in results:
+        if result['output_path'] in failed:
+            result['status'] = 'failed'
+        elif result['output_path'] in unchanged and result['status'] == 'rendered':
+            result['status'] = 'identical'
+
+# Atlases of a render worker process by region name, set once by _init_render_worker()
+_worker_atlases = None
+
+def _init_render_worker(atlases, profile=None, writers=WRITER_COUNT):
+    """
+    Store the preloaded atlases in a render worker process
+
+    The worker profiles to `profile` when given and saves its maps with
+    `writers` background threads.
+    """
+    global _worker_atlases, _output_writer
+    _worker_atlases = atlases
+    _output_writer = OutputWriter(writers)
+    enable_profile(profile)
+
+def _create_indicator_maps_in_worker(task):
+    """
+    Create the maps for one (region name, column) task in a render worker process
+
+    Returns (region name, column, results, profile events of the task). The
+    maps of the task are written before it returns, the labelled map while the
+    other is being encoded.
+    """
+    name, column = task
+    
+    # Keep only the template of the current region, every template holds a full-size canvas
+    for other_name, atlas in _worker_atlases.items():
+        if other_name != name and 'map_template' in atlas:
+            atlas.pop('map_template').close()
+    results = create_indicator_maps(_worker_atlases[name], column)
+    failed, unchanged = _output_writer.wait()
+    mark_writes(results, set(failed), set(unchanged))
+    return name, column, results, drain_events()
+
+def start_atlas(atlas, force, engine, classification, classes, keep_template=True, targets=DEFAULT_TARGETS,
+                encoding=DEFAULT_ENCODING):
+    """
+    Prepare an atlas for rendering and create its overview map
+
+    Sets the previous and current outputs of the build manifest, the engine,
+    the output targets with their drawing resolution and encoding, the geometry
+    hash and the class breaks in `atlas`. The label layout is computed here and
+    kept in the atlas; `keep_template` False closes the map template afterwards,
+    so many atlases do not keep a figure each.
+    """
+    level = atlas['level']
+    region = atlas['region']
+    output_dirs = atlas['output_dirs']
+    map_dirs = [target_directory(directory, target) for target in targets for directory in output_dirs]
+    for directory in output_dirs + map_dirs:
+        os.makedirs(os.path.join(script_dir, directory), exist_ok=True)
+    
+    # Hashes of the previous run, to skip maps whose inputs did not change
+    manifest = load_manifest(atlas['manifest_path'])
+    atlas['previous_outputs'] = {} if force else manifest
+    atlas['engine'] = engine
+    atlas['targets'] = list(targets)
+    atlas['map_dirs'] = map_dirs
+    atlas['render_dpi'] = render_dpi(targets)
+    atlas['encoding'] = encoding
+    atlas['geometry_hash'] = hash_map_geometry(atlas['waterwegregio_gdf'], atlas['data_df'],
+                                               atlas['wijk_code_gdf_column'], ADMIN_LEVELS[level]['name_column'])
+    
+    # Class breaks of all indicators at once, shared with the web export through the cache
+    if classification != 'continuous':
+        with stage('classification', region=region['name'], scheme=classification):
+            atlas['class_breaks'] = class_breaks(atlas['indicator_table'], classification, classes,
+                                                 cache_dir=os.path.join(script_dir, cache_dir_name))
+        print(f"Klassenindeling '{classification}' met {classes} klassen voor "
+              f"{len(atlas['class_breaks'])} indicatoren.")
+    
+    # Maps of targets that are not made in this run stay on disk and in the manifest
+    current_outputs = {output_key: input_hash for output_key, input_hash in manifest.items()
+                       if os.path.dirname(output_key) not in map_dirs}
+    atlas['current_outputs'] = current_outputs
+    atlas['changed_outputs'] = []
+    
+    # Create the overview map for both directories
+    overview_file = overview_file_name(level, region)
+    overview_hash = hash_inputs(atlas['geometry_hash'], overview_file)
+    overview_keys = [f"{directory}/{overview_file}" for directory in output_dirs]
+    if all(is_up_to_date(atlas['previous_outputs'], key, overview_hash, os.path.join(script_dir, key))
+           for key in overview_keys):
+        print("Overzichtskaart ongewijzigd, overgeslagen.")
+        current_outputs.update({key: overview_hash for key in overview_keys})
+    else:
+        label_layout = get_map_template(atlas).label_layout
+        with stage('overview', region=region['name']):
+            changed_paths = create_overview_map(atlas['waterwegregio_gdf'], label_layout, script_dir,
+                                                output_dirs, atlas['gemeente_borders'], level, region)
+            if changed_paths is not None:
+                current_outputs.update({key: overview_hash for key in overview_keys})
+                changed_paths = {os.path.normpath(path) for path in changed_paths}
+                atlas['changed_outputs'] += [key for key in overview_keys
+                                             if os.path.normpath(os.path.join(script_dir, key)) in changed_paths]
+    
+    if not keep_template:
+        get_map_template(atlas)
+        atlas.pop('map_template').close()
+
+def finish_atlas(atlas, column_results):
+    """
+    Report the maps of one atlas, remove stale maps and save its build manifest
+
+    The maps whose bytes changed and the removed maps are also written to the
+    changes file next to the manifest (see build_manifest.save_changes()).
+    """
+    current_outputs = atlas['current_outputs']
+    changed_outputs = atlas['changed_outputs']
+    
+    # Report the result of every map
+    failed_maps = []
+    unchanged_count = 0
+    identical_count = 0
+    for column, results in column_results:
+        for result in results:
+            output_path = result['output_path']
+            if result['status'] == 'failed':
+                failed_maps.append(result['output_key'])
+                continue
+            current_outputs[result['output_key']] = result['input_hash']
+            if result['status'] == 'unchanged':
+                unchanged_count += 1
+                continue
+            if result['status'] == 'identical':
+                identical_count += 1
+                continue
+            changed_outputs.append(result['output_key'])
+            if result['show_labels']:
+                print(f"Kaart met data labels voor {column} opgeslagen als: {output_path}")
+            else:
+                print(f"Kaart voor {column} opgeslagen als: {output_path}")
+    
+    if unchanged_count:
+        print(f"{unchanged_count} kaart(en) ongewijzigd, overgeslagen.")
+    if identical_count:
+        print(f"{identical_count} kaart(en) opnieuw gemaakt maar gelijk aan het bestaande bestand, niet overschreven.")
+    
+    if failed_maps:
+        print(f"{len(failed_maps)} kaart(en) konden niet worden gemaakt:")
+        for output_key in failed_maps:
+            print(f"  {os.path.join(script_dir, output_key)}")
+    
+    # Remove maps of indicators that are no longer produced, keep failed maps for the next run
+    removed_outputs = remove_stale_outputs(script_dir, atlas['previous_outputs'], current_outputs, keep=failed_maps)
+    for output_key in removed_outputs:
+        print(f"Verouderde kaart verwijderd: {os.path.join(script_dir, output_key)}")
+    
+    save_manifest(atlas['manifest_path'], current_outputs)
+    add_output(atlas['manifest_path'])
+    try:
+        changes_file = save_changes(atlas['manifest_path'], changed_outputs, removed_outputs)
+        print(f"{len(changed_outputs)} kaart(en) gewijzigd en {len(removed_outputs)} verwijderd, "
+              f"lijst opgeslagen in: {changes_file}")
+    except OSError as e:
+        print(f"Waarschuwing: Kon lijst van gewijzigde kaarten niet schrijven: {e}")
+    
+    print(f"Alle thematische kaarten zijn opgeslagen in de mappen: {' en '.join(atlas['map_dirs'])}")
+
+def render_atlases(atlases, jobs=1, force=False, engine='vector', classification='continuous', classes=CLASS_COUNT,
+                   writers=WRITER_COUNT, targets=DEFAULT_TARGETS, encoding=DEFAULT_ENCODING):
+    """
+    Render the maps of one or more atlases, keyed by region name
+
+    All maps of all regions are rendered by one pool of `jobs` worker
+    processes, which receive the atlases once at startup and are then only
+    sent (region name, column) tasks. Every process saves its maps with
+    `writers` background threads (0 = save directly). Every map is saved to
+    all `targets` of output_targets.py, the raster targets with `encoding`.
+    """
+    global _output_writer
+    if engine == 'raster' and any(is_vector_target(target) for target in targets):
+        print("SVG en PDF kunnen alleen met de vector-tekenmethode worden gemaakt, overgeslagen.")
+        targets = [target for target in targets if not is_vector_target(target)]
+        if not targets:
             return
+    
+    for atlas in atlases.values():
+        if len(atlases) > 1:
+            print(f"Regio {atlas['region']['title']}:")
+        start_atlas(atlas, force, engine, classification, classes, keep_template=len(atlases) == 1,
+                    targets=targets, encoding=encoding)
+    
+    tasks = [(name, column) for name, atlas in atlases.items() for column in atlas['data_columns']]
+    print(f"Genereren van {len(tasks)} thematische kaarten...")
+    
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    
+    # Create thematic maps for each data column
+    if jobs > 1:
+        print(f"Kaarten worden gemaakt met {jobs} parallelle processen...")
+        
+        # The workers get the label layout with the atlas and create their own template
+        for atlas in atlases.values():
+            get_map_template(atlas)
+            atlas.pop('map_template').close()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_render_worker,
+                                 initargs=(atlases, profile_path(), writers)) as executor:
+            column_results = []
+            for name, column, results, events in executor.map(_create_indicator_maps_in_worker, tasks):
+                merge_events(events)
+                column_results.append((name, column, results))
+    else:
+        # The next map is drawn while the previous ones are encoded and written
+        _output_writer = OutputWriter(writers)
+        column_results = []
+        try:
+            for name, atlas in atlases.items():
+                column_results += [(name, column, create_indicator_maps(atlas, column))
+                                   for column in atlas['data_columns']]
+                if 'map_template' in atlas:
+                    atlas.pop('map_template').close()
+        finally:
+            failed, unchanged = _output_writer.close()
+            _output_writer = None
+        for name, column, results in column_results:
+            mark_writes(results, set(failed), set(unchanged))
+    
+    for name, atlas in atlases.items():
+        if len(atlases) > 1:
+            print(f"Regio {atlas['region']['title']}:")
+        finish_atlas(atlas, [(column, results) for region_name, column, results in column_results
+                             if region_name == name])
+
+def create_thematic_maps(jobs=1, force=False, engine='vector', simplify=True,
+                         classification='continuous', classes=CLASS_COUNT, level='wijk', writers=WRITER_COUNT,
+                         targets=DEFAULT_TARGETS, encoding=DEFAULT_ENCODING):
+    """
+    Creates thematic maps for all variables in the Excel file.
+
+    With `jobs` > 1 the indicator maps are rendered in a pool of worker processes.
+    Every worker receives the loaded geometry and indicator table once at startup
+    and is then only sent column names. `jobs` = 0 uses one worker per CPU core.
+
+    Maps whose inputs did not change since the previous run are skipped, using the
+    build manifest next to the output directories; maps of indicators that are no
+    longer in the data are removed. `force` draws all maps again.
+
+    `engine` 'raster' colours a wijk raster made once per run instead of drawing
+    the polygons of every map, which is much faster for many maps; the map layout
+    is then the same for all maps. `simplify` False draws the full GeoPackage
+    geometry instead of the geometry simplified to the output resolution.
+
+    `classification` 'continuous' stretches the colours from the minimum to the
+    maximum; a scheme of classification.SCHEMES colours the wijken in `classes`
+    classes, with breaks cached by the hash of the data.
+
+    `level` 'buurt' or 'gemeente' maps the buurten or gemeenten of their own
+    workbook instead of the wijken, into their own output directories and
+    manifest (see LEVEL_FILES). With many areas the labels are thinned.
 
-        print(f"{len(waterwegregio_gdf)} wijken gevonden voor de Waterwegregio.")
+    The PNG files are encoded and written by `writers` background threads per
+    process while the next map is drawn (see output_writer.py); 0 saves every
+    map before drawing the next.
+
+    `targets` are the outputs of output_targets.py every map is saved to, all
+    from one drawing: 'print' (300 dpi PNG, the figures directories), 'web'
+    (96 dpi WebP), 'thumbnail' (256 pixel PNG), 'preview' (72 dpi PNG, drawn at
+    72 dpi when it is the largest target) and the vector files 'svg' and 'pdf'.
+    `encoding` is the encoding of the raster targets of
+    output_targets.parse_encoding(): an indexed palette instead of RGBA, the
+    compression level and a format replacing that of the targets.
+    """
+    try:
+        atlas = load_atlas_data(simplify=simplify, level=level)
+        if atlas is None:
+            return
         
-        # Create overview maps for both directories
-        create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script_dir, output_dir)
-        create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script_dir, output_dir_labels)
+        render_atlases({atlas['region']['name']: atlas}, jobs=jobs, force=force, engine=engine,
+                       classification=classification, classes=classes, writers=writers, targets=targets,
+                       encoding=encoding)
+
+    except FileNotFoundError as e:
+        print(f"Fout: Een bestand is niet gevonden: {e}")
+    except Exception as e:
+        print(f"Er is een onverwachte fout opgetreden: {e}")
+        import traceback
+        traceback.print_exc()
+
+def create_region_atlases(regions_path, jobs=1, force=False, engine='vector', simplify=True,
+                          classification='continuous', classes=CLASS_COUNT, level='wijk', writers=WRITER_COUNT,
+                          targets=DEFAULT_TARGETS, encoding=DEFAULT_ENCODING):
+    """
+    Create the atlas of every region in a region file (see region_batch.py)
+
+    The workbook and the national layer of the level are loaded once and
+    indexed by code and gemeente code; every region is then a lookup. The maps
+    of all regions are rendered by one worker pool into regions/<name>/, each
+    region with its own build manifest. The other arguments are those of
+    create_thematic_maps().
+    """
+    try:
+        definition = load_region_definitions(regions_path)
+        plural = ADMIN_LEVELS[level]['plural']
         
-        # Create the data columns list using only variables from column G onwards
-        data_columns = [col for col in var_names if col is not None and pd.notna(col)]
+        loaded = load_excel_data(level, definition['excel_file'])
+        if loaded is None:
+            return
+        data_df, metadata_df = loaded
         
-        print(f"Genereren van {len(data_columns)} thematische kaarten...")
+        # The whole layer once, instead of one filtered read per region
+        print(f"Laden van alle {plural} uit {gpkg_path}, laag '{ADMIN_LEVELS[level]['layer']}'...")
+        with stage('gpkg', level=level):
+            national_gdf, code_column = load_areas(gpkg_path, None, level=level, columns=area_columns(level),
+                                                   cache_dir=os.path.join(script_dir, cache_dir_name))
+        print(f"{len(national_gdf)} {plural} geladen.")
+        index = build_attribute_index(national_gdf, code_column)
         
-        # Create thematic maps for each data column
-        for column in data_columns:
-            try:
-                # Skip if column is not in the dataframe
-                if column not in data_df.columns:
-                    print(f"Kolom '{column}' niet gevonden in de data.")
-                    continue
-                
-                # Try to convert the column to numeric, forcing errors to NaN
-                data_df[column] = pd.to_numeric(data_df[column], errors='coerce')
-                
-                # Check if the column has any valid numeric data after conversion
-                if data_df[column].isna().all():
-                    print(f"Kolom '{column}' overgeslagen: bevat geen geldige numerieke data.")
-                    continue
-                
-                # Print how many valid values we have
-                valid_count = data_df[column].notna().sum()
-                print(f"Kolom '{column}' heeft {valid_count} geldige numerieke waarden.")
-                
-                # Get variable title and source
-                if column in var_info:
-                    title = var_info[column]['title'] if pd.notna(var_info[column]['title']) else column
-                    source = var_info[column]['source'] if pd.notna(var_info[column]['source']) else ""
-                else:
-                    title = column
-                    source = ""
-                
-                # Create a merged geodataframe with the data column
-                merged_gdf = waterwegregio_gdf.copy()
-                merged_gdf['data_value'] = np.nan
-                
-                # Add the data values to the geodataframe
-                for idx, row in merged_gdf.iterrows():
-                    wijk_code = row[wijk_code_gdf_column]
-                    matching_rows = data_df[data_df['gwb_code_10'] == wijk_code]
-                    
-                    if not matching_rows.empty and pd.notna(matching_rows[column].iloc[0]):
-                        merged_gdf.at[idx, 'data_value'] = matching_rows[column].iloc[0]
-                
-                # Check if we have any valid data after merging
-                if merged_gdf['data_value'].isna().all():
-                    print(f"Kolom '{column}' overgeslagen: geen geldige data na koppeling met geometrie.")
-                    continue
-                
-                # Create output file paths for both versions
-                output_file = f"{column}.png"
-                output_path_regular = os.path.join(script_dir, output_dir, output_file)
-                output_path_labels = os.path.join(script_dir, output_dir_labels, output_file)
-                
-                # Create regular map (without data values in labels)
-                success_regular = create_single_thematic_map(
-                    merged_gdf, data_df, wijk_code_gdf_column, column, title, source, 
-                    output_path_regular, show_labels=False
-                )
-                
-                if success_regular:
-                    print(f"Kaart voor {column} opgeslagen als: {output_path_regular}")
-                
-                # Create map with data values in labels
-                success_labels = create_single_thematic_map(
-                    merged_gdf, data_df, wijk_code_gdf_column, column, title, source, 
-                    output_path_labels, show_labels=True
-                )
-                
-                if success_labels:
-                    print(f"Kaart met data labels voor {column} opgeslagen als: {output_path_labels}")
-                
-            except Exception as e:
-                print(f"Fout bij het maken van kaart voor {column}: {e}")
-                import traceback
-                traceback.print_exc()
+        atlases = {}
+        for region in definition['regions']:
+            region_gdf, missing = select_region(national_gdf, index, region)
+            if missing:
+                print(f"Waarschuwing: {len(missing)} code(s) van regio '{region['name']}' niet gevonden: "
+                      f"{missing[:5]}")
+            if region_gdf.empty:
+                print(f"Regio '{region['name']}' overgeslagen: geen {plural} gevonden.")
                 continue
+            print(f"Regio {region['title']}: {len(region_gdf)} {plural}.")
+            atlases[region['name']] = build_atlas(data_df, metadata_df, region_gdf, code_column,
+                                                  simplify=simplify, level=level, region=region)
+        
+        if not atlases:
+            print("Geen regio's om kaarten voor te maken.")
+            return
+        
+        render_atlases(atlases, jobs=jobs, force=force, engine=engine,
+                       classification=classification, classes=classes, writers=writers, targets=targets,
+                       encoding=encoding)
         
-        print(f"Alle thematische kaarten zijn opgeslagen in de mappen: {output_dir} en {output_dir_labels}")
-
     except FileNotFoundError as e:
         print(f"Fout: Een bestand is niet gevonden: {e}")
+    except ValueError as e:
+        print(f"Fout: {e}")
     except Exception as e:
         print(f"Er is een onverwachte fout opgetreden: {e}")
         import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
-    create_thematic_maps() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Maak thematische kaarten voor de Waterwegregio.")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="aantal parallelle processen voor het tekenen van kaarten (0 = alle CPU-kernen)")
+    parser.add_argument('--force', action='store_true',
+                        help="alle kaarten opnieuw maken, ook als de invoer niet is gewijzigd")
+    parser.add_argument('--engine', choices=['vector', 'raster'], default='vector',
+                        help="tekenmethode: 'vector' tekent de wijken per kaart, 'raster' kleurt een eenmalig "
+                             "gerasterd wijkbeeld in (veel sneller bij veel kaarten)")
+    parser.add_argument('--no-simplify', dest='simplify', action='store_false',
+                        help="teken de volledige geometrie uit het GeoPackage, zonder vereenvoudiging")
+    parser.add_argument('--classification', choices=['continuous'] + SCHEMES, default='continuous',
+                        help="kleurindeling: 'continuous' is een doorlopende schaal van minimum tot maximum, "
+                             "de andere methoden delen de waarden in klassen in")
+    parser.add_argument('--classes', type=int, default=CLASS_COUNT,
+                        help=f"aantal klassen bij een klassenindeling (standaard {CLASS_COUNT})")
+    parser.add_argument('--level', choices=list(ADMIN_LEVELS), default='wijk',
+                        help="bestuurlijk niveau van de kaarten: 'wijk' (waterweg_wijken.xlsx), 'buurt' "
+                             "(waterweg_buurten.xlsx) of 'gemeente' (waterweg_gemeenten.xlsx)")
+    parser.add_argument('--regions', metavar='BESTAND',
+                        help="JSON-bestand met regio's (zie region_batch.py): maak een atlas per regio in "
+                             f"{regions_dir}/<naam>/, met één keer laden van de landelijke laag")
+    parser.add_argument('--writers', type=int, default=WRITER_COUNT,
+                        help="aantal threads per proces dat de kaarten op de achtergrond als PNG opslaat terwijl "
+                             f"de volgende kaart wordt getekend (standaard {WRITER_COUNT}, 0 = direct opslaan)")
+    parser.add_argument('--targets', default=','.join(DEFAULT_TARGETS),
+                        help="uitvoer per kaart, kommagescheiden, uit één tekening: " + ', '.join(OUTPUT_TARGETS)
+                             + " (standaard print: PNG van 300 dpi; preview alleen tekent snel op 72 dpi)")
+    parser.add_argument('--encoding', choices=IMAGE_ENCODINGS, default=DEFAULT_ENCODING['mode'],
+                        help="codering van de rasterkaarten: rgba zoals getekend (standaard) of palette, een "
+                             "geïndexeerd palet van maximaal 256 kleuren (ongeveer de helft kleiner)")
+    parser.add_argument('--image-format', choices=IMAGE_FORMATS,
+                        help="schrijf alle rasterkaarten in dit formaat in plaats van het formaat van hun uitvoerdoel")
+    parser.add_argument('--compression', type=int, default=PNG_COMPRESSION,
+                        help=f"compressieniveau 0-9 (standaard {PNG_COMPRESSION}): zlib-niveau van PNG, "
+                             "methode van WebP en snelheid van AVIF")
+    parser.add_argument('--profile', metavar='PAD', nargs='?', const='atlas_profile',
+                        help="meet tijd en geheugen per stap en per indicator, en schrijf PAD.json en "
+                             "PAD.trace.json (Chrome/Perfetto; standaard atlas_profile, ook via de "
+                             "omgevingsvariabele ATLAS_PROFILE)")
+    args = parser.parse_args()
+    try:
+        targets = parse_targets(args.targets)
+        encoding = parse_encoding(args.encoding, args.image_format, args.compression)
+    except ValueError as e:
+        parser.error(str(e))
+    options = dict(jobs=args.jobs, force=args.force, engine=args.engine, simplify=args.simplify,
+                   classification=args.classification, classes=args.classes, level=args.level,
+                   writers=args.writers, targets=targets, encoding=encoding)
+    enable_profile(args.profile)
+    with stage('run'):
+        if args.regions:
+            create_region_atlases(args.regions, **options)
+        else:
+            create_thematic_maps(**options)
+    write_profile()
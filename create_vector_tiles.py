@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Create the vector tiles of the Waterwegregio for the web map
+
+Writes static/data/waterwegregio_wijken.pmtiles with the wijken and gemeenten
+and every numeric indicator of waterweg_wijken.xlsx, so the map can style any
+indicator from one archive instead of loading an image per indicator. Next to
+it the indicator bundle (waterwegregio_indicators.bin and .json) holds the
+values, statistics and map colours of every indicator in the same wijk order.
+Runs fully offline.
+"""
+import os
+
+from geometry_loader import load_wijken, cache_dir_name
+from excel_ingest import load_wijk_data
+from vector_tiles import write_vector_tiles, MIN_ZOOM, MAX_ZOOM
+from indicator_bundle import write_indicator_bundle
+
+# File paths
+gpkg_file = "WijkBuurtkaart_2025_v0.gpkg"
+excel_file = "waterweg_wijken.xlsx"
+output_dir = "static/data"
+output_file = "waterwegregio_wijken.pmtiles"
+
+def numeric_indicators(data_df, metadata_df):
+    """Indicator names with at least one numeric value, without duplicates, in column order"""
+    names = dict.fromkeys(name for name in metadata_df['name'] if name != 'gwb_code_10')
+    return [name for name in names if name in data_df.columns and data_df[name].notna().any()]
+
+def create_vector_tiles():
+    print("Loading wijk data from Excel...")
+    data_df, metadata_df = load_wijk_data(excel_file, cache_dir=cache_dir_name)
+    wijken_codes = data_df['gwb_code_10'].dropna().tolist()
+    print(f"Found {len(wijken_codes)} wijken codes")
+
+    # Load only the Waterwegregio wijken with their gemeente, in web mercator
+    print("Loading GeoPackage...")
+    wijken_gdf, wijk_code_column = load_wijken(gpkg_file, wijken_codes, layer='wijken_v0',
+                                               columns=['wk_naam', 'gm_code', 'gm_naam'], to_crs=3857,
+                                               cache_dir=cache_dir_name)
+    print(f"Filtered to {len(wijken_gdf)} wijken")
+
+    # Indicator values in the order of the wijken; the first row of a duplicate code is used
+    indicator_df = data_df.loc[:, ~data_df.columns.duplicated()].drop_duplicates('gwb_code_10')
+    indicators = numeric_indicators(indicator_df, metadata_df)
+    indicator_table = indicator_df.set_index('gwb_code_10')[indicators].reindex(
+        wijken_gdf[wijk_code_column].to_numpy()).astype(float)
+    indicator_info = [{'name': row.name, 'title': row.title, 'source': row.source}
+                      for row in metadata_df.drop_duplicates('name').itertuples(index=False)
+                      if row.name in indicators]
+    print(f"Found {len(indicators)} numeric indicators")
+
+    print(f"Creating vector tiles for zoom {MIN_ZOOM}-{MAX_ZOOM}...")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, output_file)
+    report = write_vector_tiles(wijken_gdf, indicator_table, indicator_info, output_path)
+
+    print(f"✓ Vector tiles written to {output_path} ({report['bytes']:,} bytes)")
+    for zoom, count in report['tiles'].items():
+        print(f"  zoom {zoom}: {count} tiles")
+
+    # Values and colours in the feature order of the tiles
+    print("Creating indicator bundle...")
+    for file_name, sizes in write_indicator_bundle(indicator_table, indicator_info,
+                                                   wijken_gdf[wijk_code_column], output_dir,
+                                                   cache_dir=cache_dir_name):
+        print(f"✓ {os.path.join(output_dir, file_name)} ({sizes['raw']:,} bytes, {sizes['gz']:,} gzip)")
+
+    return True
+
+if __name__ == "__main__":
+    try:
+        create_vector_tiles()
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        exit(1)
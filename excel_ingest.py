@@ -0,0 +1,170 @@
+"""
+Read the wijk data from waterweg_wijken.xlsx
+
+The workbook layout is fixed: variable names in row 1, titles in row 2, sources
+in row 3 and the data from row 5, with the indicators starting in column G and
+the area code in the column named 'gwb_code_10'. The wijk workbook has its wijken
+in rows 5 through 35; workbooks with buurten or gemeenten are read up to the
+last row with a code.
+
+The sheet is streamed in read-only mode and only the rows above are read. The
+result is a typed data table (wijk code as string, indicators as float) and a
+metadata table with the name, title and source of every indicator. Both are
+stored as a Parquet sidecar in the cache directory, keyed by the hash of the
+workbook, so later runs skip openpyxl entirely. Caching needs pyarrow.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from geometry_loader import parquet_available
+
+# Layout of the workbook (0-based)
+NAME_ROW = 0
+TITLE_ROW = 1
+SOURCE_ROW = 2
+DATA_FIRST_ROW = 4
+DATA_END_ROW = 35
+FIRST_INDICATOR_COLUMN = 6
+WIJK_CODE_COLUMN = 'gwb_code_10'
+
+# Increase when the layout of the cached tables changes
+INGEST_VERSION = 1
+
+def _file_hash(path):
+    """SHA-256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cell_value(value):
+    """Convert an openpyxl cell value like pandas.read_excel does"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _read_sheet_rows(excel_path, end_row=DATA_END_ROW):
+    """Stream the first `end_row` rows of the first sheet (None = all), returns a list of row tuples"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        return [tuple(_cell_value(value) for value in row)
+                for row in sheet.iter_rows(min_row=1, max_row=end_row, values_only=True)]
+    finally:
+        workbook.close()
+
+def _build_tables(rows, end_row=DATA_END_ROW):
+    """Build the typed data table and the metadata table from the raw sheet rows"""
+    width = max((len(row) for row in rows), default=0)
+    rows = [list(row) + [None] * (width - len(row)) for row in rows]
+    rows += [[None] * width for _ in range(max(0, SOURCE_ROW + 1 - len(rows)))]
+
+    names = [None if pd.isna(name) else str(name) for name in rows[NAME_ROW]]
+    if WIJK_CODE_COLUMN not in names:
+        raise ValueError(f"Kolom '{WIJK_CODE_COLUMN}' niet gevonden in het Excel bestand.")
+
+    # Metadata of the indicators, from column G onwards
+    metadata_df = pd.DataFrame({
+        'name': names[FIRST_INDICATOR_COLUMN:],
+        'title': rows[TITLE_ROW][FIRST_INDICATOR_COLUMN:],
+        'source': rows[SOURCE_ROW][FIRST_INDICATOR_COLUMN:],
+    })
+    metadata_df = metadata_df[metadata_df['name'].notna()].reset_index(drop=True)
+    for column in ['title', 'source']:
+        metadata_df[column] = [None if pd.isna(value) else str(value) for value in metadata_df[column]]
+
+    # Data rows with positional columns, the names may contain duplicates or gaps;
+    # without an end row the data stops at the last row with a code
+    data_rows = rows[DATA_FIRST_ROW:end_row]
+    if end_row is None:
+        code_position = names.index(WIJK_CODE_COLUMN)
+        with_code = [i for i, row in enumerate(data_rows) if not pd.isna(row[code_position])]
+        data_rows = data_rows[:with_code[-1] + 1] if with_code else []
+    data_df = pd.DataFrame(data_rows, columns=range(width), dtype=object)
+    for position in range(width):
+        column = data_df[position]
+        if position >= FIRST_INDICATOR_COLUMN and names[position] != WIJK_CODE_COLUMN:
+            data_df[position] = pd.to_numeric(column, errors='coerce').astype(float)
+        elif names[position] == WIJK_CODE_COLUMN:
+            # Make sure ID column is treated as string
+            data_df[position] = column.astype(str)
+        else:
+            data_df[position] = [None if pd.isna(value) else str(value) for value in column]
+    data_df.columns = names
+
+    return data_df, metadata_df
+
+def _sidecar_paths(excel_path, cache_dir, end_row=DATA_END_ROW):
+    """Paths of the cached tables for the current workbook contents"""
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+    key = f"{_file_hash(excel_path)[:16]}_v{INGEST_VERSION}"
+    if end_row != DATA_END_ROW:
+        key += f"_{'all' if end_row is None else end_row}"
+    return {table: os.path.join(cache_dir, f"{stem}_{key}_{table}.parquet")
+            for table in ['data', 'columns', 'metadata']}
+
+def _write_sidecar(data_df, metadata_df, sidecar):
+    """Store the tables as Parquet, the data with positional column names"""
+    stored_df = data_df.copy()
+    stored_df.columns = [str(position) for position in range(data_df.shape[1])]
+    columns_df = pd.DataFrame({'name': list(data_df.columns)}, dtype=object)
+
+    os.makedirs(os.path.dirname(sidecar['data']), exist_ok=True)
+    for df, table in [(stored_df, 'data'), (columns_df, 'columns'), (metadata_df, 'metadata')]:
+        tmp_path = f"{sidecar[table]}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, sidecar[table])
+
+def _read_sidecar(sidecar):
+    """Read the cached tables, restoring the original column names of the data"""
+    data_df = pd.read_parquet(sidecar['data'])
+    columns_df = pd.read_parquet(sidecar['columns'])
+    data_df.columns = [None if pd.isna(name) else name for name in columns_df['name']]
+    metadata_df = pd.read_parquet(sidecar['metadata'])
+    return data_df, metadata_df
+
+def load_wijk_data(excel_path, cache_dir=None, end_row=DATA_END_ROW):
+    """
+    Load the wijk data and the indicator metadata from the workbook
+
+    Returns (data_df, metadata_df). `data_df` has one row per area (rows 5 through
+    `end_row`, None = up to the last row with a code), the variable names as
+    columns, the code as string and every indicator as float (non-numeric cells
+    become NaN). `metadata_df` has the
+    columns 'name', 'title' and 'source' for every named indicator in column
+    order. With a `cache_dir` the tables are cached as Parquet, keyed by the hash
+    of the workbook. Raises ValueError when there is no wijk code column.
+    """
+    sidecar = None
+    if cache_dir is not None and parquet_available():
+        sidecar = _sidecar_paths(excel_path, cache_dir, end_row)
+
+    if sidecar is not None and all(os.path.exists(path) for path in sidecar.values()):
+        try:
+            return _read_sidecar(sidecar)
+        except Exception as e:
+            print(f"Waarschuwing: Kon Excel cache niet lezen: {e}")
+
+    data_df, metadata_df = _build_tables(_read_sheet_rows(excel_path, end_row), end_row)
+
+    if sidecar is not None:
+        try:
+            _write_sidecar(data_df, metadata_df, sidecar)
+        except Exception as e:
+            print(f"Waarschuwing: Kon Excel cache niet schrijven: {e}")
+
+    return data_df, metadata_df
+
+def get_var_info(metadata_df):
+    """Map every indicator name to its title and source, as used by the map builders"""
+    return {
+        row.name: {'title': np.nan if pd.isna(row.title) else row.title,
+                   'source': np.nan if pd.isna(row.source) else row.source}
+        for row in metadata_df.itertuples(index=False)
+    }
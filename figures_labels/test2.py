@@ -12,6 +12,7 @@ import matplotlib.patches as mpatches
 from matplotlib.patches import FancyBboxPatch
 from matplotlib.offsetbox import AnchoredText
 import matplotlib.patheffects as path_effects
+import sys
 
 # Define the input file names
 gpkg_file = "WijkBuurtkaart_2025_v0.gpkg"
@@ -24,6 +25,12 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 gpkg_path = os.path.join(script_dir, gpkg_file)
 excel_path = os.path.join(script_dir, excel_file)
 
+# Shared loaders live in the project root
+sys.path.insert(0, os.path.dirname(script_dir))
+from excel_ingest import load_wijk_data, get_var_info
+from geometry_loader import cache_dir_name
+from geometry_simplify import simplify_for_resolution
+
 # Ensure the output directories exist (relative to script directory)
 for directory in [output_dir, output_dir_labels]:
     full_dir_path = os.path.join(script_dir, directory)
@@ -419,38 +426,20 @@ def create_thematic_maps():
     Creates thematic maps for all variables in the Excel file.
     """
     try:
-        # Load the Excel file
+        # Load the Excel file, or its cached tables when the file did not change
         print(f"Laden van Excel bestand...")
-        excel_df = pd.read_excel(excel_path, header=None)
+        try:
+            data_df, metadata_df = load_wijk_data(excel_path, cache_dir=os.path.join(script_dir, cache_dir_name))
+        except ValueError as e:
+            print(f"Fout: {e}")
+            return
         print(f"Excel bestand succesvol geladen: {excel_path}")
         
-        # Extract metadata from specific rows
-        var_names = excel_df.iloc[0, 6:].tolist()  # From column G onwards (index 6)
-        var_titles = excel_df.iloc[1, 6:].tolist()  # Titles from row 2
-        var_sources = excel_df.iloc[2, 6:].tolist()  # Sources from row 3
-        
-        # Create a dictionary mapping variable names to their titles and sources
-        var_info = {}
-        for var_name, title, source in zip(var_names, var_titles, var_sources):
-            if pd.notna(var_name):
-                var_info[var_name] = {'title': title, 'source': source}
-        
-        # Extract only rows 5 through 35 (index 4-34)
-        data_rows = excel_df.iloc[4:35].copy()
-        # Set the header to be the first row of the Excel file (variable names)
-        data_rows.columns = excel_df.iloc[0]
-        # Reset index after slicing
-        data_df = data_rows.reset_index(drop=True)
+        # Variable names from column G onwards, with their titles and sources
+        var_names = metadata_df['name'].tolist()
+        var_info = get_var_info(metadata_df)
         
         print(f"Data geëxtraheerd van rijen 5 t/m 35 van het Excel bestand.")
-        
-        # Check for gwb_code_10 column
-        if 'gwb_code_10' not in data_df.columns:
-            print(f"Fout: Kolom 'gwb_code_10' niet gevonden in het Excel bestand.")
-            return
-        
-        # Make sure ID column is treated as string
-        data_df['gwb_code_10'] = data_df['gwb_code_10'].astype(str)
             
         # Load the GeoPackage file, specifically the wijken layer
         print(f"Laden van {gpkg_path}, laag 'wijken_v0'...")
@@ -500,6 +489,10 @@ def create_thematic_maps():
 
         print(f"{len(waterwegregio_gdf)} wijken gevonden voor de Waterwegregio.")
         
+        # Drop detail below the output resolution, shared wijk edges stay identical
+        waterwegregio_gdf = simplify_for_resolution(waterwegregio_gdf, dpi=300, figsize=(14, 11),
+                                                    cache_dir=os.path.join(script_dir, cache_dir_name))
+        
         # Create overview maps for both directories
         create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script_dir, output_dir)
         create_overview_map(waterwegregio_gdf, data_df, wijk_code_gdf_column, script_dir, output_dir_labels)
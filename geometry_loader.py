@@ -0,0 +1,158 @@
+"""
+Load Waterwegregio wijken, buurten or gemeenten from the national WijkBuurtkaart GeoPackage
+
+ADMIN_LEVELS describes the layer, code and name columns of every administrative
+level. The code filter and the column selection are pushed down into the read as
+an attribute WHERE clause, so only the areas of the region are parsed instead
+of every area in the Netherlands. The filtered (and optionally reprojected)
+result is cached as GeoParquet, keyed by the size and modification time of the
+GeoPackage and the requested codes, columns and CRS, so warm starts read a few
+kilobytes instead of the national file.
+
+Caching needs pyarrow; without it the loader still filters during the read.
+"""
+import os
+
+import geopandas as gpd
+
+from build_manifest import hash_inputs
+
+# Directory for cached intermediate results, relative to the calling script
+cache_dir_name = ".atlas_cache"
+
+# GeoPackage layer, code columns (per WijkBuurtkaart version) and name column per
+# administrative level, with the names used in messages and map titles
+ADMIN_LEVELS = {
+    'wijk': {'layer': 'wijken_v0', 'code_columns': ['wk_code', 'wijkcode'], 'name_column': 'wk_naam',
+             'singular': 'wijk', 'plural': 'wijken'},
+    'buurt': {'layer': 'buurten_v0', 'code_columns': ['bu_code', 'buurtcode'], 'name_column': 'bu_naam',
+              'singular': 'buurt', 'plural': 'buurten'},
+    'gemeente': {'layer': 'gemeenten_v0', 'code_columns': ['gm_code', 'gemeentecode'], 'name_column': 'gm_naam',
+                 'singular': 'gemeente', 'plural': 'gemeenten'},
+}
+
+# Column names for the wijk code used by the different WijkBuurtkaart versions
+WIJK_CODE_COLUMNS = ADMIN_LEVELS['wijk']['code_columns']
+
+def _find_code_column(columns, level='wijk'):
+    """Determine the correct column name for the code of `level` in the GeoPackage"""
+    for column in ADMIN_LEVELS[level]['code_columns']:
+        if column in columns:
+            return column
+    raise ValueError(f"Geen standaard {level}code kolom gevonden in GeoPackage. "
+                     f"Beschikbare kolommen: {list(columns)}")
+
+def _read_layer_columns(gpkg_path, layer):
+    """Read the first feature to find the columns of a layer, returns (layer, columns)"""
+    try:
+        sample = gpd.read_file(gpkg_path, layer=layer, rows=1)
+    except Exception as e:
+        if layer is None:
+            raise
+        print(f"Fout bij het laden van de laag '{layer}': {e}")
+        print("Proberen om GeoPackage te laden zonder laagnaam...")
+        layer = None
+        sample = gpd.read_file(gpkg_path, rows=1)
+    return layer, [col for col in sample.columns if col != sample.geometry.name]
+
+def _sql_string_list(values):
+    """Format values as a quoted SQL list for a WHERE clause"""
+    return ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+
+def parquet_available():
+    """Check whether GeoParquet can be read and written"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def load_areas(gpkg_path, codes, level='wijk', layer=None, columns=None, to_crs=None, cache_dir=None):
+    """
+    Load the areas of an administrative level with the given codes from a WijkBuurtkaart GeoPackage
+
+    Parameters
+    ----------
+    gpkg_path : path of the GeoPackage
+    codes : codes to load, compared as strings (None = every area of the layer)
+    level : key of ADMIN_LEVELS ('wijk', 'buurt' or 'gemeente')
+    layer : layer name (None = the layer of the level); when it cannot be read
+        the default layer is used
+    columns : attribute columns to load besides the code (None = all);
+        columns the layer does not have are ignored
+    to_crs : CRS to project the result to (None = keep the GeoPackage CRS)
+    cache_dir : directory for the GeoParquet cache (None = no caching)
+
+    Returns (GeoDataFrame, name of the code column). The code column holds
+    strings and the rows are in GeoPackage order. Raises ValueError when the
+    layer has no known code column for the level.
+    """
+    if layer is None:
+        layer = ADMIN_LEVELS[level]['layer']
+    plural = ADMIN_LEVELS[level]['plural']
+    if codes is not None:
+        codes = sorted({str(code) for code in codes})
+
+    # The cache key covers the file version and everything that shapes the result
+    cache_path = None
+    if cache_dir is not None and parquet_available():
+        stat = os.stat(gpkg_path)
+        cache_key = hash_inputs(os.path.abspath(gpkg_path), stat.st_size, stat.st_mtime_ns,
+                                layer, codes, columns, str(to_crs))
+        cache_path = os.path.join(cache_dir, f"{plural}_{cache_key[:16]}.parquet")
+        if os.path.exists(cache_path):
+            try:
+                gdf = gpd.read_parquet(cache_path)
+                print(f"{len(gdf)} {plural} geladen uit cache: {cache_path}")
+                return gdf, _find_code_column(gdf.columns, level)
+            except Exception as e:
+                print(f"Waarschuwing: Kon cache {cache_path} niet lezen: {e}")
+
+    layer, layer_columns = _read_layer_columns(gpkg_path, layer)
+    code_column = _find_code_column(layer_columns, level)
+
+    read_columns = [code_column] + [
+        col for col in (layer_columns if columns is None else columns)
+        if col in layer_columns and col != code_column
+    ]
+
+    # Let the driver filter on code, so only the requested areas are parsed
+    if codes is None:
+        where = None
+    else:
+        where = f"{code_column} IN ({_sql_string_list(codes)})" if codes else "0 = 1"
+    try:
+        gdf = gpd.read_file(gpkg_path, layer=layer, columns=read_columns, where=where)
+    except Exception as e:
+        print(f"Waarschuwing: Filteren tijdens het laden mislukt ({e}), hele laag wordt geladen...")
+        gdf = gpd.read_file(gpkg_path, layer=layer)
+        gdf = gdf[read_columns + [gdf.geometry.name]]
+
+    # Make sure GeoPackage ID column is treated as string for comparison
+    gdf[code_column] = gdf[code_column].astype(str)
+    if codes is not None:
+        gdf = gdf[gdf[code_column].isin(codes)]
+    gdf = gdf.reset_index(drop=True)
+
+    if to_crs is not None:
+        gdf = gdf.to_crs(to_crs)
+
+    if cache_path is not None and not gdf.empty:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            gdf.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Waarschuwing: Kon cache {cache_path} niet schrijven: {e}")
+
+    return gdf, code_column
+
+def load_wijken(gpkg_path, wijken_codes, layer='wijken_v0', columns=None, to_crs=None, cache_dir=None):
+    """
+    Load the wijken with the given codes from a WijkBuurtkaart GeoPackage
+
+    See load_areas(). Returns (GeoDataFrame, name of the wijk code column).
+    """
+    return load_areas(gpkg_path, wijken_codes, level='wijk', layer=layer, columns=columns,
+                      to_crs=to_crs, cache_dir=cache_dir)
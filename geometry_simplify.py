@@ -0,0 +1,135 @@
+"""
+Simplify the wijk geometry to the resolution of the maps
+
+The GeoPackage geometry has many vertices closer together than one output pixel,
+which only costs drawing time. The wijken are simplified as a coverage
+(shapely.coverage_simplify), so the edge shared by two wijken is simplified once
+and stays identical on both sides: no slivers or gaps appear between wijken.
+
+The tolerance is half an output pixel, computed from the map extent, the figure
+size and the DPI. The result is cached as GeoParquet, keyed by the geometry,
+the DPI and the extent. Caching needs pyarrow.
+"""
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from build_manifest import hash_inputs
+from geometry_loader import parquet_available
+
+# Increase when the simplification itself changes
+SIMPLIFY_VERSION = 1
+
+def pixel_size(bounds, figsize, dpi):
+    """
+    Size of one output pixel in map units
+
+    The map is never larger than the figure, so this is a lower bound of the
+    real pixel size and the simplification stays below the visible resolution.
+    """
+    minx, miny, maxx, maxy = bounds
+    width, height = figsize
+    return max((maxx - minx) / (width * dpi), (maxy - miny) / (height * dpi))
+
+def simplify_coverage(geometries, tolerance):
+    """Simplify the geometries as a coverage, or one by one when they do not form a valid coverage"""
+    if not hasattr(shapely, 'coverage_simplify'):
+        print("Waarschuwing: shapely 2.1 of nieuwer is nodig om wijken als dekking te vereenvoudigen, "
+              "gedeelde grenzen worden per wijk vereenvoudigd.")
+    elif shapely.coverage_is_valid(geometries):
+        return shapely.coverage_simplify(geometries, tolerance, simplify_boundary=True)
+    else:
+        print("Waarschuwing: Wijken vormen geen geldige dekking (overlap of gaten), "
+              "gedeelde grenzen worden per wijk vereenvoudigd.")
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+def _draw_time(geometries, bounds, figsize, dpi, crs):
+    """Time to draw the wijken at the output resolution, in seconds"""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    gpd.GeoSeries(geometries, crs=crs).plot(ax=ax, edgecolor='#2c3e50', linewidth=0.8)
+    ax.set_xlim(bounds[0], bounds[2])
+    ax.set_ylim(bounds[1], bounds[3])
+    start = time.perf_counter()
+    canvas.draw()
+    return time.perf_counter() - start
+
+def _format_count(count):
+    """Format a count with a dot as thousands separator"""
+    return f"{count:,}".replace(',', '.')
+
+def _format_seconds(seconds):
+    """Format a duration in seconds with a decimal comma"""
+    return f"{seconds:.2f}".replace('.', ',')
+
+def _format_number(value):
+    """Format a value with three significant digits and a decimal comma"""
+    return f"{value:.3g}".replace('.', ',')
+
+def simplify_for_resolution(gdf, dpi, figsize, cache_dir=None, pixel_fraction=0.5):
+    """
+    Return a copy of `gdf` with the geometry simplified to the output resolution
+
+    Parameters
+    ----------
+    gdf : GeoDataFrame with the wijken, in a CRS with the map units
+    dpi : resolution the maps are saved with
+    figsize : (width, height) of the map figure in inches
+    cache_dir : directory for the GeoParquet cache (None = no caching)
+    pixel_fraction : tolerance as a fraction of one output pixel
+
+    Prints the vertex reduction and, when the simplification is computed, the
+    time saved on drawing the wijken once.
+    """
+    geometries = gdf.geometry.to_numpy()
+    bounds = tuple(float(value) for value in gdf.total_bounds)
+    tolerance = pixel_fraction * pixel_size(bounds, figsize, dpi)
+
+    cache_path = None
+    if cache_dir is not None and parquet_available():
+        cache_key = hash_inputs(SIMPLIFY_VERSION, b''.join(shapely.to_wkb(geometries)),
+                                dpi, tuple(figsize), bounds, pixel_fraction)
+        cache_path = os.path.join(cache_dir, f"simplified_{cache_key[:16]}.parquet")
+
+    simplified = None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            simplified = gpd.read_parquet(cache_path).geometry.to_numpy()
+        except Exception as e:
+            print(f"Waarschuwing: Kon cache {cache_path} niet lezen: {e}")
+
+    original_count = int(shapely.get_num_coordinates(geometries).sum())
+    if simplified is not None and len(simplified) == len(geometries):
+        simplified_count = int(shapely.get_num_coordinates(simplified).sum())
+        print(f"Vereenvoudigde geometrie geladen uit cache: {_format_count(original_count)} -> "
+              f"{_format_count(simplified_count)} punten.")
+    else:
+        simplified = simplify_coverage(geometries, tolerance)
+        simplified_count = int(shapely.get_num_coordinates(simplified).sum())
+
+        # Measure what the simplification saves on drawing all wijken once
+        original_time = _draw_time(geometries, bounds, figsize, dpi, gdf.crs)
+        simplified_time = _draw_time(simplified, bounds, figsize, dpi, gdf.crs)
+        reduction = 100 * (1 - simplified_count / original_count) if original_count else 0
+        print(f"Geometrie vereenvoudigd tot {_format_number(tolerance)} kaarteenheden ({pixel_fraction:g} pixel bij {dpi} dpi): "
+              f"{_format_count(original_count)} -> {_format_count(simplified_count)} punten (-{reduction:.0f}%), "
+              f"tekentijd wijken {_format_seconds(original_time)} s -> {_format_seconds(simplified_time)} s.")
+
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.tmp"
+                gpd.GeoDataFrame(geometry=simplified, crs=gdf.crs).to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, cache_path)
+            except Exception as e:
+                print(f"Waarschuwing: Kon cache {cache_path} niet schrijven: {e}")
+
+    result = gdf.copy()
+    result[gdf.geometry.name] = gpd.GeoSeries(np.asarray(simplified), index=gdf.index, crs=gdf.crs)
+    return result
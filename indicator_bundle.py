@@ -0,0 +1,128 @@
+"""
+Indicator bundle for the web map
+
+write_indicator_bundle() writes the indicator values of all wijken next to the
+vector tiles, so the web map switches between indicators without fetching or
+computing anything per indicator:
+
+- <name>.bin: one ArrayBuffer with, per indicator, the values as float32 (NaN
+  for no data), followed by the colour of every wijk as RGBA bytes
+- <name>.json: the wijk codes in the feature order of the tiles, the colour
+  ramps, and per indicator its statistics, colour scale, class edges of every
+  classification scheme and byte ranges in the .bin file
+
+The colours are computed with the colour scale of the PNG maps (colour_scale.py),
+so the web map shows the same colours. Wijken without data get transparent black.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from colour_scale import COLOUR_RAMPS, COLOUR_COUNT, FACE_ALPHA, get_colormap, get_colour_scale
+from classification import class_breaks, SCHEMES, CLASS_COUNT
+from web_boundary import minified_json, write_with_sidecars
+
+# Increase when the layout of the bundle changes
+BUNDLE_VERSION = 1
+
+# Quantiles in the statistics of every indicator, the breaks of five equal-count classes
+QUANTILES = [0.2, 0.4, 0.6, 0.8]
+
+def _hex_colours(cmap):
+    """All colours of a colormap as hex strings"""
+    return ['#%02x%02x%02x' % tuple(rgba[:3]) for rgba in cmap(np.arange(cmap.N), bytes=True)]
+
+def _number(value):
+    """Plain float for JSON, None for NaN"""
+    return None if pd.isna(value) else float(value)
+
+def indicator_scale(values):
+    """
+    Statistics and colour scale of one indicator
+
+    Returns (statistics dict, RGBA uint8 array with a colour per value), or
+    None when the indicator has no valid values.
+    """
+    valid = values[~np.isnan(values)]
+    if len(valid) == 0:
+        return None
+
+    vmin, vmax = float(valid.min()), float(valid.max())
+    cmap, norm = get_colour_scale(vmin, vmax)
+    colours = np.zeros((len(values), 4), dtype=np.uint8)
+    has_value = ~np.isnan(values)
+    colours[has_value] = cmap(norm(values[has_value]), bytes=True)
+    colours[has_value, 3] = round(FACE_ALPHA * 255)
+
+    statistics = {
+        'count': int(len(valid)),
+        'min': vmin,
+        'max': vmax,
+        'mean': float(valid.mean()),
+        'quantiles': [float(value) for value in np.quantile(valid, QUANTILES)],
+        'diverging': bool(vmin < 0 < vmax),
+        'ramp': cmap.name,
+        'norm': {'vmin': _number(norm.vmin), 'vcenter': _number(getattr(norm, 'vcenter', None)),
+                 'vmax': _number(norm.vmax)},
+    }
+    return statistics, colours
+
+def write_indicator_bundle(indicator_table, indicator_info, wijk_codes, output_dir, name="waterwegregio_indicators",
+                           cache_dir=None):
+    """
+    Write the indicator bundle of the wijken
+
+    Parameters
+    ----------
+    indicator_table : float DataFrame with one row per wijk, in the feature order
+        of the tiles, and one column per indicator
+    indicator_info : list with a dictionary per indicator ('name', 'title' and 'source')
+    wijk_codes : wijk code per row of `indicator_table`
+    output_dir : directory of the bundle files
+    cache_dir : cache directory of the class breaks, None to always compute them
+
+    Returns a list of (file name, byte counts) tuples.
+    """
+    info = {item['name']: item for item in indicator_info}
+    breaks = {scheme: class_breaks(indicator_table, scheme, CLASS_COUNT, cache_dir=cache_dir) for scheme in SCHEMES}
+    count = len(indicator_table)
+    value_parts, colour_parts, indicators = [], [], []
+
+    for column in indicator_table.columns:
+        values = indicator_table[column].to_numpy(dtype=float)
+        scale = indicator_scale(values)
+        if scale is None:
+            continue
+        statistics, colours = scale
+        indicators.append({'name': column, 'title': info.get(column, {}).get('title'),
+                           'source': info.get(column, {}).get('source'), **statistics,
+                           'classes': {scheme: breaks[scheme][str(column)] for scheme in SCHEMES}})
+        value_parts.append(values.astype('<f4').tobytes())
+        colour_parts.append(colours.tobytes())
+
+    # All values first, so every float32 array starts at a multiple of 4 bytes
+    values_size = 4 * count
+    colours_start = values_size * len(indicators)
+    for i, indicator in enumerate(indicators):
+        indicator['values'] = {'offset': i * values_size, 'length': count}
+        indicator['colours'] = {'offset': colours_start + i * 4 * count, 'length': 4 * count}
+
+    ramps = {ramp: {'stops': stops, 'colours': _hex_colours(get_colormap(ramp))}
+             for ramp, stops in COLOUR_RAMPS.items()}
+
+    metadata = {
+        'version': BUNDLE_VERSION,
+        'data': f"{name}.bin",
+        'wijken': [str(code) for code in wijk_codes],
+        'colour_count': COLOUR_COUNT,
+        'class_count': CLASS_COUNT,
+        'ramps': ramps,
+        'indicators': indicators,
+    }
+
+    report = []
+    for file_name, data in [(f"{name}.bin", b''.join(value_parts + colour_parts)),
+                            (f"{name}.json", minified_json(metadata))]:
+        report.append((file_name, write_with_sidecars(os.path.join(output_dir, file_name), data)))
+    return report
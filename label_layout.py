@@ -0,0 +1,180 @@
+"""
+Label layout for the wijk labels on the maps
+
+The layout runs once per geometry set and is shared by the overview map and all
+thematic maps, which only set the label texts:
+
+1. Names: every wijk gets its name from the Excel data, falling back to the
+   GeoPackage name and then to "Wijk <code>" (or buurt, gemeente).
+2. Anchors: the centroid when it lies inside the wijk, otherwise the pole of
+   inaccessibility, so labels of concave or waterfront wijken stay on land.
+3. Collisions: labels are placed greedily, smallest wijk first, at the first
+   candidate position around the anchor (inside the wijk) whose box does not
+   overlap a label placed before. Neighbouring labels are found with an STRtree
+   of the label boxes, so the cost stays close to linear in the number of wijken.
+4. Thinning: with many areas (buurten) the labels are thinned where they are
+   too dense. The largest areas are placed first and a label that overlaps at
+   every candidate position is left out, so dense clusters of small areas keep
+   only the labels that fit.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.ops import polylabel
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Style of the wijk labels, shared with place_labels_optimized()
+LABEL_FONTSIZE = 7
+LABEL_FONTWEIGHT = '600'
+LABEL_PAD = 0.4
+
+# Widest data value expected in a label, used to reserve room for the second line
+VALUE_PLACEHOLDER = '00.000,0'
+
+# Labels are thinned by default when a map has more areas than this
+THIN_LABEL_COUNT = 100
+
+# Candidate offsets around the anchor, in label widths and heights
+CANDIDATE_OFFSETS = [(0, 0), (0, 0.6), (0, -0.6), (0.6, 0), (-0.6, 0),
+                     (0.6, 0.6), (-0.6, 0.6), (0.6, -0.6), (-0.6, -0.6),
+                     (0, 1.2), (0, -1.2), (1.2, 0), (-1.2, 0)]
+
+def label_names(gdf, data_df, wijk_code_gdf_column, name_column='wk_naam', fallback_prefix='Wijk'):
+    """Name of every area in `gdf` from the `name_column` of the data or the geometry, as a Series aligned to its index"""
+    codes = gdf[wijk_code_gdf_column].astype(str)
+    names = pd.Series(np.nan, index=gdf.index, dtype=object)
+
+    if name_column in data_df.columns:
+        excel_names = data_df.drop_duplicates('gwb_code_10').set_index('gwb_code_10')[name_column]
+        names = codes.map(excel_names).astype(object)
+    if name_column in gdf.columns:
+        names = names.where(names.notna(), gdf[name_column])
+
+    fallback = f"{fallback_prefix} " + codes
+    return names.where(names.notna(), fallback).astype(str)
+
+def label_anchors(geometries):
+    """Anchor point per geometry: the centroid when inside, otherwise the pole of inaccessibility"""
+    geometries = np.asarray(geometries)
+    centroids = shapely.centroid(geometries)
+    inside = shapely.contains(geometries, centroids)
+
+    x = shapely.get_x(centroids)
+    y = shapely.get_y(centroids)
+    for i in np.flatnonzero(~inside):
+        geometry = geometries[i]
+        if geometry is None or geometry.is_empty:
+            continue
+        # Use the largest part of a multipolygon
+        parts = shapely.get_parts(geometry)
+        part = parts[np.argmax(shapely.area(parts))]
+        tolerance = max(np.sqrt(part.area) / 100, 1e-9)
+        point = polylabel(part, tolerance=tolerance)
+        x[i], y[i] = point.x, point.y
+    return x, y
+
+def measure_label_boxes(names, fontsize=LABEL_FONTSIZE, fontweight=LABEL_FONTWEIGHT, pad=LABEL_PAD):
+    """
+    Size in points of the label box of every name, including the bbox padding
+
+    The box is measured for a label with a data value on a second line, the
+    largest label drawn at a position, so positions can be shared by all maps.
+    """
+    fig = Figure(dpi=72)
+    renderer = FigureCanvasAgg(fig).get_renderer()
+    text = fig.text(0, 0, "", fontsize=fontsize, fontweight=fontweight, fontfamily='sans-serif')
+
+    sizes = np.zeros((len(names), 2))
+    for i, name in enumerate(names):
+        text.set_text(f"{name}\n{VALUE_PLACEHOLDER}")
+        extent = text.get_window_extent(renderer)
+        sizes[i] = extent.width, extent.height
+    return sizes + 2 * pad * fontsize
+
+def resolve_label_collisions(geometries, anchor_x, anchor_y, widths, heights, thin=False):
+    """
+    Move labels away from each other where their boxes overlap
+
+    Returns the label positions (x, y) and a boolean array of the labels to
+    show. Every label stays at a point inside its own wijk; when no free
+    position exists the one with the least overlap is used, or with `thin` the
+    label is left out.
+    """
+    geometries = np.asarray(geometries)
+    count = len(geometries)
+    x = np.array(anchor_x, dtype=float)
+    y = np.array(anchor_y, dtype=float)
+    visible = np.ones(count, dtype=bool)
+    if count == 0:
+        return x, y, visible
+
+    # Boxes that contain every candidate box of a label, to find its neighbours
+    reach_x = widths * (0.5 + max(abs(dx) for dx, dy in CANDIDATE_OFFSETS))
+    reach_y = heights * (0.5 + max(abs(dy) for dx, dy in CANDIDATE_OFFSETS))
+    reach_boxes = shapely.box(x - reach_x, y - reach_y, x + reach_x, y + reach_y)
+    tree = shapely.STRtree(reach_boxes)
+    neighbours = tree.query(reach_boxes, predicate='intersects')
+
+    neighbour_lists = [[] for _ in range(count)]
+    for i, j in neighbours.T:
+        if i != j:
+            neighbour_lists[i].append(j)
+
+    offsets = np.array(CANDIDATE_OFFSETS)
+    placed = np.zeros(count, dtype=bool)
+    areas = shapely.area(geometries)
+
+    # Labels of small wijken have little room to move, so they are placed first;
+    # when thinning, the labels of large areas take precedence
+    order = np.argsort(-areas if thin else areas, kind='stable')
+    for i in order:
+        candidate_x = anchor_x[i] + offsets[:, 0] * widths[i]
+        candidate_y = anchor_y[i] + offsets[:, 1] * heights[i]
+        valid = shapely.contains_xy(geometries[i], candidate_x, candidate_y)
+        valid[0] = True
+
+        placed_neighbours = [j for j in neighbour_lists[i] if placed[j]]
+        best, best_overlap = 0, np.inf
+        for c in np.flatnonzero(valid):
+            overlap = 0.0
+            for j in placed_neighbours:
+                overlap_x = (widths[i] + widths[j]) / 2 - abs(candidate_x[c] - x[j])
+                overlap_y = (heights[i] + heights[j]) / 2 - abs(candidate_y[c] - y[j])
+                if overlap_x > 0 and overlap_y > 0:
+                    overlap += overlap_x * overlap_y
+            if overlap < best_overlap:
+                best, best_overlap = c, overlap
+            if overlap == 0:
+                break
+
+        if thin and best_overlap > 0:
+            visible[i] = False
+            continue
+        x[i], y[i] = candidate_x[best], candidate_y[best]
+        placed[i] = True
+
+    return x, y, visible
+
+def compute_label_layout(gdf, data_df, wijk_code_gdf_column, data_units_per_point,
+                         name_column='wk_naam', fallback_prefix='Wijk', thin=None):
+    """
+    Compute the label layout of a geometry set
+
+    `data_units_per_point` converts label sizes from points to map units; it
+    follows from the map extent and the size of the map axes. `thin` leaves out
+    labels that do not fit without overlap (None = only with more than
+    THIN_LABEL_COUNT areas). Returns a DataFrame with the columns 'name', 'x'
+    and 'y' and one row per labelled area, indexed like `gdf`.
+    """
+    if thin is None:
+        thin = len(gdf) > THIN_LABEL_COUNT
+    names = label_names(gdf, data_df, wijk_code_gdf_column, name_column, fallback_prefix)
+    geometries = gdf.geometry.to_numpy()
+    anchor_x, anchor_y = label_anchors(geometries)
+
+    sizes = measure_label_boxes(names.tolist()) * data_units_per_point
+    x, y, visible = resolve_label_collisions(geometries, anchor_x, anchor_y, sizes[:, 0], sizes[:, 1], thin=thin)
+
+    layout = pd.DataFrame({'name': names.to_numpy(), 'x': x, 'y': y}, index=gdf.index)
+    return layout[visible]
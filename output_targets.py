@@ -0,0 +1,257 @@
+"""
+Output targets of the thematic maps
+
+A map is drawn once and saved to every requested target:
+
+- print: PNG at 300 dpi, in the figures directories (the original output)
+- web: WebP at 96 dpi, for the website
+- thumbnail: PNG of at most 256 pixels wide or high, for overviews of the maps
+- preview: PNG at 72 dpi, for quick checks while editing
+- svg, pdf: vector files saved from the laid-out figure (vector engine only)
+
+The canvas is drawn once per map at render_dpi(), the highest resolution of
+the requested raster targets, and the smaller raster targets are downscaled
+from that image. A preview on its own is therefore drawn at 72 dpi, which is
+much faster than a print map. The vector targets save the same figure, with
+the same layout and labels, without drawing the map again.
+
+Every target besides print gets its own directories next to the print
+directories, <directory>_<target>, for example figures_web and
+figures_labels_web.
+
+The encoding of the raster targets is chosen per run (parse_encoding()):
+
+- mode 'rgba' writes the pixels as drawn, 'palette' reduces them to an
+  indexed palette of at most 256 colours. A choropleth only has a few fill
+  colours plus the anti-aliased edges and texts; the palette is exact when
+  the map has no more colours and otherwise a median cut weighted by the
+  pixel counts, which keeps the large fill areas of the colour ramp exact.
+  Palette PNG files are about half the size of RGBA files, and WebP files
+  of a palette image are written lossless.
+- compression is the zlib level of PNG (0-9), mapped onto the method of
+  WebP and the speed of AVIF
+- format replaces the format of all raster targets by png, webp or avif
+
+All files are byte-deterministic: the same map gives the same bytes on every
+run. The metadata is fixed (no library versions, no dates), the compression
+settings are explicit and the ids in SVG files come from a fixed salt.
+"""
+import matplotlib
+import matplotlib.image
+import numpy as np
+
+# Targets by name: file format, resolution or maximum size in pixels
+OUTPUT_TARGETS = {
+    'print': {'format': 'png', 'dpi': 300},
+    'web': {'format': 'webp', 'dpi': 96},
+    'thumbnail': {'format': 'png', 'size': 256},
+    'preview': {'format': 'png', 'dpi': 72},
+    'svg': {'format': 'svg'},
+    'pdf': {'format': 'pdf'},
+}
+
+# Targets of a run without --targets
+DEFAULT_TARGETS = ('print',)
+
+# Formats saved from the figure instead of from the pixels
+VECTOR_FORMATS = ('svg', 'pdf')
+
+# Resolution the canvas is drawn at when no raster target has one
+MINIMUM_DPI = 72
+
+# Quality of the WebP files (0-100)
+WEBP_QUALITY = 85
+
+# Quality of the AVIF files (0-100)
+AVIF_QUALITY = 70
+
+# Creator stored in the files
+CREATOR = 'Waterwegregio Thematic Maps'
+
+# Metadata of the files; None removes the version or date matplotlib adds by default
+PNG_METADATA = {'Creator': CREATOR, 'Software': None}
+VECTOR_METADATA = {
+    'svg': {'Creator': CREATOR, 'Date': None},
+    'pdf': {'Creator': CREATOR, 'Producer': None, 'CreationDate': None},
+}
+
+# Salt of the element ids in SVG files, random by default
+SVG_HASH_SALT = CREATOR
+
+# Encodings of the raster targets: the pixels as drawn, or an indexed palette
+IMAGE_ENCODINGS = ('rgba', 'palette')
+
+# Formats that can replace the format of the raster targets
+IMAGE_FORMATS = ('png', 'webp', 'avif')
+
+# zlib level of the PNG files, the default of Pillow
+PNG_COMPRESSION = 6
+
+# Colours of an indexed palette
+PALETTE_COLOURS = 256
+
+# Encoding of a run without encoding options: every target in its own format, as drawn
+DEFAULT_ENCODING = {'mode': 'rgba', 'format': None, 'compression': PNG_COMPRESSION}
+
+def parse_targets(text):
+    """
+    Target names of a comma-separated list, in the order of OUTPUT_TARGETS
+
+    Raises ValueError for an unknown target or a format this Pillow cannot write.
+    """
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    for name in names:
+        if name not in OUTPUT_TARGETS:
+            raise ValueError(f"Onbekend uitvoerdoel '{name}', kies uit: {', '.join(OUTPUT_TARGETS)}")
+    if not names:
+        raise ValueError("Geen uitvoerdoelen opgegeven")
+    if any(OUTPUT_TARGETS[name]['format'] == 'webp' for name in names):
+        from PIL import features
+        if not features.check('webp'):
+            raise ValueError("Deze Pillow-installatie kan geen WebP schrijven")
+    return [name for name in OUTPUT_TARGETS if name in names]
+
+def parse_encoding(mode='rgba', image_format=None, compression=PNG_COMPRESSION):
+    """
+    Encoding of the raster targets as a dictionary, see the module docstring
+
+    Raises ValueError for an unknown mode or format, a format this Pillow
+    cannot write or a compression level outside 0-9.
+    """
+    if mode not in IMAGE_ENCODINGS:
+        raise ValueError(f"Onbekende codering '{mode}', kies uit: {', '.join(IMAGE_ENCODINGS)}")
+    if image_format is not None and image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Onbekend beeldformaat '{image_format}', kies uit: {', '.join(IMAGE_FORMATS)}")
+    if not 0 <= compression <= 9:
+        raise ValueError(f"Compressieniveau {compression} moet tussen 0 en 9 liggen")
+    if image_format in ('webp', 'avif'):
+        from PIL import features
+        if not features.check(image_format):
+            raise ValueError(f"Deze Pillow-installatie kan geen {image_format.upper()} schrijven")
+    return {'mode': mode, 'format': image_format, 'compression': compression}
+
+def encoding_inputs(encoding):
+    """Inputs of the output hash for an encoding, none for the default so existing hashes stay valid"""
+    if encoding is None or encoding == DEFAULT_ENCODING:
+        return []
+    return [encoding['mode'], encoding['format'], encoding['compression']]
+
+def is_vector_target(name):
+    """Check whether a target is saved from the figure instead of from the pixels"""
+    return OUTPUT_TARGETS[name]['format'] in VECTOR_FORMATS
+
+def target_directory(directory, name):
+    """Output directory of a target, the print target uses the directory itself"""
+    return directory if name == 'print' else f"{directory}_{name}"
+
+def target_format(name, encoding=None):
+    """File format of a target, the format of the encoding replaces that of the raster targets"""
+    if encoding is not None and encoding['format'] is not None and not is_vector_target(name):
+        return encoding['format']
+    return OUTPUT_TARGETS[name]['format']
+
+def target_file_name(column, name, encoding=None):
+    """File name of the map of an indicator for a target"""
+    return f"{column}.{target_format(name, encoding)}"
+
+def render_dpi(names):
+    """Resolution to draw the canvas at for the raster targets in `names`"""
+    return max([OUTPUT_TARGETS[name]['dpi'] for name in names if 'dpi' in OUTPUT_TARGETS[name]],
+               default=MINIMUM_DPI)
+
+def write_png(output_path, image, dpi):
+    """Encode an RGBA image as PNG with the resolution and metadata of the maps"""
+    matplotlib.image.imsave(output_path, image, format='png', dpi=dpi, metadata=PNG_METADATA,
+                            pil_kwargs={'compress_level': PNG_COMPRESSION})
+
+def quantize_image(image, colours=PALETTE_COLOURS):
+    """
+    Indexed-palette Pillow image of an RGBA image
+
+    Images with at most `colours` colours get their exact colours. Otherwise
+    the palette is a median cut weighted by pixel count, without dithering, so
+    the colours of large areas stay exact and only rare colours (anti-aliased
+    edges and texts) move to their nearest palette colour.
+    """
+    from PIL import Image
+    if image[:, :, 3].min() < 255:
+        # Median cut only takes RGB, transparent images get the octree of Pillow
+        return Image.fromarray(image).quantize(colours, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+    rgb = np.ascontiguousarray(image[:, :, :3])
+    pil_image = Image.fromarray(rgb)
+    exact = pil_image.getcolors(colours)
+    if exact is None:
+        return pil_image.quantize(colours, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+    # Look up the palette index of every pixel by its packed colour
+    palette = np.array([colour for count, colour in exact], dtype=np.uint8)
+    keys = (palette[:, 0].astype(np.uint32) << 16) | (palette[:, 1].astype(np.uint32) << 8) | palette[:, 2]
+    order = np.argsort(keys)
+    packed = (rgb[:, :, 0].astype(np.uint32) << 16) | (rgb[:, :, 1].astype(np.uint32) << 8) | rgb[:, :, 2]
+    indices = order[np.searchsorted(keys[order], packed)].astype(np.uint8)
+    indexed = Image.fromarray(indices, mode='P')
+    indexed.putpalette(palette.tobytes())
+    return indexed
+
+def encode_image(output_path, image, image_format, dpi, encoding):
+    """Write an RGBA image in `image_format` with an encoding of parse_encoding()"""
+    from PIL import Image
+    compression = encoding['compression']
+    if image_format == 'png':
+        if encoding['mode'] == 'rgba' and compression == PNG_COMPRESSION:
+            write_png(output_path, image, dpi)
+            return
+        from PIL.PngImagePlugin import PngInfo
+        info = PngInfo()
+        for key, value in PNG_METADATA.items():
+            if value is not None:
+                info.add_text(key, value)
+        pil_image = quantize_image(image) if encoding['mode'] == 'palette' else Image.fromarray(image)
+        pil_image.save(output_path, format='PNG', dpi=(dpi, dpi), pnginfo=info, compress_level=compression)
+    elif image_format == 'webp':
+        method = round(compression * 6 / 9)
+        if encoding['mode'] == 'palette':
+            quantize_image(image).convert('RGB').save(output_path, format='WEBP', lossless=True, method=method)
+        else:
+            # The maps are opaque, WebP without alpha is smaller
+            Image.fromarray(np.ascontiguousarray(image[:, :, :3])).save(output_path, format='WEBP',
+                                                                        quality=WEBP_QUALITY, method=method)
+    else:
+        # AVIF is always lossy, a palette would only add artefacts
+        Image.fromarray(np.ascontiguousarray(image[:, :, :3])).save(output_path, format='AVIF',
+                                                                    quality=AVIF_QUALITY, speed=10 - compression)
+
+def write_raster_target(output_path, image, name, dpi, encoding=None):
+    """
+    Write an RGBA image drawn at `dpi` for a raster target
+
+    The image is downscaled when the target has a lower resolution or a
+    smaller maximum size, and written with `encoding` (default DEFAULT_ENCODING).
+    """
+    encoding = encoding or DEFAULT_ENCODING
+    target = OUTPUT_TARGETS[name]
+    height, width = image.shape[:2]
+    scale = 1.0
+    if 'dpi' in target:
+        scale = min(1.0, target['dpi'] / dpi)
+    if 'size' in target:
+        scale = min(1.0, target['size'] / max(height, width))
+
+    if scale < 1.0:
+        from PIL import Image
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = np.asarray(Image.fromarray(image).resize(size, Image.LANCZOS))
+    encode_image(output_path, image, target_format(name, encoding), dpi * scale, encoding)
+
+def save_figure(output_path, fig, image_format, dpi='figure'):
+    """Save a laid-out figure as PNG, SVG or PDF, cropped like the maps and with fixed metadata"""
+    options = {'metadata': VECTOR_METADATA[image_format]} if image_format in VECTOR_FORMATS else {
+        'metadata': PNG_METADATA, 'pil_kwargs': {'compress_level': PNG_COMPRESSION}}
+    with matplotlib.rc_context({'svg.hashsalt': SVG_HASH_SALT}):
+        fig.savefig(output_path, format=image_format, dpi=dpi, bbox_inches='tight', pad_inches=0.15,
+                    facecolor='white', edgecolor='none', **options)
+
+def write_vector_target(output_path, fig, name):
+    """Save a laid-out figure as SVG or PDF, cropped like the raster maps"""
+    save_figure(output_path, fig, OUTPUT_TARGETS[name]['format'])
@@ -0,0 +1,147 @@
+"""
+Background writer for the map images
+
+Encoding a 300 dpi map as PNG (deflate) and writing it takes about as long as
+drawing it. OutputWriter hands that work to a small pool of threads, so the
+render loop continues with the next map while the previous one is encoded;
+Pillow releases the GIL while it compresses, so the threads really run in
+parallel with the drawing.
+
+- submit() blocks while `queue_depth` images are waiting or being written,
+  which caps the memory held by pending images
+- every file is written to <path>.tmp and renamed over the output, so an
+  interrupted run never leaves a half-written map
+- a file whose new bytes have the same digest as the existing file is not
+  replaced, so its modification time stays and file sync, git and CDN
+  caches see no change
+- wait() blocks until all submitted files are written and returns the paths
+  that failed, so the caller can keep them out of the build manifest, and
+  the paths that were left untouched
+
+With `workers` 0 the files are written synchronously in the calling thread,
+still atomically.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from run_profile import stage, add_output
+
+# Default number of writer threads, none on a single core where they cannot overlap the drawing
+WRITER_COUNT = min(2, (os.cpu_count() or 1) - 1)
+
+def file_digest(path):
+    """SHA-256 hex digest of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_same_file(path, other_path):
+    """Check whether two files have the same contents, by size and digest"""
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        return file_digest(path) == file_digest(other_path)
+    except OSError:
+        return False
+
+def write_atomic(output_path, write, *args):
+    """
+    Call write(tmp_path, *args) and rename the result over `output_path`
+
+    An existing file with the same contents is left untouched. Returns whether
+    `output_path` changed.
+    """
+    tmp_path = f"{output_path}.tmp"
+    try:
+        write(tmp_path, *args)
+        if is_same_file(tmp_path, output_path):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, output_path)
+        return True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class OutputWriter:
+    """Pool of threads that encode and write output files in the background"""
+
+    def __init__(self, workers=WRITER_COUNT, queue_depth=None):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='writer') if workers > 0 else None
+        # Images waiting for a thread or being written, twice the threads by default
+        self.slots = threading.BoundedSemaphore(queue_depth or max(2 * workers, 1))
+        self.pending = []
+        self.failed = []
+        self.unchanged = []
+        self.lock = threading.Lock()
+
+    def _write(self, output_path, write, args):
+        """Write one file, recording a failure or an unchanged file"""
+        try:
+            with stage('encode', output=output_path):
+                changed = write_atomic(output_path, write, *args)
+                add_output(output_path)
+        except Exception as e:
+            print(f"Fout bij het opslaan van kaart {output_path}: {e}")
+            with self.lock:
+                self.failed.append(output_path)
+            return
+        if not changed:
+            with self.lock:
+                self.unchanged.append(output_path)
+
+    def _write_queued(self, output_path, write, args):
+        """Write one submitted file and free its place in the queue"""
+        try:
+            self._write(output_path, write, args)
+        finally:
+            self.slots.release()
+
+    def write(self, output_path, write, *args):
+        """Write `output_path` with write(tmp_path, *args) now, in the calling thread, recorded like submit()"""
+        self._write(output_path, write, args)
+
+    def submit(self, output_path, write, *args):
+        """
+        Write `output_path` with write(tmp_path, *args) in the background
+
+        The arguments must not be changed by the caller afterwards. Blocks while
+        the queue is full.
+        """
+        with stage('write_queue'):
+            self.slots.acquire()
+        if self.executor is None:
+            self._write_queued(output_path, write, args)
+            return
+        future = self.executor.submit(self._write_queued, output_path, write, args)
+        with self.lock:
+            self.pending = [pending for pending in self.pending if not pending.done()] + [future]
+
+    def wait(self):
+        """
+        Wait for all submitted files
+
+        Returns (failed, unchanged): the paths that failed and the paths whose
+        contents did not change since the previous wait().
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+        with self.lock:
+            failed, self.failed = self.failed, []
+            unchanged, self.unchanged = self.unchanged, []
+        return failed, unchanged
+
+    def close(self):
+        """Wait for all files and stop the threads, returns (failed, unchanged) like wait()"""
+        result = self.wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+        return result
@@ -0,0 +1,91 @@
+"""
+Region definitions for the national batch mode of the atlas
+
+A region file (JSON) lists the regions to make an atlas for:
+
+    {
+      "excel_file": "nederland_wijken.xlsx",
+      "regions": [
+        {"name": "waterwegregio", "title": "Waterwegregio",
+         "gemeenten": ["GM0606", "GM0622", "GM1842"]},
+        {"name": "voorbeeld", "codes": ["WK036301", "WK036302"]}
+      ]
+    }
+
+A region holds the areas of its gemeente codes and its own area codes (wijk,
+buurt or gemeente codes of the level that is mapped). "title" defaults to the
+name, which is also the name of the output folder of the region. "excel_file"
+is optional; without it the workbook of the level is used.
+
+The national layer is loaded once. build_attribute_index() indexes it on area
+code and gemeente code, so select_region() is a lookup per region instead of a
+scan of the layer or a new read of the GeoPackage.
+"""
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+# Region names are used as folder names
+REGION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def load_region_definitions(regions_path):
+    """
+    Read and check a region file
+
+    Returns a dictionary with 'excel_file' (None when not given) and 'regions',
+    a list of dictionaries with 'name', 'title', 'codes' and 'gemeenten'.
+    Raises ValueError when the file does not describe any valid region.
+    """
+    with open(regions_path, encoding='utf-8') as f:
+        definition = json.load(f)
+    if isinstance(definition, list):
+        definition = {'regions': definition}
+
+    regions = []
+    names = set()
+    for number, region in enumerate(definition.get('regions', []), start=1):
+        name = str(region.get('name', ''))
+        if not REGION_NAME_PATTERN.match(name):
+            raise ValueError(f"Regio {number} in {regions_path} heeft geen geldige naam "
+                             f"(alleen letters, cijfers, '-' en '_'): '{name}'")
+        if name in names:
+            raise ValueError(f"Regio '{name}' komt meer dan eens voor in {regions_path}")
+        codes = [str(code) for code in region.get('codes', [])]
+        gemeenten = [str(code) for code in region.get('gemeenten', [])]
+        if not codes and not gemeenten:
+            raise ValueError(f"Regio '{name}' in {regions_path} heeft geen 'codes' of 'gemeenten'")
+        names.add(name)
+        regions.append({'name': name, 'title': str(region.get('title') or name),
+                        'codes': codes, 'gemeenten': gemeenten})
+
+    if not regions:
+        raise ValueError(f"Geen regio's gevonden in {regions_path}")
+    return {'excel_file': definition.get('excel_file'), 'regions': regions}
+
+def build_attribute_index(gdf, code_column, gemeente_column='gm_code'):
+    """Index of the rows of a national layer by area code and by gemeente code"""
+    gemeenten = {}
+    if gemeente_column in gdf.columns:
+        gemeenten = gdf.groupby(gdf[gemeente_column].astype(str), sort=False).indices
+    return {'codes': pd.Index(gdf[code_column].astype(str)), 'gemeenten': gemeenten}
+
+def select_region(gdf, index, region):
+    """
+    Areas of one region from the national layer
+
+    Returns (GeoDataFrame in layer order with a fresh index, list of codes and
+    gemeente codes of the region that were not found).
+    """
+    positions = index['codes'].get_indexer(region['codes'])
+    missing = [code for code, position in zip(region['codes'], positions) if position < 0]
+    parts = [positions[positions >= 0]]
+    for code in region['gemeenten']:
+        if code in index['gemeenten']:
+            parts.append(index['gemeenten'][code])
+        else:
+            missing.append(code)
+
+    rows = np.unique(np.concatenate(parts).astype(int))
+    return gdf.iloc[rows].reset_index(drop=True), missing
@@ -0,0 +1,167 @@
+"""
+Grid index of the region for point lookups on the map site
+
+The map site checks every story pin against the region, and the submit-story
+API does the same. Instead of testing the full boundary, they use a uniform
+grid over the region that is built here once:
+
+- a cell that lies within one wijk stores the index of that wijk
+- a cell that touches no wijk stores OUTSIDE
+- an edge cell stores, for every wijk it overlaps, the part of the wijk inside
+  the cell, so a point is tested against a few local segments only
+
+Most lookups resolve with one array access, and every lookup also returns the
+wijk and gemeente that contain the point.
+
+The index is plain JSON (see build_region_index for the layout); the lookup on
+the site is in src/lib/regionIndex.ts.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Increase when the layout of the index changes
+INDEX_VERSION = 1
+
+# Number of cells along the longest side of the region
+GRID_SIZE = 64
+
+# Cell value of cells outside the region; edge cells are stored as -2 - <edge index>
+OUTSIDE = -1
+
+def _run_length(values):
+    """Run-length encoding of a 1D array as a flat [value, count, value, count, ...] list"""
+    values = np.asarray(values)
+    if len(values) == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    return np.column_stack([values[starts], counts]).ravel().tolist()
+
+def _local_rings(geometry, x0, y0, scale):
+    """Rings of a clipped polygon as flat integer [x, y, ...] lists, relative to the cell corner"""
+    rings = []
+    for polygon in shapely.get_parts(geometry):
+        if not isinstance(polygon, shapely.Polygon) or polygon.is_empty:
+            continue
+        for ring in [polygon.exterior, *polygon.interiors]:
+            coords = np.asarray(ring.coords)[:-1, :2]
+            points = np.round((coords - (x0, y0)) / scale).astype(np.int64)
+            rings.append(points.ravel().tolist())
+    return rings
+
+def build_region_index(geometries, wijken, gemeenten, wijk_gemeente, grid_size=GRID_SIZE, decimals=6):
+    """
+    Build the grid index of a set of wijk geometries in EPSG:4326
+
+    Parameters
+    ----------
+    geometries : wijk geometries, forming a coverage
+    wijken : list with a properties dict per wijk ('code' and 'name')
+    gemeenten : list with a properties dict per gemeente ('code' and 'name')
+    wijk_gemeente : gemeente index per wijk (None = unknown)
+    grid_size : number of cells along the longest side of the region
+    decimals : decimals of the edge coordinates
+
+    Returns a dictionary with:
+
+    - 'origin', 'cell' and 'size': lower left corner of the grid, cell width
+      and height in degrees and the number of columns and rows; cells are
+      roughly square on the ground
+    - 'scale': unit of the edge coordinates in degrees
+    - 'wijken' and 'gemeenten': the properties, each wijk with its 'gemeente' index
+    - 'cells': run-length encoded cell values in row-major order from the lower
+      left: a wijk index, OUTSIDE, or -2 - <edge index>
+    - 'edges': per edge cell a list of [wijk index, rings]; the rings are flat
+      integer coordinate lists relative to the lower left corner of the cell
+    """
+    geometries = np.asarray(geometries)
+    scale = 10.0 ** -decimals
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+    # The origin is stored with `decimals` decimals, the site computes the cell corners from it
+    minx, miny = math.floor(minx / scale) * scale, math.floor(miny / scale) * scale
+    latitude = (miny + maxy) / 2
+
+    # Cells of equal ground size: a degree of longitude is shorter than one of latitude
+    cell_width = max((maxx - minx) / grid_size, (maxy - miny) / grid_size / math.cos(math.radians(latitude)))
+    cell_height = cell_width * math.cos(math.radians(latitude))
+    columns = max(1, math.ceil((maxx - minx) / cell_width))
+    rows = max(1, math.ceil((maxy - miny) / cell_height))
+
+    column_index, row_index = np.meshgrid(np.arange(columns), np.arange(rows))
+    cell_x = minx + column_index.ravel() * cell_width
+    cell_y = miny + row_index.ravel() * cell_height
+    boxes = shapely.box(cell_x, cell_y, cell_x + cell_width, cell_y + cell_height)
+
+    tree = shapely.STRtree(geometries)
+    cells = np.full(len(boxes), OUTSIDE, dtype=np.int64)
+
+    # Cells within a single wijk need no geometry at lookup time
+    box_within, wijk_within = tree.query(boxes, predicate='within')
+    cells[box_within] = wijk_within
+
+    # Every other cell that overlaps a wijk is an edge cell
+    box_hit, wijk_hit = tree.query(boxes, predicate='intersects')
+    edge_pairs = ~np.isin(box_hit, box_within)
+    box_hit, wijk_hit = box_hit[edge_pairs], wijk_hit[edge_pairs]
+    clipped = shapely.intersection(boxes[box_hit], geometries[wijk_hit])
+    overlaps = shapely.area(clipped) > 0
+
+    edges = []
+    for cell in np.unique(box_hit[overlaps]):
+        pairs = np.flatnonzero((box_hit == cell) & overlaps)
+        edges.append([[int(wijk_hit[pair]), _local_rings(clipped[pair], cell_x[cell], cell_y[cell], scale)]
+                      for pair in pairs])
+        cells[cell] = -2 - (len(edges) - 1)
+
+    return {
+        'version': INDEX_VERSION,
+        'origin': [round(float(minx), decimals), round(float(miny), decimals)],
+        'cell': [float(cell_width), float(cell_height)],
+        'size': [columns, rows],
+        'scale': scale,
+        'wijken': [dict(props, gemeente=None if pd.isna(gemeente) else int(gemeente))
+                   for props, gemeente in zip(wijken, wijk_gemeente)],
+        'gemeenten': gemeenten,
+        'cells': _run_length(cells),
+        'edges': edges,
+    }
+
+def lookup(index, lng, lat):
+    """
+    Index of the wijk that contains a point, or None outside the region
+
+    The same lookup as on the site, for checking an index from Python.
+    """
+    columns, rows = index['size']
+    column = math.floor((lng - index['origin'][0]) / index['cell'][0])
+    row = math.floor((lat - index['origin'][1]) / index['cell'][1])
+    if not (0 <= column < columns and 0 <= row < rows):
+        return None
+
+    runs = index['cells']
+    position = row * columns + column
+    for value, count in zip(runs[0::2], runs[1::2]):
+        if position < count:
+            break
+        position -= count
+    if value >= 0:
+        return value
+    if value == OUTSIDE:
+        return None
+
+    x = (lng - (index['origin'][0] + column * index['cell'][0])) / index['scale']
+    y = (lat - (index['origin'][1] + row * index['cell'][1])) / index['scale']
+    for wijk, rings in index['edges'][-2 - value]:
+        inside = False
+        for ring in rings:
+            xs, ys = ring[0::2], ring[1::2]
+            for i in range(len(xs)):
+                xi, yi, xj, yj = xs[i], ys[i], xs[i - 1], ys[i - 1]
+                if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+                    inside = not inside
+        if inside:
+            return wijk
+    return None
@@ -0,0 +1,288 @@
+"""
+Per-stage timing and memory profile of a run
+
+Profiling is off by default. enable_profile() turns it on with a report path,
+or with the path in the environment variable ATLAS_PROFILE. Code marks its
+stages with
+
+    with stage('excel'):
+        ...
+
+and every stage then records its wall time, the CPU time of its thread, the
+peak resident memory of the process at its end and the bytes of the files it
+wrote (add_output()). Stages may be nested. When profiling is off, stage()
+returns one shared no-op context manager, so instrumented code only pays a
+function call.
+
+write_profile() writes two files:
+
+- <path>.json: the run report, with the totals per stage name, the time per
+  indicator map, the size and encode time of every output file and the peak
+  memory of every process
+- <path>.trace.json: every stage as a Chrome trace event, to open in
+  chrome://tracing or https://ui.perfetto.dev
+
+Worker processes profile into their own list of events; drain_events() hands
+them to the main process, which adds them with merge_events().
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is then not reported
+    resource = None
+
+# Environment variable with the report path, used when no path is given
+PROFILE_ENV = 'ATLAS_PROFILE'
+
+# Settings and events of the current profile, None when profiling is off
+_profile = None
+
+# Open stages of every thread
+_local = threading.local()
+
+# Returned by stage() when profiling is off
+_NO_STAGE = contextlib.nullcontext()
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, or None when unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def enable_profile(path=None):
+    """
+    Start a new profile written to `path` (without extension)
+
+    Without a `path` the path in ATLAS_PROFILE is used; when neither is set,
+    profiling is turned off. Returns whether profiling is on.
+    """
+    global _profile
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path:
+        _profile = None
+        return False
+    _profile = {
+        'path': path,
+        'command': [os.path.basename(sys.argv[0])] + sys.argv[1:],
+        'started': time.time(),
+        'start_ns': time.perf_counter_ns(),
+        'start_cpu': time.process_time(),
+        'events': [],
+        'lock': threading.Lock(),
+    }
+    # A forked worker process starts without the open stages of its parent
+    _local.stack = []
+    return True
+
+def profile_path():
+    """Report path of the current profile, None when profiling is off"""
+    return None if _profile is None else _profile['path']
+
+class _Stage:
+    """Context manager that records one stage in the current profile"""
+
+    __slots__ = ('name', 'args', 'start_ns', 'start_cpu', 'output_bytes')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.output_bytes = 0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start_cpu = time.thread_time()
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        cpu = time.thread_time() - self.start_cpu
+        _local.stack.pop()
+        if _profile is not None:
+            event = {
+                'name': self.name,
+                'args': self.args,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'depth': len(_local.stack),
+                'start_ns': self.start_ns,
+                'wall_time': (end_ns - self.start_ns) / 1e9,
+                'cpu_time': cpu,
+                'peak_rss': peak_rss(),
+                'output_bytes': self.output_bytes,
+            }
+            with _profile['lock']:
+                _profile['events'].append(event)
+        return False
+
+def stage(name, **args):
+    """Context manager for one stage of the run; `args` (for example the column) go into the report"""
+    if _profile is None:
+        return _NO_STAGE
+    return _Stage(name, args)
+
+def add_output(path=None, nbytes=None):
+    """Count a written file (or `nbytes`) as output of the open stages of this thread"""
+    if _profile is None:
+        return
+    if nbytes is None:
+        try:
+            nbytes = os.path.getsize(path)
+        except OSError:
+            return
+    for open_stage in getattr(_local, 'stack', ()):
+        open_stage.output_bytes += nbytes
+
+def drain_events():
+    """Take the events recorded so far, to send them from a worker process to the main process"""
+    if _profile is None:
+        return []
+    with _profile['lock']:
+        events, _profile['events'] = _profile['events'], []
+    return events
+
+def merge_events(events):
+    """Add events of a worker process to the current profile"""
+    if _profile is not None and events:
+        with _profile['lock']:
+            _profile['events'].extend(events)
+
+def _totals(events):
+    """Wall time, CPU time, peak memory and output bytes summed over events"""
+    peaks = [event['peak_rss'] for event in events if event['peak_rss'] is not None]
+    return {
+        'count': len(events),
+        'wall_time': round(sum(event['wall_time'] for event in events), 6),
+        'cpu_time': round(sum(event['cpu_time'] for event in events), 6),
+        'peak_rss': max(peaks) if peaks else None,
+        'output_bytes': sum(event['output_bytes'] for event in events),
+    }
+
+def build_report():
+    """Run report of the current profile as a dictionary"""
+    events = sorted(_profile['events'], key=lambda event: event['start_ns'])
+    main_pid = os.getpid()
+
+    stages = {}
+    for event in events:
+        stages.setdefault(event['name'], []).append(event)
+
+    measures = ('wall_time', 'cpu_time', 'peak_rss', 'output_bytes')
+    indicators = [dict(event['args'], **{key: event[key] for key in measures}, pid=event['pid'])
+                  for event in events if event['name'] == 'indicator']
+    indicators.sort(key=lambda indicator: indicator['wall_time'], reverse=True)
+
+    # Encode stages of single files, to weigh file size against encode time
+    files = [dict(event['args'], **{key: event[key] for key in measures if key != 'peak_rss'})
+             for event in events if event['name'] == 'encode' and 'output' in event['args']]
+    files.sort(key=lambda file: file['output'])
+
+    processes = {}
+    for event in events:
+        process = processes.setdefault(event['pid'], {'role': 'main' if event['pid'] == main_pid else 'worker',
+                                                      'peak_rss': None, 'stages': 0})
+        process['stages'] += 1
+        if event['peak_rss'] is not None:
+            process['peak_rss'] = max(process['peak_rss'] or 0, event['peak_rss'])
+
+    return {
+        'command': _profile['command'],
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_profile['started'])),
+        'wall_time': round((time.perf_counter_ns() - _profile['start_ns']) / 1e9, 6),
+        'cpu_time': round(time.process_time() - _profile['start_cpu'], 6),
+        'peak_rss': peak_rss(),
+        'stages': {name: _totals(stage_events) for name, stage_events in stages.items()},
+        'indicators': indicators,
+        'files': files,
+        'processes': {str(pid): process for pid, process in processes.items()},
+    }
+
+def build_trace():
+    """Chrome trace of the current profile, with times relative to the start of the profile"""
+    start_ns = _profile['start_ns']
+    main_pid = os.getpid()
+    trace_events = []
+    for pid in sorted({event['pid'] for event in _profile['events']} | {main_pid}):
+        name = os.path.basename(sys.argv[0]) if pid == main_pid else f"worker {pid}"
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': name}})
+
+    for event in sorted(_profile['events'], key=lambda event: event['start_ns']):
+        timestamp = max(event['start_ns'] - start_ns, 0) / 1000
+        args = dict(event['args'], cpu_time=round(event['cpu_time'], 6), output_bytes=event['output_bytes'])
+        trace_events.append({
+            'name': event['name'], 'cat': 'stage', 'ph': 'X', 'pid': event['pid'], 'tid': event['tid'],
+            'ts': round(timestamp, 3), 'dur': round(event['wall_time'] * 1e6, 3), 'args': args,
+        })
+        if event['peak_rss'] is not None:
+            trace_events.append({
+                'name': 'peak_rss', 'ph': 'C', 'pid': event['pid'], 'tid': event['tid'],
+                'ts': round(timestamp + event['wall_time'] * 1e6, 3), 'args': {'bytes': event['peak_rss']},
+            })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+def _write_json(path, data):
+    """Write JSON atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+def print_file_summary(files):
+    """Print the number, size and encode time of the output files per directory and extension"""
+    groups = {}
+    for file in files:
+        extension = os.path.splitext(file['output'])[1]
+        groups.setdefault((os.path.dirname(file['output']), extension), []).append(file)
+    if not groups:
+        return
+    print(f"  {'uitvoer':<40}{'bestanden':>10}{'MB':>9}{'KB/bestand':>12}{'ms/bestand':>12}")
+    for (directory, extension), group in sorted(groups.items()):
+        total_bytes = sum(file['output_bytes'] for file in group)
+        total_time = sum(file['wall_time'] for file in group)
+        name = f"{os.path.basename(directory)}/*{extension}"
+        print(f"  {name:<40}{len(group):>10}{total_bytes / 2**20:>9.1f}{total_bytes / 1024 / len(group):>12.0f}"
+              f"{total_time * 1000 / len(group):>12.0f}")
+
+def write_profile():
+    """
+    Write the run report and the Chrome trace of the current profile
+
+    Does nothing when profiling is off. Prints the stages by total wall time
+    and returns the report, or None.
+    """
+    if _profile is None:
+        return None
+    report = build_report()
+    report_path = f"{_profile['path']}.json"
+    trace_path = f"{_profile['path']}.trace.json"
+    try:
+        directory = os.path.dirname(report_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _write_json(report_path, report)
+        _write_json(trace_path, build_trace())
+    except OSError as e:
+        print(f"Waarschuwing: Kon profiel {report_path} niet schrijven: {e}")
+        return report
+
+    print(f"Profiel van {report['wall_time']:.2f} s geschreven naar {report_path} en {trace_path}:")
+    print(f"  {'stap':<20}{'aantal':>8}{'wandtijd':>11}{'cpu':>11}{'piek MB':>10}{'bytes':>14}")
+    for name, totals in sorted(report['stages'].items(), key=lambda item: -item[1]['wall_time']):
+        peak = f"{totals['peak_rss'] / 2**20:.0f}" if totals['peak_rss'] is not None else '-'
+        print(f"  {name:<20}{totals['count']:>8}{totals['wall_time']:>10.2f}s{totals['cpu_time']:>10.2f}s"
+              f"{peak:>10}{totals['output_bytes']:>14,}")
+    print_file_summary(report['files'])
+    return report
@@ -0,0 +1,58 @@
+// Indicator bundle written next to the vector tiles (indicator_bundle.py)
+// One fetch of the .bin file holds the values and the map colours of every
+// indicator, in the feature order of the tiles (feature ID = wijk position).
+
+export interface IndicatorInfo {
+	name: string;
+	title: string | null;
+	source: string | null;
+	count: number;
+	min: number;
+	max: number;
+	mean: number;
+	quantiles: number[];
+	diverging: boolean;
+	ramp: string;
+	norm: { vmin: number; vcenter: number | null; vmax: number };
+	// Class edges [min, ..., max] per classification scheme (classification.py)
+	classes: Record<'quantile' | 'equal_interval' | 'std_dev' | 'head_tail' | 'jenks', number[]>;
+	values: { offset: number; length: number };
+	colours: { offset: number; length: number };
+}
+
+export interface IndicatorBundle {
+	version: number;
+	data: string;
+	wijken: string[];
+	colour_count: number;
+	class_count: number;
+	ramps: Record<string, { stops: string[]; colours: string[] }>;
+	indicators: IndicatorInfo[];
+	buffer: ArrayBuffer;
+}
+
+const DATA_DIR = '/data/';
+export const INDICATOR_BUNDLE_URL = `${DATA_DIR}waterwegregio_indicators.json`;
+
+export async function loadIndicatorBundle(fetcher: typeof fetch = fetch): Promise<IndicatorBundle | null> {
+	const response = await fetcher(INDICATOR_BUNDLE_URL);
+	if (!response.ok) return null;
+	const metadata = await response.json();
+	const data = await fetcher(`${DATA_DIR}${metadata.data}`);
+	if (!data.ok) return null;
+	return { ...metadata, buffer: await data.arrayBuffer() };
+}
+
+export function findIndicator(bundle: IndicatorBundle, name: string): IndicatorInfo | undefined {
+	return bundle.indicators.find((indicator) => indicator.name === name);
+}
+
+// Values per wijk, NaN for no data
+export function indicatorValues(bundle: IndicatorBundle, indicator: IndicatorInfo): Float32Array {
+	return new Float32Array(bundle.buffer, indicator.values.offset, indicator.values.length);
+}
+
+// RGBA colours per wijk as on the PNG maps, transparent for no data
+export function indicatorColours(bundle: IndicatorBundle, indicator: IndicatorInfo): Uint8Array {
+	return new Uint8Array(bundle.buffer, indicator.colours.offset, indicator.colours.length);
+}
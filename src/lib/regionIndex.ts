@@ -0,0 +1,94 @@
+// Grid index of the Waterwegregio, written by the boundary extractor (region_index.py)
+// Most points resolve with one array lookup; only points in cells on a wijk
+// border are tested against the few segments stored for that cell.
+
+export interface RegionArea {
+	code: string | null;
+	name: string | null;
+}
+
+export interface RegionHit {
+	wijk: RegionArea;
+	gemeente: RegionArea | null;
+}
+
+interface RegionIndexData {
+	version: number;
+	origin: [number, number];
+	cell: [number, number];
+	size: [number, number];
+	scale: number;
+	wijken: (RegionArea & { gemeente: number | null })[];
+	gemeenten: RegionArea[];
+	cells: number[];
+	edges: [number, number[][]][][];
+}
+
+export interface RegionIndex extends Omit<RegionIndexData, 'cells'> {
+	cells: Int32Array;
+}
+
+export const REGION_INDEX_URL = '/data/waterwegregio_index.json';
+
+const OUTSIDE = -1;
+
+// Expand the run-length encoded cells once, so every lookup is a single array access
+export function decodeRegionIndex(data: RegionIndexData): RegionIndex {
+	const [columns, rows] = data.size;
+	const cells = new Int32Array(columns * rows);
+	let position = 0;
+	for (let i = 0; i < data.cells.length; i += 2) {
+		cells.fill(data.cells[i], position, position + data.cells[i + 1]);
+		position += data.cells[i + 1];
+	}
+	return { ...data, cells };
+}
+
+export async function loadRegionIndex(fetcher: typeof fetch = fetch): Promise<RegionIndex | null> {
+	const response = await fetcher(REGION_INDEX_URL);
+	if (!response.ok) return null;
+	return decodeRegionIndex(await response.json());
+}
+
+// Even-odd test of a point against flat [x, y, ...] rings
+function inRings(x: number, y: number, rings: number[][]): boolean {
+	let inside = false;
+	for (const ring of rings) {
+		for (let i = 0, j = ring.length - 2; i < ring.length; j = i, i += 2) {
+			const xi = ring[i], yi = ring[i + 1];
+			const xj = ring[j], yj = ring[j + 1];
+			if (yi > y !== yj > y && x < ((xj - xi) * (y - yi)) / (yj - yi) + xi) inside = !inside;
+		}
+	}
+	return inside;
+}
+
+// Index of the wijk that contains the point, or -1 outside the region
+export function lookupWijk(index: RegionIndex, lng: number, lat: number): number {
+	const [columns, rows] = index.size;
+	const column = Math.floor((lng - index.origin[0]) / index.cell[0]);
+	const row = Math.floor((lat - index.origin[1]) / index.cell[1]);
+	if (column < 0 || column >= columns || row < 0 || row >= rows) return OUTSIDE;
+
+	const value = index.cells[row * columns + column];
+	if (value >= OUTSIDE) return value;
+
+	// Edge cell: test the parts of the wijken inside this cell
+	const x = (lng - (index.origin[0] + column * index.cell[0])) / index.scale;
+	const y = (lat - (index.origin[1] + row * index.cell[1])) / index.scale;
+	for (const [wijk, rings] of index.edges[-2 - value]) {
+		if (inRings(x, y, rings)) return wijk;
+	}
+	return OUTSIDE;
+}
+
+// Wijk and gemeente of a point, or null outside the region
+export function lookupRegion(index: RegionIndex, lng: number, lat: number): RegionHit | null {
+	const wijk = lookupWijk(index, lng, lat);
+	if (wijk === OUTSIDE) return null;
+	const { code, name, gemeente } = index.wijken[wijk];
+	return {
+		wijk: { code, name },
+		gemeente: gemeente === null ? null : index.gemeenten[gemeente]
+	};
+}
@@ -3,8 +3,27 @@ import type { RequestHandler } from './$types';
 import { createClient } from '@supabase/supabase-js';
 import { PUBLIC_SUPABASE_URL } from '$env/static/public';
 import { SUPABASE_SERVICE_ROLE_KEY } from '$env/static/private';
+import { loadRegionIndex, lookupRegion } from '$lib/regionIndex';
+import type { RegionIndex } from '$lib/regionIndex';
 
-export const POST: RequestHandler = async ({ request }) => {
+// Grid index of the Waterwegregio, loaded once per server instance
+let regionIndex: Promise<RegionIndex | null> | null = null;
+
+function getRegionIndex(fetcher: typeof fetch): Promise<RegionIndex | null> {
+	regionIndex ??= loadRegionIndex(fetcher)
+		.catch((error) => {
+			console.error('Error loading region index:', error);
+			return null;
+		})
+		.then((index) => {
+			// Try again on the next request when the index is not available
+			if (!index) regionIndex = null;
+			return index;
+		});
+	return regionIndex;
+}
+
+export const POST: RequestHandler = async ({ request, fetch }) => {
 	try {
 		const { text, type, organisatie, naam, link, lat, lng } = await request.json();
 
@@ -26,6 +45,12 @@ export const POST: RequestHandler = async ({ request }) => {
 			return json({ error: 'Locatie buiten bereik' }, { status: 400 });
 		}
 
+		// Validate that the location lies inside the Waterwegregio
+		const index = await getRegionIndex(fetch);
+		if (index && !lookupRegion(index, lng, lat)) {
+			return json({ error: 'Locatie buiten de Waterwegregio' }, { status: 400 });
+		}
+
 		// Create Supabase client with service role key (bypasses RLS)
 		const supabase = createClient(PUBLIC_SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY);
 
@@ -0,0 +1,31 @@
+"""Fisher-Jenks breaks against a brute-force search"""
+import itertools
+
+import numpy as np
+import pytest
+
+from classification import jenks_breaks
+
+def squared_deviations(values, inner):
+    """Sum of squared deviations from the class means, classes starting at the inner breaks"""
+    classes = np.searchsorted(inner, values, side='right')
+    return sum(((values[classes == c] - values[classes == c].mean()) ** 2).sum() for c in np.unique(classes))
+
+def brute_force_cost(values, k):
+    """Smallest sum of squared deviations over every split of the unique values into k classes"""
+    unique = np.unique(values)
+    return min(squared_deviations(values, unique[list(starts)])
+               for starts in itertools.combinations(range(1, len(unique)), k - 1))
+
+@pytest.mark.parametrize('seed', range(8))
+@pytest.mark.parametrize('k', [2, 3, 5])
+def test_jenks_matches_brute_force(seed, k):
+    rng = np.random.default_rng(seed)
+    # Skewed values with repeats, so the weights of the unique values matter
+    values = np.round(rng.lognormal(2, 1, 14), 0)
+    inner = jenks_breaks(values, k)
+    assert len(inner) == min(k, len(np.unique(values))) - 1
+    assert squared_deviations(values, np.array(inner)) == pytest.approx(brute_force_cost(values, k), abs=1e-9)
+
+def test_jenks_with_fewer_unique_values_than_classes():
+    assert jenks_breaks(np.array([1.0, 1.0, 2.0, 3.0]), 5) == [2.0, 3.0]
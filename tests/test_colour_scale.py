@@ -0,0 +1,17 @@
+"""Colour scales of the classed maps"""
+import numpy as np
+import pytest
+
+from colour_scale import get_colour_scale
+
+@pytest.mark.parametrize('breaks', [[-1, 2, 4, 6, 8, 10], [-10, -8, -6, -4, -2, 1], [-9, -6, -3, -1, 2, 4, 6, 8, 10]])
+def test_mixed_sign_classes_keep_their_side_of_zero(breaks):
+    cmap, norm = get_colour_scale(breaks[0], breaks[-1], breaks)
+    edges = np.asarray(breaks, dtype=float)
+    colours = cmap(norm((edges[:-1] + edges[1:]) / 2))
+    for low, high, (red, green, blue, alpha) in zip(edges[:-1], edges[1:], colours):
+        # The diverging ramp runs from red (negative) through yellow to green (positive)
+        if high <= 0:
+            assert red > green, (low, high)
+        elif low >= 0:
+            assert green > red, (low, high)
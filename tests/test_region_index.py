@@ -0,0 +1,35 @@
+"""Point lookups of the region grid index against shapely"""
+import numpy as np
+import shapely
+
+from region_index import build_region_index, lookup
+
+def test_lookup_matches_containment():
+    rng = np.random.default_rng(0)
+    # Voronoi wijken of an irregular region around Vlaardingen, in EPSG:4326
+    region = shapely.Polygon([(4.30, 51.88), (4.42, 51.89), (4.45, 51.95), (4.36, 51.97), (4.31, 51.93)])
+    seeds = shapely.points(rng.uniform((4.30, 51.88), (4.45, 51.97), size=(12, 2)))
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(seeds), extend_to=region))
+    geometries = shapely.intersection(cells, region)
+    geometries = geometries[~shapely.is_empty(geometries)]
+    wijken = [{'code': f"WK{i:02d}", 'name': f"Wijk {i}"} for i in range(len(geometries))]
+    index = build_region_index(geometries, wijken, [{'code': 'GM1', 'name': 'Een'}], [0] * len(geometries),
+                               grid_size=8)
+
+    points = rng.uniform((4.28, 51.86), (4.47, 51.99), size=(2000, 2))
+    tree = shapely.STRtree(geometries)
+    found = []
+    for lng, lat in points:
+        point = shapely.Point(lng, lat)
+        # Points within a few edge-coordinate units of a boundary may snap to either side
+        near = tree.query(point, predicate='dwithin', distance=1e-5)
+        if (shapely.distance(shapely.boundary(geometries[near]), point) < 1e-5).any():
+            continue
+        hits = tree.query(point, predicate='within')
+        expected = int(hits[0]) if len(hits) else None
+        assert lookup(index, lng, lat) == expected, (lng, lat)
+        found.append(expected)
+
+    # Both full cells and edge cells were looked up, inside and outside the region
+    assert index['edges'] and any(value >= 0 for value in index['cells'][0::2])
+    assert None in found and len(set(found)) > len(geometries) // 2
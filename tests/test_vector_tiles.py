@@ -0,0 +1,106 @@
+"""Round trip of a tiny PMTiles archive through an independent decoder"""
+import gzip
+import json
+import struct
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from vector_tiles import HEADER_SIZE, tile_range, write_vector_tiles, zxy_to_tile_id
+
+HEADER_FORMAT = '<7sBQQQQQQQQQQQBBBBBBiiiiBii'
+
+def read_varint(data, position):
+    """Unsigned varint at `position`, returns (value, next position)"""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def read_fields(data):
+    """(field number, value) of a protobuf message, bytes for length-delimited fields"""
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 2:
+            length, position = read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        else:
+            raise ValueError(f"unexpected wire type {wire_type}")
+        fields.append((number, value))
+    return fields
+
+def read_directory(data):
+    """Entries (tile_id, offset, length, run_length) of a decompressed PMTiles directory"""
+    count, position = read_varint(data, 0)
+    columns = []
+    for _ in range(4):
+        column = []
+        for _ in range(count):
+            value, position = read_varint(data, position)
+            column.append(value)
+        columns.append(column)
+    deltas, run_lengths, lengths, offsets = columns
+    entries, tile_id = [], 0
+    for i in range(count):
+        tile_id += deltas[i]
+        offset = entries[-1][1] + entries[-1][2] if offsets[i] == 0 else offsets[i] - 1
+        entries.append((tile_id, offset, lengths[i], run_lengths[i]))
+    return entries
+
+def test_archive_round_trip(tmp_path):
+    # Four wijken of 1 km in two gemeenten, near Rotterdam in web mercator
+    x0, y0 = 480000.0, 6810000.0
+    squares = [shapely.box(x0 + i * 1000, y0, x0 + (i + 1) * 1000, y0 + 1000) for i in range(4)]
+    wijken = gpd.GeoDataFrame({
+        'wk_code': [f"WK{i:04d}" for i in range(4)],
+        'wk_naam': [f"Wijk {i}" for i in range(4)],
+        'gm_code': ['GM1', 'GM1', 'GM2', 'GM2'],
+        'gm_naam': ['Een', 'Een', 'Twee', 'Twee'],
+    }, geometry=squares, crs=3857)
+    indicators = pd.DataFrame({'inwoners': [100.0, 200.0, None, 400.0]})
+    path = tmp_path / "test.pmtiles"
+
+    result = write_vector_tiles(wijken, indicators, [{'name': 'inwoners'}], str(path), min_zoom=10, max_zoom=12)
+    archive = path.read_bytes()
+    assert len(archive) == result['bytes']
+
+    header = struct.unpack(HEADER_FORMAT, archive[:HEADER_SIZE])
+    (magic, version, root_offset, root_length, metadata_offset, metadata_length, _, _,
+     data_offset, _, addressed_tiles, _, _, _, _, tile_compression, tile_type, min_zoom, max_zoom) = header[:19]
+    assert (magic, version) == (b'PMTiles', 3)
+    assert (tile_compression, tile_type) == (2, 1)
+    assert (min_zoom, max_zoom) == (10, 12)
+    assert addressed_tiles == sum(result['tiles'].values())
+    assert sorted(result['tiles']) == [10, 11, 12]
+
+    metadata = json.loads(gzip.decompress(archive[metadata_offset:metadata_offset + metadata_length]))
+    assert [layer['id'] for layer in metadata['vector_layers']] == ['wijken', 'gemeenten']
+
+    # The zoom 10 tile, which holds all four wijken
+    columns, rows = tile_range(shapely.total_bounds(squares), 10)
+    assert (len(columns), len(rows)) == (1, 1)
+    entries = read_directory(gzip.decompress(archive[root_offset:root_offset + root_length]))
+    tile_id = zxy_to_tile_id(10, columns[0], rows[0])
+    entry = next(entry for entry in entries if entry[0] <= tile_id < entry[0] + entry[3])
+    tile = gzip.decompress(archive[data_offset + entry[1]:data_offset + entry[1] + entry[2]])
+
+    layers = {}
+    for number, layer in read_fields(tile):
+        assert number == 3
+        fields = read_fields(layer)
+        name = dict(fields)[1].decode('utf-8')
+        layers[name] = [value for field_number, value in fields if field_number == 2]
+    assert sorted(layers) == ['gemeenten', 'wijken']
+    assert len(layers['wijken']) == 4
+    assert len(layers['gemeenten']) == 2
@@ -0,0 +1,357 @@
+"""
+Vector tiles of the wijken and gemeenten for the web map
+
+write_vector_tiles() writes one PMTiles archive (version 3) with two layers:
+
+- wijken: every wijk with its code, name, gemeente and every numeric indicator
+- gemeenten: the gemeenten dissolved from their wijken, with code and name
+
+The geometry is simplified as a coverage per zoom level to one tile unit, so
+neighbouring wijken keep identical edges at every zoom, and the gemeenten are
+dissolved from the simplified wijken. Tiles are encoded as Mapbox Vector Tiles
+(version 2.1) and gzip-compressed, identical tiles are stored once.
+
+The archive is written by this module alone: no tile server, external tool or
+network access is needed. MapLibre reads it from static hosting with the
+pmtiles protocol, and every indicator can be styled from the one archive.
+"""
+import gzip
+import json
+import math
+import struct
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry.polygon import orient
+
+from geometry_simplify import simplify_coverage
+from boundary_pyramid import dissolve_coverage
+
+# Zoom levels in the archive, MapLibre overzooms the highest level
+MIN_ZOOM = 8
+MAX_ZOOM = 14
+
+# Tile coordinate extent and the buffer around a tile, in tile units
+EXTENT = 4096
+BUFFER = 64
+
+# Half the width of the web mercator world in metres (EPSG:3857)
+MERCATOR_ORIGIN = 20037508.342789244
+
+# Largest compressed root directory that fits in the first 16 KiB with the header
+HEADER_SIZE = 127
+ROOT_DIRECTORY_MAX = 16384 - HEADER_SIZE
+
+# Wijk and gemeente attributes in the tiles, besides the indicators
+WIJK_ATTRIBUTES = ['wk_code', 'wk_naam', 'gm_code', 'gm_naam']
+GEMEENTE_ATTRIBUTES = ['gm_code', 'gm_naam']
+
+# Geometry commands of a vector tile
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+# Protocol buffer wire types
+VARINT, FIXED32, LENGTH_DELIMITED = 0, 5, 2
+
+def _varint(value):
+    """Protocol buffer encoding of an unsigned integer"""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _field(number, wire_type):
+    """Key of a protocol buffer field"""
+    return _varint((number << 3) | wire_type)
+
+def _message_field(number, data):
+    """Length-delimited protocol buffer field"""
+    return _field(number, LENGTH_DELIMITED) + _varint(len(data)) + data
+
+def _encode_value(value):
+    """Tile attribute value: whole numbers as integers, other numbers as float"""
+    if isinstance(value, str):
+        return _message_field(1, value.encode('utf-8'))
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, VARINT) + _varint(int(value))
+    value = float(value)
+    if value.is_integer() and abs(value) < 2 ** 53:
+        value = int(value)
+        if value >= 0:
+            return _field(5, VARINT) + _varint(value)
+        return _field(6, VARINT) + _varint(-2 * value - 1)
+    return _field(2, FIXED32) + struct.pack('<f', value)
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+def _polygon_commands(geometry):
+    """Geometry commands of a polygon in integer tile coordinates, or None when it is empty"""
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for polygon in shapely.get_parts(geometry):
+        if not isinstance(polygon, shapely.Polygon) or polygon.is_empty:
+            continue
+        # Exterior rings have a positive area in tile coordinates (y down), holes a negative one
+        polygon = orient(polygon, sign=1.0)
+        for ring in [polygon.exterior, *polygon.interiors]:
+            points = np.asarray(ring.coords, dtype=float)[:-1].round().astype(np.int64)
+            if len(points) < 3:
+                continue
+            deltas = np.diff(np.vstack([cursor, points]), axis=0)
+            cursor = points[-1]
+            zigzag = ((deltas << 1) ^ (deltas >> 63)).ravel().tolist()
+            commands += [_command(MOVE_TO, 1), *zigzag[:2], _command(LINE_TO, len(points) - 1), *zigzag[2:],
+                         _command(CLOSE_PATH, 1)]
+    return commands or None
+
+def encode_layer(name, features):
+    """
+    Vector tile layer message
+
+    `features` is a list of (id, properties, commands) tuples; properties with
+    a None or NaN value are left out.
+    """
+    keys, values = {}, {}
+    encoded_features = []
+    for feature_id, properties, commands in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None or (not isinstance(value, str) and pd.isna(value)):
+                continue
+            encoded = _encode_value(value)
+            tags += [keys.setdefault(key, len(keys)), values.setdefault(encoded, len(values))]
+        feature = (_field(1, VARINT) + _varint(feature_id)
+                   + _message_field(2, b''.join(_varint(tag) for tag in tags))
+                   + _field(3, VARINT) + _varint(POLYGON)
+                   + _message_field(4, b''.join(_varint(command) for command in commands)))
+        encoded_features.append(_message_field(2, feature))
+
+    return (_field(15, VARINT) + _varint(2)
+            + _message_field(1, name.encode('utf-8'))
+            + b''.join(encoded_features)
+            + b''.join(_message_field(3, key.encode('utf-8')) for key in keys)
+            + b''.join(_message_field(4, value) for value in values)
+            + _field(5, VARINT) + _varint(EXTENT))
+
+def tile_bounds(z, x, y):
+    """Bounds of a tile in web mercator metres"""
+    size = 2 * MERCATOR_ORIGIN / 2 ** z
+    minx = -MERCATOR_ORIGIN + x * size
+    maxy = MERCATOR_ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def tile_range(bounds, z):
+    """Columns and rows of the tiles at zoom `z` that cover `bounds` (web mercator)"""
+    count = 2 ** z
+    size = 2 * MERCATOR_ORIGIN / count
+    minx, miny, maxx, maxy = bounds
+    columns = range(max(0, math.floor((minx + MERCATOR_ORIGIN) / size)),
+                    min(count - 1, math.floor((maxx + MERCATOR_ORIGIN) / size)) + 1)
+    rows = range(max(0, math.floor((MERCATOR_ORIGIN - maxy) / size)),
+                 min(count - 1, math.floor((MERCATOR_ORIGIN - miny) / size)) + 1)
+    return columns, rows
+
+def to_tile_coordinates(geometries, z, x, y):
+    """Clip geometries to a tile with its buffer and snap them to integer tile coordinates"""
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    scale = EXTENT / (maxx - minx)
+    buffer = BUFFER / scale
+    clipped = shapely.clip_by_rect(geometries, minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+    tile_geometries = shapely.transform(clipped, lambda coords: np.column_stack(
+        [(coords[:, 0] - minx) * scale, (maxy - coords[:, 1]) * scale]))
+    # Snapping to the grid keeps the polygons valid
+    return shapely.set_precision(tile_geometries, 1.0)
+
+def zxy_to_tile_id(z, x, y):
+    """PMTiles tile ID: the tiles of lower zoom levels, then the Hilbert curve position"""
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    n = 1 << z
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return tile_id
+
+def _serialize_directory(entries):
+    """Gzip-compressed PMTiles directory of (tile_id, offset, length, run_length) entries"""
+    parts = [_varint(len(entries))]
+    last_id = 0
+    for tile_id, _, _, _ in entries:
+        parts.append(_varint(tile_id - last_id))
+        last_id = tile_id
+    parts += [_varint(run_length) for _, _, _, run_length in entries]
+    parts += [_varint(length) for _, _, length, _ in entries]
+    for i, (_, offset, _, _) in enumerate(entries):
+        # 0 means: directly after the previous tile
+        consecutive = i > 0 and offset == entries[i - 1][1] + entries[i - 1][2]
+        parts.append(_varint(0 if consecutive else offset + 1))
+    return gzip.compress(b''.join(parts), compresslevel=9, mtime=0)
+
+def _build_directories(entries):
+    """Root directory and leaf directories, leaves are only used when the root does not fit"""
+    root = _serialize_directory(entries)
+    if len(root) <= ROOT_DIRECTORY_MAX:
+        return root, b''
+
+    leaf_size = 4096
+    while True:
+        leaves = bytearray()
+        root_entries = []
+        for start in range(0, len(entries), leaf_size):
+            leaf = _serialize_directory(entries[start:start + leaf_size])
+            root_entries.append((entries[start][0], len(leaves), len(leaf), 0))
+            leaves += leaf
+        root = _serialize_directory(root_entries)
+        if len(root) <= ROOT_DIRECTORY_MAX:
+            return root, bytes(leaves)
+        leaf_size *= 2
+
+def write_pmtiles(path, tiles, metadata, bounds, min_zoom, max_zoom):
+    """
+    Write a PMTiles version 3 archive of gzip-compressed vector tiles
+
+    `tiles` maps (z, x, y) to the compressed tile data and `bounds` is
+    (min lon, min lat, max lon, max lat). Identical tiles are stored once.
+    Returns the number of bytes written.
+    """
+    entries = []
+    data = bytearray()
+    offsets = {}
+    for tile_id, tile in sorted((zxy_to_tile_id(*zxy), tile) for zxy, tile in tiles.items()):
+        if tile not in offsets:
+            offsets[tile] = len(data)
+            data += tile
+        offset = offsets[tile]
+        previous = entries[-1] if entries else None
+        if previous and previous[1] == offset and previous[0] + previous[3] == tile_id:
+            entries[-1] = (previous[0], offset, len(tile), previous[3] + 1)
+        else:
+            entries.append((tile_id, offset, len(tile), 1))
+
+    root, leaves = _build_directories(entries)
+    metadata_bytes = gzip.compress(json.dumps(metadata, ensure_ascii=False).encode('utf-8'),
+                                   compresslevel=9, mtime=0)
+
+    root_offset = HEADER_SIZE
+    metadata_offset = root_offset + len(root)
+    leaves_offset = metadata_offset + len(metadata_bytes)
+    data_offset = leaves_offset + len(leaves)
+
+    def e7(value):
+        return int(round(value * 10_000_000))
+
+    center_lon, center_lat = (bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2
+    header = struct.pack(
+        '<7sBQQQQQQQQQQQBBBBBBiiiiBii', b'PMTiles', 3,
+        root_offset, len(root), metadata_offset, len(metadata_bytes), leaves_offset, len(leaves),
+        data_offset, len(data), len(tiles), len(entries), len(offsets),
+        1,  # clustered: tiles are stored in tile ID order
+        2,  # internal compression: gzip
+        2,  # tile compression: gzip
+        1,  # tile type: mvt
+        min_zoom, max_zoom, e7(bounds[0]), e7(bounds[1]), e7(bounds[2]), e7(bounds[3]),
+        min_zoom, e7(center_lon), e7(center_lat),
+    )
+
+    with open(path, 'wb') as f:
+        for part in [header, root, metadata_bytes, leaves, data]:
+            f.write(part)
+    return data_offset + len(data)
+
+def _field_types(df, columns):
+    """Field types of the vector_layers metadata"""
+    return {column: 'String' if df[column].dtype == object else 'Number' for column in columns}
+
+def write_vector_tiles(wijken_gdf, indicator_table, indicator_info, output_path,
+                       min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, name="Waterwegregio"):
+    """
+    Write the wijken and gemeenten of a region as a PMTiles archive
+
+    Parameters
+    ----------
+    wijken_gdf : wijken in EPSG:3857, with the WIJK_ATTRIBUTES it has
+    indicator_table : float DataFrame with one row per wijk, in the order of
+        `wijken_gdf`, and one column per numeric indicator
+    indicator_info : list with a dictionary per indicator ('name', 'title' and
+        'source'), stored in the archive metadata
+    output_path : path of the .pmtiles file
+
+    The feature ID of a wijk is its position in `wijken_gdf`. Returns a dictionary
+    with the number of tiles per zoom level and the size of the archive in bytes.
+    """
+    wijk_attributes = [column for column in WIJK_ATTRIBUTES if column in wijken_gdf.columns]
+    gemeente_attributes = [column for column in GEMEENTE_ATTRIBUTES if column in wijken_gdf.columns]
+    attributes = wijken_gdf[wijk_attributes].reset_index(drop=True)
+    indicators = indicator_table.reset_index(drop=True)
+    wijk_properties = [{**attributes.iloc[i].to_dict(), **indicators.iloc[i].to_dict()}
+                       for i in range(len(wijken_gdf))]
+
+    # Gemeenten in order of appearance, with the positions of their wijken
+    gemeenten = []
+    if gemeente_attributes:
+        for _, group in attributes.groupby(gemeente_attributes[0], sort=False):
+            gemeenten.append((group.iloc[0][gemeente_attributes].to_dict(), group.index.to_numpy()))
+
+    geometries = wijken_gdf.geometry.to_numpy()
+    bounds = shapely.total_bounds(geometries)
+    tiles = {}
+    tile_counts = {}
+    for z in range(min_zoom, max_zoom + 1):
+        # One tile unit at this zoom, finer detail is lost when snapping to the tile grid
+        tolerance = 2 * MERCATOR_ORIGIN / 2 ** z / EXTENT
+        simplified = simplify_coverage(geometries, tolerance)
+        gemeente_geometries = np.array([dissolve_coverage(simplified[positions]) for _, positions in gemeenten],
+                                       dtype=object)
+        wijk_tree = shapely.STRtree(simplified)
+        gemeente_tree = shapely.STRtree(gemeente_geometries)
+
+        columns, rows = tile_range(bounds, z)
+        tile_counts[z] = 0
+        for x in columns:
+            for y in rows:
+                tile_box = shapely.box(*tile_bounds(z, x, y))
+                layers = []
+                for layer_name, tree, layer_geometries, properties in [
+                        ('wijken', wijk_tree, simplified, wijk_properties),
+                        ('gemeenten', gemeente_tree, gemeente_geometries, [props for props, _ in gemeenten])]:
+                    hits = np.sort(tree.query(tile_box, predicate='intersects'))
+                    if len(hits) == 0:
+                        continue
+                    tile_geometries = to_tile_coordinates(layer_geometries[hits], z, x, y)
+                    features = []
+                    for position, tile_geometry in zip(hits, tile_geometries):
+                        commands = _polygon_commands(tile_geometry)
+                        if commands:
+                            features.append((int(position), properties[position], commands))
+                    if features:
+                        layers.append(_message_field(3, encode_layer(layer_name, features)))
+                if layers:
+                    tiles[(z, x, y)] = gzip.compress(b''.join(layers), compresslevel=9, mtime=0)
+                    tile_counts[z] += 1
+
+    lonlat_bounds = wijken_gdf.to_crs(4326).total_bounds
+    metadata = {
+        'name': name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'vector_layers': [
+            {'id': 'wijken', 'minzoom': min_zoom, 'maxzoom': max_zoom,
+             'fields': {**_field_types(wijken_gdf, wijk_attributes),
+                        **{column: 'Number' for column in indicator_table.columns}}},
+            {'id': 'gemeenten', 'minzoom': min_zoom, 'maxzoom': max_zoom,
+             'fields': _field_types(wijken_gdf, gemeente_attributes)},
+        ],
+        'indicators': indicator_info,
+    }
+    size = write_pmtiles(output_path, tiles, metadata, lonlat_bounds, min_zoom, max_zoom)
+    return {'tiles': tile_counts, 'bytes': size}
@@ -2,72 +2,62 @@
 """
 Script to extract Waterwegregio boundary from GeoPackage and save as GeoJSON
 Run this script to update the boundary with accurate geographic data
+Set ATLAS_PROFILE=<path> to write a timing profile (see run_profile.py)
 """
 
-import geopandas as gpd
-import pandas as pd
-import json
 import os
+import sys
+
+# Shared loaders live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geometry_loader import load_wijken, cache_dir_name
+from excel_ingest import load_wijk_data
+from web_boundary import write_web_boundary
+from run_profile import enable_profile, stage, write_profile
 
 # File paths
 GPKG_FILE = "../WijkBuurtkaart_2025_v0.gpkg"
 EXCEL_FILE = "../waterweg_wijken_data.xlsx"
-OUTPUT_FILE = "data/waterwegregio_boundary.geojson"
+OUTPUT_DIR = "data"
+CACHE_DIR = os.path.join("..", cache_dir_name)
 
 def extract_boundary():
     """Extract Waterwegregio boundary from GeoPackage"""
     
-    print("Loading GeoPackage...")
-    gdf = gpd.read_file(GPKG_FILE, layer='wijken_v0')
-    
     print("Loading wijk codes from Excel...")
-    excel_df = pd.read_excel(EXCEL_FILE, header=None)
-    data_rows = excel_df.iloc[4:35].copy()
-    data_rows.columns = excel_df.iloc[0]
-    data_df = data_rows.reset_index(drop=True)
-    data_df['gwb_code_10'] = data_df['gwb_code_10'].astype(str)
+    with stage('excel'):
+        data_df, metadata_df = load_wijk_data(EXCEL_FILE, cache_dir=CACHE_DIR)
     
     # Get wijk codes
     wijken_codes = data_df['gwb_code_10'].dropna().tolist()
     print(f"Found {len(wijken_codes)} wijken codes")
     
-    # Determine the correct column name
-    if 'wk_code' in gdf.columns:
-        wijk_code_column = 'wk_code'
-    elif 'wijkcode' in gdf.columns:
-        wijk_code_column = 'wijkcode'
-    else:
-        raise ValueError("Could not find wijk code column in GeoPackage")
-    
-    gdf[wijk_code_column] = gdf[wijk_code_column].astype(str)
-    
-    # Filter for Waterwegregio wijken
-    waterwegregio_gdf = gdf[gdf[wijk_code_column].isin(wijken_codes)]
+    # Load only the Waterwegregio wijken with their gemeente, converted to WGS84 for web mapping
+    # (raises ValueError when the GeoPackage has no wijk code column)
+    print("Loading GeoPackage...")
+    with stage('gpkg'):
+        waterwegregio_gdf, wijk_code_column = load_wijken(GPKG_FILE, wijken_codes, layer='wijken_v0',
+                                                          columns=['wk_naam', 'gm_code', 'gm_naam'], to_crs=4326,
+                                                          cache_dir=CACHE_DIR)
     print(f"Filtered to {len(waterwegregio_gdf)} wijken")
     
-    # Convert to WGS84 for web mapping
-    waterwegregio_gdf = waterwegregio_gdf.to_crs(epsg=4326)
-    
-    # Create boundary (dissolve all wijken into one polygon)
+    # Create boundary files: simplified per zoom range, quantized, minified and precompressed,
+    # plus the mask, outline and gemeente layers
     print("Creating boundary...")
-    boundary = waterwegregio_gdf.dissolve()
-    
-    # Convert to GeoJSON
-    geojson = json.loads(boundary.to_json())
-    
-    # Save to file
-    print(f"Saving to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(geojson, f, indent=2)
+    with stage('boundary'):
+        write_web_boundary(waterwegregio_gdf, OUTPUT_DIR, cache_dir=CACHE_DIR)
     
     print("✓ Boundary GeoJSON created successfully!")
-    print(f"  Bounds: {boundary.total_bounds}")
+    print(f"  Bounds: {waterwegregio_gdf.total_bounds}")
     
     return True
 
 if __name__ == "__main__":
     try:
-        extract_boundary()
+        enable_profile()
+        with stage('run'):
+            extract_boundary()
+        write_profile()
     except Exception as e:
         print(f"✗ Error: {e}")
         print("\nMake sure you have the required dependencies:")
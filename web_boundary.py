@@ -0,0 +1,365 @@
+"""
+Web outputs of the Waterwegregio boundary for the map site
+
+The boundary extractors load the wijken in WGS84 and call write_web_boundary(),
+which writes, for every zoom range in ZOOM_RANGES:
+
+- <name>_z<min>-<max>.geojson: the dissolved region boundary as minified GeoJSON
+- <name>_z<min>-<max>.topojson: the wijken and the boundary as TopoJSON, with
+  the shared edges stored once as quantized, delta-encoded arcs
+
+The wijken are simplified as a coverage to half a pixel at the highest zoom of
+the range, so neighbouring wijken and the boundary keep identical edges, and
+coordinates are rounded to COORDINATE_DECIMALS decimals (about 0.1 m). <name>.geojson
+is the boundary of the most detailed range, the file the map site loads.
+
+From the same most detailed geometry the static map layers are written, so the
+map site does no geometry work when it starts:
+
+- <layers>_mask.geojson: the world minus the region, to dim everything outside it
+- <layers>_outline.geojson: the dissolved outline of the region as lines
+- <layers>_gemeenten.geojson: the outline of every gemeente as lines, with the
+  gemeente code and name when the wijken have the gm_code and gm_naam columns
+- <layers>_edges.geojson: the edges between wijken as lines, every edge once
+
+The region, gemeenten and edges come from the boundary pyramid of the
+simplified wijken (boundary_pyramid.py), cached next to the geometry cache.
+The boundary, outline, gemeenten and edges files carry the region extent as GeoJSON
+bbox, so the map can fit its view without reading the coordinates.
+<layers>_index.json is the grid index of region_index.py, with which the site
+and the submit-story API find the wijk and gemeente of a story pin.
+
+Every file gets a .gz sidecar and, when the brotli package is installed, a .br
+sidecar, so the web server can send them precompressed.
+"""
+import gzip
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import mapping
+
+from boundary_pyramid import boundary_pyramid
+from geometry_loader import WIJK_CODE_COLUMNS
+from geometry_simplify import simplify_coverage
+from run_profile import stage, add_output
+from region_index import build_region_index
+
+# Zoom ranges with their own level of detail, the last one is the most detailed
+ZOOM_RANGES = [(0, 10), (11, 13), (14, 22)]
+
+# Decimals of the longitude and latitude in the web files, 6 decimals is about 0.1 m
+COORDINATE_DECIMALS = 6
+
+# Tile size of the web map in pixels
+TILE_SIZE = 512
+
+# Outer ring of the inverse mask
+WORLD_BOUNDS = (-180, -90, 180, 90)
+
+# Gemeente columns of the wijken, the first one present groups the gemeenten
+GEMEENTE_COLUMNS = ['gm_code', 'gm_naam']
+
+def zoom_tolerance(zoom, latitude):
+    """Half a pixel at `zoom` in degrees, at the given latitude"""
+    degrees_per_pixel = 360 / (TILE_SIZE * 2 ** zoom)
+    return 0.5 * degrees_per_pixel * math.cos(math.radians(latitude))
+
+def round_coordinates(geometries, decimals=COORDINATE_DECIMALS):
+    """Round all coordinates; identical vertices of neighbouring wijken stay identical"""
+    return shapely.transform(geometries, lambda coords: np.round(coords, decimals))
+
+def minified_json(data):
+    """JSON text without whitespace"""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+def geojson_feature_collection(geometries, properties, bbox=None):
+    """GeoJSON FeatureCollection of shapely geometries with a properties dict each, and an optional bbox"""
+    collection = {'type': 'FeatureCollection'}
+    if bbox is not None:
+        collection['bbox'] = [round(float(value), COORDINATE_DECIMALS) for value in bbox]
+    collection['features'] = [
+        {'type': 'Feature', 'properties': props, 'geometry': mapping(geometry)}
+        for geometry, props in zip(geometries, properties)
+    ]
+    return collection
+
+def _polygon_rings(geometry):
+    """Rings of a Polygon or MultiPolygon as coordinate arrays, grouped per polygon"""
+    polygons = shapely.get_parts(geometry)
+    return [[np.asarray(polygon.exterior.coords)[:, :2]] +
+            [np.asarray(ring.coords)[:, :2] for ring in polygon.interiors]
+            for polygon in polygons]
+
+class _ArcBuilder:
+    """Split rings into arcs at junctions and store every arc once, as in TopoJSON"""
+
+    def __init__(self, rings):
+        # Points where rings meet with different neighbours are junctions
+        neighbours = {}
+        for ring in rings:
+            count = len(ring)
+            for i, point in enumerate(ring):
+                neighbours.setdefault(point, set()).update((ring[i - 1], ring[(i + 1) % count]))
+        self.junctions = {point for point, points in neighbours.items() if len(points) > 2}
+        self.arcs = []
+        self.arc_index = {}
+
+    def _add_arc(self, points):
+        """Index of an arc, negative (~index) when it is stored in the opposite direction"""
+        points = tuple(points)
+        if points in self.arc_index:
+            return self.arc_index[points]
+        if points[::-1] in self.arc_index:
+            return ~self.arc_index[points[::-1]]
+        self.arc_index[points] = len(self.arcs)
+        self.arcs.append(points)
+        return self.arc_index[points]
+
+    def ring_arcs(self, ring):
+        """Arc indices of a ring, given as a list of unique points"""
+        cuts = [i for i, point in enumerate(ring) if point in self.junctions]
+        if not cuts:
+            # A ring without junctions is one arc, starting at its lowest point
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            forward = rotated + [rotated[0]]
+            backward = forward[::-1]
+            if tuple(backward) in self.arc_index:
+                return [~self.arc_index[tuple(backward)]]
+            return [self._add_arc(forward)]
+
+        rotated = ring[cuts[0]:] + ring[:cuts[0]] + [ring[cuts[0]]]
+        cuts = [cut - cuts[0] for cut in cuts] + [len(ring)]
+        return [self._add_arc(rotated[start:end + 1]) for start, end in zip(cuts[:-1], cuts[1:])]
+
+def topojson_topology(objects, decimals=COORDINATE_DECIMALS):
+    """
+    TopoJSON topology of named layers
+
+    `objects` maps a layer name to (geometries, properties) of Polygon and
+    MultiPolygon geometries. Coordinates are quantized to `decimals` decimals
+    and the arcs are delta-encoded.
+    """
+    scale = 10.0 ** -decimals
+    all_geometries = np.concatenate([np.asarray(geometries) for geometries, _ in objects.values()])
+    minx, miny = shapely.total_bounds(all_geometries)[:2]
+    translate = (round(minx, decimals), round(miny, decimals))
+
+    def quantize(coords):
+        points = np.round((coords - translate) / scale).astype(np.int64)
+        # Drop repeated points and the closing point
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+        points = points[keep]
+        if len(points) > 1 and tuple(points[0]) == tuple(points[-1]):
+            points = points[:-1]
+        return [tuple(point) for point in points.tolist()]
+
+    layers = {name: [[[quantize(ring) for ring in polygon] for polygon in _polygon_rings(geometry)]
+                     for geometry in geometries]
+              for name, (geometries, _) in objects.items()}
+    builder = _ArcBuilder([ring for layer in layers.values() for geometry in layer
+                           for polygon in geometry for ring in polygon if len(ring) >= 3])
+
+    topology_objects = {}
+    for name, (geometries, properties) in objects.items():
+        topo_geometries = []
+        for geometry, props in zip(layers[name], properties):
+            polygons = [[builder.ring_arcs(ring) for ring in polygon if len(ring) >= 3] for polygon in geometry]
+            polygons = [polygon for polygon in polygons if polygon]
+            if len(polygons) == 1:
+                topo_geometries.append({'type': 'Polygon', 'arcs': polygons[0], 'properties': props})
+            else:
+                topo_geometries.append({'type': 'MultiPolygon', 'arcs': polygons, 'properties': props})
+        topology_objects[name] = {'type': 'GeometryCollection', 'geometries': topo_geometries}
+
+    arcs = []
+    for arc in builder.arcs:
+        points = np.array(arc, dtype=np.int64)
+        points[1:] = np.diff(points, axis=0)
+        arcs.append(points.tolist())
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale, scale], 'translate': list(translate)},
+        'objects': topology_objects,
+        'arcs': arcs,
+    }
+
+def write_with_sidecars(path, text):
+    """
+    Write a text (or bytes) file with precompressed .gz and .br sidecars
+
+    Returns a dictionary with the byte counts ('raw', 'gz' and 'br', None when
+    brotli is not installed).
+    """
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    # mtime=0 keeps the .gz file identical when the contents did not change
+    gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(f"{path}.gz", 'wb') as f:
+        f.write(gz_data)
+
+    br_size = None
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        br_data = brotli.compress(data, quality=11)
+        with open(f"{path}.br", 'wb') as f:
+            f.write(br_data)
+        br_size = len(br_data)
+
+    add_output(nbytes=len(data) + len(gz_data) + (br_size or 0))
+    return {'raw': len(data), 'gz': len(gz_data), 'br': br_size}
+
+def _format_bytes(size):
+    """Byte count for the size report"""
+    return "-" if size is None else f"{size:,}"
+
+def gemeente_groups(wijken_gdf):
+    """Gemeente key of every wijk (the first of GEMEENTE_COLUMNS it has), or None"""
+    gemeente_columns = [column for column in GEMEENTE_COLUMNS if column in wijken_gdf.columns]
+    return wijken_gdf[gemeente_columns[0]].to_numpy() if gemeente_columns else None
+
+def map_layers(wijken_gdf, pyramid, region_name="Waterwegregio"):
+    """
+    Static map layers of the region as GeoJSON FeatureCollections
+
+    `pyramid` is the boundary pyramid of the wijk geometries as written to the
+    web files, grouped by gemeente_groups(). Returns a dictionary with the
+    'mask', 'outline', 'edges' and, when the wijken have a gemeente column,
+    'gemeenten' layers.
+    """
+    boundary = round_coordinates(pyramid['region'])
+    bbox = shapely.bounds(boundary)
+    region_properties = [{'name': region_name}]
+
+    # The world with the region cut out, enclaves inside the region stay dimmed
+    mask = round_coordinates(shapely.difference(shapely.box(*WORLD_BOUNDS), boundary))
+    layers = {
+        'mask': geojson_feature_collection([mask], region_properties),
+        'outline': geojson_feature_collection([round_coordinates(shapely.boundary(boundary))],
+                                              region_properties, bbox=bbox),
+        'edges': geojson_feature_collection([round_coordinates(pyramid['inner_edges'])], region_properties,
+                                            bbox=bbox),
+    }
+
+    gemeente_columns = [column for column in GEMEENTE_COLUMNS if column in wijken_gdf.columns]
+    if gemeente_columns:
+        # Attributes of the first wijk of every gemeente, by the key of the pyramid
+        first_rows = wijken_gdf.drop_duplicates(gemeente_columns[0]).to_dict('records')
+        gemeente_properties = {str(row[gemeente_columns[0]]): {column: row[column] for column in gemeente_columns
+                                                               if pd.notna(row[column])}
+                               for row in first_rows}
+        outlines = round_coordinates(shapely.boundary(pyramid['gemeenten']))
+        properties = [gemeente_properties[key] for key in pyramid['gemeente_keys']]
+        layers['gemeenten'] = geojson_feature_collection(outlines, properties, bbox=bbox)
+    else:
+        print("No gm_code or gm_naam column in the wijken, the gemeente outlines are not written")
+
+    return layers
+
+def region_index(wijken_gdf, simplified):
+    """Grid index of the wijken with their code, name and gemeente, see region_index.py"""
+    code_column = next((column for column in WIJK_CODE_COLUMNS if column in wijken_gdf.columns), None)
+    records = wijken_gdf.drop(columns=wijken_gdf.geometry.name).to_dict('records')
+
+    def known(value):
+        return None if pd.isna(value) else value
+
+    wijken = [{'code': str(record[code_column]) if code_column else None, 'name': known(record.get('wk_naam'))}
+              for record in records]
+
+    # Gemeenten in order of appearance, grouped like the gemeente outlines
+    gemeente_columns = [column for column in GEMEENTE_COLUMNS if column in wijken_gdf.columns]
+    gemeenten, gemeente_index, wijk_gemeente = [], {}, []
+    for record in records:
+        key = known(record[gemeente_columns[0]]) if gemeente_columns else None
+        if key is not None and key not in gemeente_index:
+            gemeente_index[key] = len(gemeenten)
+            gemeenten.append({'code': known(record.get('gm_code')), 'name': known(record.get('gm_naam'))})
+        wijk_gemeente.append(gemeente_index.get(key))
+
+    return build_region_index(simplified, wijken, gemeenten, wijk_gemeente, decimals=COORDINATE_DECIMALS)
+
+def write_web_boundary(wijken_gdf, output_dir, name="waterwegregio_boundary", layers_name="waterwegregio",
+                       cache_dir=None):
+    """
+    Write the web outputs of the region boundary for every zoom range
+
+    `wijken_gdf` holds the wijken of the region in EPSG:4326; every column
+    besides the geometry is kept as a property of the TopoJSON wijken. The
+    static map layers are written as <layers_name>_<layer>.geojson. The
+    boundary pyramids are cached in `cache_dir` (None = no caching). Prints a
+    size report and returns a list of (file name, byte counts) tuples.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    geometries = wijken_gdf.geometry.to_numpy()
+    latitude = float(np.mean(wijken_gdf.total_bounds[[1, 3]]))
+    wijk_properties = [{key: value for key, value in row.items() if pd.notna(value)}
+                       for row in wijken_gdf.drop(columns=wijken_gdf.geometry.name).to_dict('records')]
+    boundary_properties = [{'name': 'Waterwegregio'}]
+    groups = gemeente_groups(wijken_gdf)
+
+    # Size of the boundary as it was written before, indented with full precision
+    with stage('pyramid'):
+        original_boundary = boundary_pyramid(geometries, groups, cache_dir=cache_dir)['region']
+    original_size = len(json.dumps(geojson_feature_collection([original_boundary], boundary_properties),
+                                   indent=2).encode('utf-8'))
+
+    report = []
+    for min_zoom, max_zoom in ZOOM_RANGES:
+        tolerance = max(zoom_tolerance(max_zoom, latitude), 10.0 ** -COORDINATE_DECIMALS)
+        with stage('simplify', zoom=f"{min_zoom}-{max_zoom}"):
+            simplified = round_coordinates(simplify_coverage(geometries, tolerance))
+        with stage('pyramid', zoom=f"{min_zoom}-{max_zoom}"):
+            pyramid = boundary_pyramid(simplified, groups, cache_dir=cache_dir)
+            boundary = round_coordinates(pyramid['region'])
+
+        suffix = f"_z{min_zoom}-{max_zoom}"
+        with stage('encode', zoom=f"{min_zoom}-{max_zoom}"):
+            geojson_text = minified_json(geojson_feature_collection([boundary], boundary_properties,
+                                                                    bbox=shapely.bounds(boundary)))
+            topojson_text = minified_json(topojson_topology({
+                'wijken': (simplified, wijk_properties),
+                'boundary': ([boundary], boundary_properties),
+            }))
+
+            for file_name, text in [(f"{name}{suffix}.geojson", geojson_text),
+                                    (f"{name}{suffix}.topojson", topojson_text)]:
+                report.append((file_name, write_with_sidecars(os.path.join(output_dir, file_name), text)))
+
+    # The map site loads the most detailed boundary under the original name
+    file_name = f"{name}.geojson"
+    report.append((file_name, write_with_sidecars(os.path.join(output_dir, file_name), geojson_text)))
+
+    # Static map layers from the same, most detailed geometry
+    with stage('map_layers'):
+        for layer, collection in map_layers(wijken_gdf, pyramid).items():
+            file_name = f"{layers_name}_{layer}.geojson"
+            report.append((file_name, write_with_sidecars(os.path.join(output_dir, file_name),
+                                                          minified_json(collection))))
+
+    # Grid index for the story pin checks and the wijk lookup
+    file_name = f"{layers_name}_index.json"
+    with stage('region_index'):
+        report.append((file_name, write_with_sidecars(os.path.join(output_dir, file_name),
+                                                      minified_json(region_index(wijken_gdf, simplified)))))
+
+    print(f"Web boundary files in {output_dir} (bytes; indented full-precision boundary: {original_size:,}):")
+    print(f"  {'file':<44} {'raw':>10} {'gzip':>10} {'brotli':>10}")
+    for file_name, sizes in report:
+        print(f"  {file_name:<44} {_format_bytes(sizes['raw']):>10} {_format_bytes(sizes['gz']):>10} "
+              f"{_format_bytes(sizes['br']):>10}")
+    if report and report[0][1]['br'] is None:
+        print("  (install the brotli package to also write .br files)")
+
+    return report